@@ -0,0 +1,18 @@
+import shutil
+from os import environ
+from pathlib import Path
+
+
+# Set before the workers import prometheus_client, so each of them writes its metrics under this directory.
+environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/todolists-metrics")
+
+
+def on_starting(server):
+    # Files left by a previous run would be added to the new totals.
+    path = Path(environ["PROMETHEUS_MULTIPROC_DIR"])
+    shutil.rmtree(path, ignore_errors=True)
+    path.mkdir(parents=True)
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,146 @@
+import falcon
+import falcon.media
+
+from todolists import db
+from todolists.user_authorization import check_session_token, AuthorizationError
+from todolists.user_dashboard import get_tasks_page
+from todolists.user_tasks import create_task_of_user, delete_task_of_user, update_task_of_user
+from todolists.user_todolists import (create_todolist, delete_todolist, get_todolist_of_user,
+                                      get_todolists_of_user, update_todolist_title_of_user)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+if orjson:
+    json_handler = falcon.media.JSONHandler(dumps=orjson.dumps, loads=orjson.loads)
+else:
+    json_handler = falcon.media.JSONHandler()
+
+
+def authorize(req, resp, resource, params):
+    session_token = req.cookies.get("session-token")
+    if req.auth and req.auth.startswith("Bearer "):
+        session_token = req.auth[len("Bearer "):]
+    try:
+        req.context.user_id = check_session_token(session_token or "")
+    except AuthorizationError as error:
+        raise falcon.HTTPUnauthorized(title="Unauthorized", description=error.message)
+
+def get_text_field(req, name, max_length, required=True):
+    return validate_text_field(req.get_media(default_when_empty={}), name, max_length, required)
+
+def validate_text_field(media, name, max_length, required=True):
+    value = media.get(name) if isinstance(media, dict) else None
+    if value is None and not required:
+        return None
+    if not isinstance(value, str) or not value.strip() or len(value) > max_length:
+        raise falcon.HTTPUnprocessableEntity(
+            title="Invalid field", description=f"'{name}' must be a text of 1-{max_length} characters.")
+    return value
+
+def get_done_field(req):
+    return validate_done_field(req.get_media(default_when_empty={}))
+
+def validate_done_field(media):
+    done = media.get("done") if isinstance(media, dict) else None
+    if done is not None and not isinstance(done, bool):
+        raise falcon.HTTPUnprocessableEntity(title="Invalid field", description="'done' must be true or false.")
+    return done
+
+def todolist_to_dict(record):
+    return {"id": record.list_id, "title": record.title}
+
+def task_to_dict(record):
+    return {"id": record.task_id, "list_id": record.list_id, "task": record.task, "done": record.done}
+
+def not_found(description):
+    return falcon.HTTPNotFound(title="Not found", description=description)
+
+
+@falcon.before(authorize)
+class TodoLists:
+    def on_get(self, req, resp):
+        resp.media = {"lists": [todolist_to_dict(record) for record in get_todolists_of_user(req.context.user_id)]}
+
+    def on_post(self, req, resp):
+        title = get_text_field(req, "title", 50)
+        try:
+            list_id = create_todolist(req.context.user_id, title)
+        except db.psycopg2.errors.UniqueViolation:
+            raise falcon.HTTPConflict(title="Conflict", description="You already have a TodoList with this title.")
+        resp.status = falcon.HTTP_201
+        resp.location = f"/api/v1/lists/{list_id}"
+        resp.media = {"id": list_id, "title": title}
+
+
+@falcon.before(authorize)
+class TodoList:
+    def on_get(self, req, resp, list_id):
+        record = get_todolist_of_user(req.context.user_id, list_id)
+        if not record:
+            raise not_found("This TodoList does not exist.")
+        resp.media = todolist_to_dict(record)
+
+    def on_patch(self, req, resp, list_id):
+        title = get_text_field(req, "title", 50)
+        try:
+            record = update_todolist_title_of_user(req.context.user_id, list_id, title)
+        except db.psycopg2.errors.UniqueViolation:
+            raise falcon.HTTPConflict(title="Conflict", description="You already have a TodoList with this title.")
+        if not record:
+            raise not_found("This TodoList does not exist.")
+        resp.media = todolist_to_dict(record)
+
+    def on_delete(self, req, resp, list_id):
+        if not delete_todolist(req.context.user_id, list_id):
+            raise not_found("This TodoList does not exist.")
+        resp.media = {"id": list_id}
+
+
+@falcon.before(authorize)
+class Tasks:
+    def on_get(self, req, resp, list_id):
+        tasks, next_page = get_tasks_page(req.context.user_id, list_id, req.get_param_as_int("after", default=0))
+        if not tasks and not get_todolist_of_user(req.context.user_id, list_id):
+            raise not_found("This TodoList does not exist.")
+        resp.media = {
+            "tasks": [{"id": task_id, "list_id": list_id, "task": task["task"], "done": task["done"]}
+                      for task_id, task in tasks.items()],
+            "next_page": next_page
+        }
+
+    def on_post(self, req, resp, list_id):
+        record = create_task_of_user(req.context.user_id, list_id, get_text_field(req, "task", 500))
+        if not record:
+            raise not_found("This TodoList does not exist.")
+        resp.status = falcon.HTTP_201
+        resp.location = f"/api/v1/lists/{list_id}/tasks/{record.task_id}"
+        resp.media = task_to_dict(record)
+
+
+@falcon.before(authorize)
+class Task:
+    def on_patch(self, req, resp, list_id, task_id):
+        task, done = get_text_field(req, "task", 500, required=False), get_done_field(req)
+        record = update_task_of_user(req.context.user_id, list_id, task_id, task, done)
+        if not record:
+            raise not_found("This task does not exist.")
+        resp.media = task_to_dict(record)
+
+    def on_delete(self, req, resp, list_id, task_id):
+        record = delete_task_of_user(req.context.user_id, list_id, task_id)
+        if not record:
+            raise not_found("This task does not exist.")
+        resp.media = task_to_dict(record)
+
+
+def add_routes(app):
+    app.req_options.media_handlers[falcon.MEDIA_JSON] = json_handler
+    app.resp_options.media_handlers[falcon.MEDIA_JSON] = json_handler
+    app.add_route("/api/v1/lists", TodoLists())
+    app.add_route("/api/v1/lists/{list_id:int}", TodoList())
+    app.add_route("/api/v1/lists/{list_id:int}/tasks", Tasks())
+    app.add_route("/api/v1/lists/{list_id:int}/tasks/{task_id:int}", Task())
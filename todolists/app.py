@@ -1,44 +1,110 @@
+import json
+from hashlib import sha1
+from os import environ
 from pathlib import Path
 
 import falcon
-from jinja2 import Environment, FileSystemLoader
+import falcon.asgi
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 
-from todolists import db, user_registration, email_verification, user_authentication, user_dashboard, user_todolists, user_tasks
+from todolists import api, asgi, compression, db, instrumentation, metrics, rate_limiting, static_assets, user_registration, email_verification, user_authentication, user_dashboard, user_todolists, user_tasks
 
 
 templates_env = Environment(
                 loader=FileSystemLoader('todolists/templates'),
                 autoescape=True,
                 trim_blocks=True,
-                lstrip_blocks=True)
+                lstrip_blocks=True,
+                auto_reload=False,
+                bytecode_cache=FileSystemBytecodeCache(environ.get("todolists_templates_cache_dir")))
+templates_env.globals["asset_url"] = static_assets.asset_url
+templates_env.template_class = instrumentation.InstrumentedTemplate
+templates = {}
+templates_digest = None
+
+
+def load_templates():
+    global templates_digest
+    digest = sha1()
+    for name in templates_env.list_templates(extensions=["html"]):
+        templates[name] = templates_env.get_template(name)
+        digest.update(templates_env.loader.get_source(templates_env, name)[0].encode())
+    digest.update(json.dumps(static_assets.manifest, sort_keys=True).encode())
+    # Goes into ETags so a deploy with changed templates or assets invalidates cached pages.
+    templates_digest = digest.hexdigest()[:10]
 
 
 class Index:
+    def __init__(self):
+        self.index = templates["index.html"]
+
     def on_get(self, req, resp):
         resp.content_type = "text/html"
-        template = templates_env.get_template("index.html")
-        resp.text = template.render()
+        resp.text = self.index.render()
 
 
 def create():
-    app = falcon.App()
+    static_assets.load_manifest()
+    load_templates()
+    app = falcon.App(middleware=[metrics.MetricsMiddleware(), instrumentation.InstrumentationMiddleware(),
+                                   rate_limiting.RateLimitMiddleware(), compression.CompressionMiddleware()])
     app.req_options.auto_parse_form_urlencoded = True
     app.resp_options.secure_cookies_by_default = False
     app.add_static_route("/public", str(Path.cwd()/"todolists/public"))
+    app.add_route("/static/{name}", static_assets.StaticAssets())
     app.add_route("/", Index())
+    app.add_route("/metrics", metrics.Metrics())
     app.add_route("/register", user_registration.UserRegistration())
     app.add_route("/email_verification", email_verification.EmailVerification())
     app.add_route("/email_reverification", email_verification.EmailReverification())
     app.add_route("/login", user_authentication.UserAuthentication())
     app.add_route("/logout", user_authentication.UserLogout())
+    app.add_route("/logout-everywhere", user_authentication.UserLogoutEverywhere())
     app.add_route("/dashboard", user_dashboard.UserDashboard())
     app.add_route("/create-todolist", user_todolists.CreateTodolist())
     app.add_route("/get-todolist", user_todolists.ReadTodoList())
     app.add_route("/update-todolist", user_todolists.UpdateTodoList())
     app.add_route("/delete-todolist", user_todolists.DeleteTodoList())
     app.add_route("/create-task", user_tasks.CreateTask())
+    app.add_route("/get-tasks", user_tasks.ReadTasks())
     app.add_route("/update-task", user_tasks.UpdateTask())
     app.add_route("/delete-task", user_tasks.DeleteTask())
+    app.add_route("/create-tasks", user_tasks.CreateTasks())
+    app.add_route("/update-tasks", user_tasks.UpdateTasks())
+    app.add_route("/delete-tasks", user_tasks.DeleteTasks())
+    api.add_routes(app)
+    return app
+
+def create_asgi():
+    static_assets.load_manifest()
+    load_templates()
+    app = falcon.asgi.App(middleware=[asgi.Lifespan(), metrics.MetricsMiddleware(),
+                                         instrumentation.InstrumentationMiddleware(), asgi.FormParser(),
+                                         asgi.RateLimit(), compression.CompressionMiddleware()])
+    app.resp_options.secure_cookies_by_default = False
+    app.add_static_route("/public", str(Path.cwd()/"todolists/public"))
+    app.add_route("/static/{name}", asgi.StaticAssets())
+    app.add_route("/", asgi.Threaded(Index()))
+    app.add_route("/metrics", asgi.Threaded(metrics.Metrics()))
+    app.add_route("/register", asgi.Threaded(user_registration.UserRegistration()))
+    app.add_route("/email_verification", asgi.Threaded(email_verification.EmailVerification()))
+    app.add_route("/email_reverification", asgi.Threaded(email_verification.EmailReverification()))
+    app.add_route("/login", asgi.Threaded(user_authentication.UserAuthentication()))
+    app.add_route("/logout", asgi.Threaded(user_authentication.UserLogout()))
+    app.add_route("/logout-everywhere", asgi.Threaded(user_authentication.UserLogoutEverywhere()))
+    app.add_route("/dashboard", asgi.UserDashboard())
+    app.add_route("/create-todolist", asgi.CreateTodolist())
+    app.add_route("/get-todolist", asgi.ReadTodoList())
+    app.add_route("/update-todolist", asgi.UpdateTodoList())
+    app.add_route("/delete-todolist", asgi.DeleteTodoList())
+    app.add_route("/create-task", asgi.CreateTask())
+    app.add_route("/get-tasks", asgi.ReadTasks())
+    app.add_route("/update-task", asgi.UpdateTask())
+    app.add_route("/delete-task", asgi.DeleteTask())
+    app.add_route("/create-tasks", asgi.CreateTasks())
+    app.add_route("/update-tasks", asgi.UpdateTasks())
+    app.add_route("/delete-tasks", asgi.DeleteTasks())
+    asgi.add_api_routes(app)
     return app
 
 app = create()
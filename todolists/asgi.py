@@ -0,0 +1,563 @@
+import re
+from contextvars import copy_context
+from functools import lru_cache
+
+import asyncpg
+import falcon
+import redis
+from falcon.util import sync_to_async
+
+from todolists import (api, app, db, http_caching, instrumentation, rate_limiting, redis_conn, static_assets,
+                       user_authorization, user_dashboard, user_profiles, user_tasks, user_todolists)
+from todolists.user_authorization import AuthorizationError, is_64_chars_hex, refresh_session_token
+from todolists.user_tasks import BulkTasksError, get_new_tasks, get_task_ids
+
+
+pool = None
+session_conn = None
+cache_conn = None
+token_bucket = None
+set_profile_if_generation = None
+
+
+class Record(asyncpg.Record):
+    # Attribute access like psycopg2's NamedTupleCursor, so records fit the helpers shared with the WSGI app.
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+@lru_cache(maxsize=None)
+def positional(query):
+    # asyncpg takes $1, $2, ... where psycopg2 takes %(name)s, so both apps share one query text.
+    names = []
+    def number(match):
+        if match.group(1) not in names:
+            names.append(match.group(1))
+        return f"${names.index(match.group(1)) + 1}"
+    return re.sub(r"%\((\w+)\)s", number, query), tuple(names)
+
+def bind(query, params):
+    query, names = positional(query)
+    return (query, *(params[name] for name in names))
+
+def rowcount(status):
+    return int(status.split()[-1])
+
+def run_threaded(function, *args, **kwargs):
+    # Executor threads start from an empty context, copy the request's so instrumentation sees their work.
+    return sync_to_async(copy_context().run, function, *args, **kwargs)
+
+
+class Lifespan:
+    async def process_startup(self, scope, event):
+        global pool, session_conn, cache_conn, token_bucket, set_profile_if_generation
+        connect_kwargs = db.conn.connect_kwargs
+        pool = await asyncpg.create_pool(database=connect_kwargs["dbname"], user=connect_kwargs["user"],
+                                         password=connect_kwargs["password"], host=connect_kwargs["host"],
+                                         min_size=db.conn.minconn, max_size=db.conn.maxconn,
+                                         timeout=db.conn.timeout, record_class=Record,
+                                         init=instrumentation.instrument_asyncpg)
+        session_conn = redis_conn.create_async_client(redis_conn.session_db)
+        cache_conn = redis_conn.create_async_client(redis_conn.cache_db)
+        token_bucket = cache_conn.register_script(rate_limiting.TOKEN_BUCKET_SCRIPT)
+        set_profile_if_generation = cache_conn.register_script(user_profiles.SET_IF_GENERATION_SCRIPT)
+
+    async def process_shutdown(self, scope, event):
+        await pool.close()
+        await session_conn.aclose()
+        await cache_conn.aclose()
+
+
+class FormParser:
+    # The WSGI app parses forms into req params on its own, the ASGI one only parses them when awaited.
+    async def process_request(self, req, resp):
+        if req.content_type and req.content_type.startswith(falcon.MEDIA_URLENCODED):
+            req.params.update(await req.get_media())
+
+
+class RateLimit:
+    async def process_resource(self, req, resp, resource, params):
+        retry_after = await check_rate_limit(req)
+        if retry_after:
+            rate_limiting.reject(resp, retry_after)
+
+
+class Threaded:
+    # Resources that are bound by bcrypt and SMTP keep their sync code and run on the default executor.
+    def __init__(self, resource):
+        for name in dir(resource):
+            if name.startswith("on_"):
+                setattr(self, name, self.wrap(getattr(resource, name)))
+
+    def wrap(self, responder):
+        async def wrapper(*args, **kwargs):
+            return await run_threaded(responder, *args, **kwargs)
+        return wrapper
+
+
+async def check_session_token(session_token):
+    is_64_chars_hex(session_token)
+    if user_authorization.use_logout_pubsub:
+        user_authorization.start_logout_listener()
+    user_id = user_authorization.session_cache.get(session_token)
+    if user_id:
+        return user_id
+    async with session_conn.pipeline(transaction=False) as pipe:
+        user_id, ttl = await pipe.get(session_token).ttl(session_token).execute()
+    if not user_id:
+        raise AuthorizationError("Wrong/expired token.")
+    user_id = user_id.decode()
+    # Refreshes happen at most once per half idle TTL, they reuse the sync code off the loop.
+    if (ttl < user_authorization.session_refresh_below
+            and not await run_threaded(refresh_session_token, session_token, user_id)):
+        raise AuthorizationError("Wrong/expired token.")
+    user_authorization.session_cache.set(session_token, user_id)
+    return user_id
+
+async def check_rate_limit(req):
+    keys, args = rate_limiting.get_buckets(req)
+    if not keys:
+        return 0
+    try:
+        return int(await token_bucket(keys=keys, args=args))
+    except redis.RedisError:
+        return 0
+
+async def get_user_version(user_id):
+    async with cache_conn.pipeline() as pipe:
+        http_caching.queue_get_user_version(pipe, user_id)
+        return http_caching.read_user_version(await pipe.execute())
+
+async def bump_user_version(user_id):
+    async with cache_conn.pipeline() as pipe:
+        http_caching.queue_bump_user_version(pipe, user_id)
+        await pipe.execute()
+
+async def is_not_modified(req, resp, user_id, *parts):
+    version, modified = await get_user_version(user_id)
+    return http_caching.check_conditional_request(req, resp, version, modified, *parts), (version, modified)
+
+async def render_dashboard(user_id, selected_todolist=None, user_version=None):
+    version, modified = user_version or await get_user_version(user_id)
+    tag = http_caching.get_etag(version, modified, app.templates_digest)
+    key = user_dashboard.DASHBOARD_CACHE_KEY.format(user_id, selected_todolist)
+    html = await get_cached_dashboard(key, tag)
+    if html is None:
+        user_data = await get_cached_todolists_user_data(user_id, version, selected_todolist)
+        html = app.templates["dashboard.html"].render(user=user_data)
+        await set_cached_dashboard(key, tag, html)
+    return html
+
+async def get_cached_dashboard(key, tag):
+    if user_dashboard.dashboard_cache_backend != "redis":
+        return user_dashboard.get_cached_dashboard(key, tag)
+    return user_dashboard.read_cached_dashboard(tag, *await cache_conn.hmget(key, "tag", "html"))
+
+async def set_cached_dashboard(key, tag, html):
+    if user_dashboard.dashboard_cache_backend != "redis":
+        return user_dashboard.set_cached_dashboard(key, tag, html)
+    async with cache_conn.pipeline() as pipe:
+        user_dashboard.queue_set_cached_dashboard(pipe, key, tag, html)
+        await pipe.execute()
+
+async def get_dashboard_records(user_id, selected_todolist=None):
+    return await pool.fetch(*bind(user_dashboard.DASHBOARD_QUERY,
+                                  user_dashboard.get_dashboard_params(user_id, selected_todolist)))
+
+async def get_todolists_user_data(user_id, selected_todolist=None):
+    records = await get_dashboard_records(user_id, selected_todolist)
+    return user_dashboard.build_todolists_user_data(records, selected_todolist)
+
+async def get_cached_todolists_user_data(user_id, version, selected_todolist=None):
+    profile, generation = await get_cached_profile(user_id, version)
+    if profile is None:
+        records = await get_dashboard_records(user_id, selected_todolist)
+        await set_cached_profile(user_id, version, generation, user_dashboard.build_profile(records))
+        return user_dashboard.build_todolists_user_data(records, selected_todolist)
+    todolists_user_data = user_dashboard.build_profile_user_data(profile, selected_todolist)
+    selected_todolist = todolists_user_data["selected_todolist"]
+    if selected_todolist in todolists_user_data["todolists"]:
+        user_dashboard.add_tasks_page(todolists_user_data, *await get_tasks_page(user_id, selected_todolist))
+    return todolists_user_data
+
+async def get_cached_profile(user_id, version):
+    profile = user_profiles.get_local_profile(user_id, version)
+    if profile is not None:
+        return profile, None
+    generation, profile = await cache_conn.hmget(user_profiles.PROFILE_KEY.format(user_id), "generation", "profile")
+    return user_profiles.read_profile(user_id, version, generation, profile)
+
+async def set_cached_profile(user_id, version, generation, profile):
+    await set_profile_if_generation(keys=[user_profiles.PROFILE_KEY.format(user_id)],
+                                    args=user_profiles.get_set_profile_args(generation, profile))
+    user_profiles.set_local_profile(user_id, version, profile)
+
+async def todolists_changed(user_id):
+    async with cache_conn.pipeline() as pipe:
+        user_todolists.queue_todolists_changed(pipe, user_id)
+        await pipe.execute()
+    user_profiles.forget_local_profile(user_id)
+
+async def get_tasks_page(user_id, list_id, after=0):
+    records = await pool.fetch(*bind(user_dashboard.TASKS_PAGE_QUERY,
+                                     user_dashboard.get_tasks_page_params(user_id, list_id, after)))
+    return user_dashboard.build_tasks_page(records)
+
+async def create_todolist(user_id, title):
+    list_id = await pool.fetchval(*bind(user_todolists.CREATE_TODOLIST_QUERY, {"title": title, "user_id": user_id}))
+    await todolists_changed(user_id)
+    return list_id
+
+async def get_todolists_of_user(user_id):
+    return await pool.fetch(*bind(user_todolists.TODOLISTS_OF_USER_QUERY, {"user_id": user_id}))
+
+async def get_todolist_of_user(user_id, list_id):
+    return await pool.fetchrow(*bind(user_todolists.TODOLIST_OF_USER_QUERY, {"list_id": list_id, "user_id": user_id}))
+
+async def update_todolist_title_of_user(user_id, list_id, new_title):
+    record = await pool.fetchrow(*bind(user_todolists.UPDATE_TODOLIST_TITLE_OF_USER_QUERY,
+                                       {"title": new_title, "list_id": list_id, "user_id": user_id}))
+    if record:
+        await todolists_changed(user_id)
+    return record
+
+async def update_todolist_title(list_id, new_title):
+    user_id = await pool.fetchval(*bind(user_todolists.UPDATE_TODOLIST_TITLE_QUERY,
+                                        {"title": new_title, "list_id": list_id}))
+    if user_id:
+        await todolists_changed(user_id)
+
+async def delete_todolist(user_id, list_id):
+    params = user_todolists.get_delete_todolist_params(user_id, list_id)
+    while True:
+        deleted_list = 0
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                deleted_tasks = rowcount(await conn.execute(*bind(user_todolists.DELETE_TODOLIST_TASKS_QUERY, params)))
+                if deleted_tasks < params["batch_size"]:
+                    deleted_list = rowcount(await conn.execute(*bind(user_todolists.DELETE_TODOLIST_QUERY, params)))
+        if deleted_list:
+            await todolists_changed(user_id)
+            return True
+        if not deleted_tasks:
+            return False
+        await bump_user_version(user_id)
+
+async def create_task_in_todolist(list_id, task):
+    record = await pool.fetchrow(*bind(user_tasks.CREATE_TASK_IN_TODOLIST_QUERY, {"list_id": list_id, "task": task}))
+    await bump_user_version(record.user_id)
+    return record.task_id
+
+async def create_task_of_user(user_id, list_id, task):
+    record = await pool.fetchrow(*bind(user_tasks.CREATE_TASK_OF_USER_QUERY,
+                                       {"task": task, "list_id": list_id, "user_id": user_id}))
+    if record:
+        await bump_user_version(user_id)
+    return record
+
+async def update_task_of_user(user_id, list_id, task_id, task=None, done=None):
+    record = await pool.fetchrow(*bind(user_tasks.UPDATE_TASK_OF_USER_QUERY,
+                                       {"task": task, "done": done, "task_id": task_id, "list_id": list_id,
+                                        "user_id": user_id}))
+    if record:
+        await bump_user_version(user_id)
+    return record
+
+async def delete_task_of_user(user_id, list_id, task_id):
+    record = await pool.fetchrow(*bind(user_tasks.DELETE_TASK_OF_USER_QUERY,
+                                       {"task_id": task_id, "list_id": list_id, "user_id": user_id}))
+    if record:
+        await bump_user_version(user_id)
+    return record
+
+async def create_tasks_of_user(user_id, list_id, tasks):
+    records = await pool.fetch(*bind(user_tasks.CREATE_TASKS_OF_USER_QUERY,
+                                     {"tasks": tasks, "list_id": list_id, "user_id": user_id}))
+    if records:
+        await bump_user_version(user_id)
+    return [record.task_id for record in records]
+
+async def mark_tasks_of_user(user_id, list_id, task_ids, done):
+    updated = rowcount(await pool.execute(*bind(user_tasks.MARK_TASKS_OF_USER_QUERY,
+                                                {"done": done, "task_ids": task_ids, "list_id": list_id,
+                                                 "user_id": user_id})))
+    if updated:
+        await bump_user_version(user_id)
+    return updated
+
+async def delete_tasks_of_user(user_id, list_id, task_ids):
+    deleted = rowcount(await pool.execute(*bind(user_tasks.DELETE_TASKS_OF_USER_QUERY,
+                                                {"task_ids": task_ids, "list_id": list_id, "user_id": user_id})))
+    if deleted:
+        await bump_user_version(user_id)
+    return deleted
+
+async def delete_task(task_id):
+    user_id = await pool.fetchval(*bind(user_tasks.DELETE_TASK_QUERY, {"task_id": task_id}))
+    if user_id:
+        await bump_user_version(user_id)
+
+async def mark_task(task_id, done):
+    user_id = await pool.fetchval(*bind(user_tasks.MARK_TASK_QUERY, {"done": bool(done), "task_id": task_id}))
+    if user_id:
+        await bump_user_version(user_id)
+
+
+class DashboardResource:
+    def __init__(self):
+        self.error = app.templates["error.html"]
+
+    async def authorize(self, req, resp):
+        resp.content_type = "text/html"
+        try:
+            return int(await check_session_token(req.cookies["session-token"]))
+        except AuthorizationError as error:
+            resp.status = falcon.HTTP_401
+            resp.text = self.error.render(error=error)
+        except:
+            resp.status = falcon.HTTP_500
+            resp.text = self.error.render(error="Contact the website owner.")
+
+
+class UserDashboard:
+    def __init__(self):
+        self.login = app.templates["login.html"]
+
+    async def on_get(self, req, resp):
+        resp.content_type = "text/html"
+        try:
+            user_id = int(await check_session_token(req.cookies["session-token"]))
+            not_modified, user_version = await is_not_modified(req, resp, user_id, app.templates_digest)
+            if not_modified:
+                return
+            resp.text = await render_dashboard(user_id, user_version=user_version)
+        except AuthorizationError:
+            resp.status = falcon.HTTP_401
+            resp.text = self.login.render()
+
+
+class CreateTodolist(DashboardResource):
+    async def on_post(self, req, resp):
+        user_id = await self.authorize(req, resp)
+        if user_id is not None:
+            list_id = await create_todolist(user_id, req.get_param("create-todolist"))
+            resp.text = await render_dashboard(user_id, list_id)
+
+
+class ReadTodoList(DashboardResource):
+    async def on_get(self, req, resp):
+        user_id = await self.authorize(req, resp)
+        if user_id is not None:
+            selected_todolist = req.get_param_as_int("get-todolist", required=True)
+            not_modified, user_version = await is_not_modified(req, resp, user_id, app.templates_digest,
+                                                               selected_todolist)
+            if not_modified:
+                return
+            resp.text = await render_dashboard(user_id, selected_todolist, user_version)
+
+    async def on_post(self, req, resp):
+        user_id = await self.authorize(req, resp)
+        if user_id is not None:
+            resp.text = await render_dashboard(user_id, int(req.get_param("get-todolist")))
+
+
+class UpdateTodoList(DashboardResource):
+    async def on_post(self, req, resp):
+        user_id = await self.authorize(req, resp)
+        if user_id is not None:
+            selected_todolist = int(req.get_param("update-todolist"))
+            await update_todolist_title(selected_todolist, req.get_param("change-todolist-title"))
+            resp.text = await render_dashboard(user_id, selected_todolist)
+
+
+class DeleteTodoList(DashboardResource):
+    async def on_post(self, req, resp):
+        user_id = await self.authorize(req, resp)
+        if user_id is not None:
+            if await delete_todolist(user_id, int(req.get_param("delete-todolist"))):
+                resp.text = await render_dashboard(user_id)
+            else:
+                resp.status = falcon.HTTP_404
+                resp.text = self.error.render(error="This TodoList does not exist.")
+
+
+class CreateTask(DashboardResource):
+    async def on_post(self, req, resp):
+        user_id = await self.authorize(req, resp)
+        if user_id is not None:
+            selected_todolist = int(req.get_param("selected-todolist"))
+            await create_task_in_todolist(selected_todolist, req.get_param("create-task"))
+            resp.text = await render_dashboard(user_id, selected_todolist)
+
+
+class ReadTasks(DashboardResource):
+    def __init__(self):
+        super().__init__()
+        self.tasks = app.templates["tasks.html"]
+
+    async def on_get(self, req, resp):
+        user_id = await self.authorize(req, resp)
+        if user_id is not None:
+            selected_todolist = req.get_param_as_int("selected-todolist", required=True)
+            tasks, next_page = await get_tasks_page(user_id, selected_todolist,
+                                                    req.get_param_as_int("after", default=0))
+            resp.text = self.tasks.render(tasks=tasks, next_page=next_page, selected_todolist_id=selected_todolist)
+
+
+class UpdateTask:
+    async def on_post(self, req, resp):
+        resp.content_type = "text/html"
+        user_id = int(await check_session_token(req.cookies["session-token"]))
+        selected_todolist = int(req.get_param("selected-todolist"))
+        await mark_task(int(req.get_param("update-task")), req.get_param("mark-task") != "false")
+        resp.text = await render_dashboard(user_id, selected_todolist)
+
+
+class DeleteTask:
+    async def on_post(self, req, resp):
+        resp.content_type = "text/html"
+        user_id = int(await check_session_token(req.cookies["session-token"]))
+        selected_todolist = int(req.get_param("selected-todolist"))
+        await delete_task(int(req.get_param("delete-task")))
+        resp.text = await render_dashboard(user_id, selected_todolist)
+
+
+class BulkTasks(DashboardResource):
+    async def on_post(self, req, resp):
+        user_id = await self.authorize(req, resp)
+        if user_id is not None:
+            selected_todolist = int(req.get_param("selected-todolist"))
+            try:
+                await self.apply(req, user_id, selected_todolist)
+            except BulkTasksError as error:
+                resp.status = falcon.HTTP_400
+                resp.text = self.error.render(error=error.message)
+            else:
+                resp.text = await render_dashboard(user_id, selected_todolist)
+
+
+class CreateTasks(BulkTasks):
+    async def apply(self, req, user_id, selected_todolist):
+        await create_tasks_of_user(user_id, selected_todolist, get_new_tasks(req))
+
+
+class UpdateTasks(BulkTasks):
+    async def apply(self, req, user_id, selected_todolist):
+        await mark_tasks_of_user(user_id, selected_todolist, get_task_ids(req), req.get_param("mark-task") != "false")
+
+
+class DeleteTasks(BulkTasks):
+    async def apply(self, req, user_id, selected_todolist):
+        await delete_tasks_of_user(user_id, selected_todolist, get_task_ids(req))
+
+
+class StaticAssets(static_assets.StaticAssets):
+    async def on_get(self, req, resp, name):
+        path = self.prepare(req, resp, name)
+        if path is not None:
+            resp.data = await sync_to_async(path.read_bytes)
+
+
+async def authorize(req, resp, resource, params):
+    session_token = req.cookies.get("session-token")
+    if req.auth and req.auth.startswith("Bearer "):
+        session_token = req.auth[len("Bearer "):]
+    try:
+        req.context.user_id = int(await check_session_token(session_token or ""))
+    except AuthorizationError as error:
+        raise falcon.HTTPUnauthorized(title="Unauthorized", description=error.message)
+
+async def get_media(req):
+    return await req.get_media(default_when_empty={})
+
+
+@falcon.before(authorize)
+class ApiTodoLists:
+    async def on_get(self, req, resp):
+        records = await get_todolists_of_user(req.context.user_id)
+        resp.media = {"lists": [api.todolist_to_dict(record) for record in records]}
+
+    async def on_post(self, req, resp):
+        title = api.validate_text_field(await get_media(req), "title", 50)
+        try:
+            list_id = await create_todolist(req.context.user_id, title)
+        except asyncpg.UniqueViolationError:
+            raise falcon.HTTPConflict(title="Conflict", description="You already have a TodoList with this title.")
+        resp.status = falcon.HTTP_201
+        resp.location = f"/api/v1/lists/{list_id}"
+        resp.media = {"id": list_id, "title": title}
+
+
+@falcon.before(authorize)
+class ApiTodoList:
+    async def on_get(self, req, resp, list_id):
+        record = await get_todolist_of_user(req.context.user_id, list_id)
+        if not record:
+            raise api.not_found("This TodoList does not exist.")
+        resp.media = api.todolist_to_dict(record)
+
+    async def on_patch(self, req, resp, list_id):
+        title = api.validate_text_field(await get_media(req), "title", 50)
+        try:
+            record = await update_todolist_title_of_user(req.context.user_id, list_id, title)
+        except asyncpg.UniqueViolationError:
+            raise falcon.HTTPConflict(title="Conflict", description="You already have a TodoList with this title.")
+        if not record:
+            raise api.not_found("This TodoList does not exist.")
+        resp.media = api.todolist_to_dict(record)
+
+    async def on_delete(self, req, resp, list_id):
+        if not await delete_todolist(req.context.user_id, list_id):
+            raise api.not_found("This TodoList does not exist.")
+        resp.media = {"id": list_id}
+
+
+@falcon.before(authorize)
+class ApiTasks:
+    async def on_get(self, req, resp, list_id):
+        tasks, next_page = await get_tasks_page(req.context.user_id, list_id, req.get_param_as_int("after", default=0))
+        if not tasks and not await get_todolist_of_user(req.context.user_id, list_id):
+            raise api.not_found("This TodoList does not exist.")
+        resp.media = {
+            "tasks": [{"id": task_id, "list_id": list_id, "task": task["task"], "done": task["done"]}
+                      for task_id, task in tasks.items()],
+            "next_page": next_page
+        }
+
+    async def on_post(self, req, resp, list_id):
+        task = api.validate_text_field(await get_media(req), "task", 500)
+        record = await create_task_of_user(req.context.user_id, list_id, task)
+        if not record:
+            raise api.not_found("This TodoList does not exist.")
+        resp.status = falcon.HTTP_201
+        resp.location = f"/api/v1/lists/{list_id}/tasks/{record.task_id}"
+        resp.media = api.task_to_dict(record)
+
+
+@falcon.before(authorize)
+class ApiTask:
+    async def on_patch(self, req, resp, list_id, task_id):
+        media = await get_media(req)
+        task, done = api.validate_text_field(media, "task", 500, required=False), api.validate_done_field(media)
+        record = await update_task_of_user(req.context.user_id, list_id, task_id, task, done)
+        if not record:
+            raise api.not_found("This task does not exist.")
+        resp.media = api.task_to_dict(record)
+
+    async def on_delete(self, req, resp, list_id, task_id):
+        record = await delete_task_of_user(req.context.user_id, list_id, task_id)
+        if not record:
+            raise api.not_found("This task does not exist.")
+        resp.media = api.task_to_dict(record)
+
+
+def add_api_routes(app):
+    app.req_options.media_handlers[falcon.MEDIA_JSON] = api.json_handler
+    app.resp_options.media_handlers[falcon.MEDIA_JSON] = api.json_handler
+    app.add_route("/api/v1/lists", ApiTodoLists())
+    app.add_route("/api/v1/lists/{list_id:int}", ApiTodoList())
+    app.add_route("/api/v1/lists/{list_id:int}/tasks", ApiTasks())
+    app.add_route("/api/v1/lists/{list_id:int}/tasks/{task_id:int}", ApiTask())
@@ -0,0 +1,151 @@
+import zlib
+from os import environ
+
+from todolists.static_assets import get_accepted_encodings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+min_size = int(environ.get("todolists_compression_min_size", 1024))
+level = int(environ.get("todolists_compression_level", 6))
+brotli_quality = int(environ.get("todolists_compression_brotli_quality", 4))
+stream_size = int(environ.get("todolists_compression_stream_size", 256 * 1024))
+chunk_size = int(environ.get("todolists_compression_chunk_size", 64 * 1024))
+content_types = set(environ.get("todolists_compression_types",
+                                "text/html,text/css,text/plain,application/json,application/javascript,image/svg+xml"
+                                ).split(","))
+
+
+def new_compressor(encoding):
+    if encoding == "br":
+        return brotli.Compressor(quality=brotli_quality)
+    # wbits 16 + MAX_WBITS writes a gzip header and trailer instead of a zlib one.
+    return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+def compress(encoding, data):
+    return b"".join(compress_chunks(encoding, [data]))
+
+def compress_chunks(encoding, chunks):
+    compressor = new_compressor(encoding)
+    if encoding == "br":
+        process, finish = compressor.process, compressor.finish
+    else:
+        process, finish = compressor.compress, compressor.flush
+    for chunk in chunks:
+        compressed = process(chunk)
+        if compressed:
+            yield compressed
+    yield finish()
+
+async def compress_chunks_async(encoding, chunks):
+    compressor = new_compressor(encoding)
+    if encoding == "br":
+        process, finish = compressor.process, compressor.finish
+    else:
+        process, finish = compressor.compress, compressor.flush
+    async for chunk in chunks:
+        compressed = process(chunk)
+        if compressed:
+            yield compressed
+    yield finish()
+
+def read_chunks(stream):
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        if hasattr(stream, "close"):
+            stream.close()
+
+async def read_chunks_async(stream):
+    if not hasattr(stream, "read"):
+        async for chunk in stream:
+            yield chunk
+        return
+    try:
+        while True:
+            chunk = await stream.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        if hasattr(stream, "close"):
+            await stream.close()
+
+async def iterate_async(chunks):
+    for chunk in chunks:
+        yield chunk
+
+def slice_chunks(data):
+    view = memoryview(data)
+    for start in range(0, len(view), chunk_size):
+        yield view[start:start + chunk_size]
+
+def choose_encoding(req):
+    accepted = get_accepted_encodings(req)
+    if brotli and ("br" in accepted or "*" in accepted):
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+class CompressionMiddleware:
+    def process_response(self, req, resp, resource, req_succeeded):
+        encoding = self.choose_encoding(req, resp)
+        if encoding is None:
+            return
+        data = None if resp.stream is not None else resp.render_body()
+        if not self.start(resp, encoding, data):
+            return
+        if resp.stream is not None:
+            resp.stream = compress_chunks(encoding, read_chunks(resp.stream))
+        elif len(data) >= stream_size:
+            # Compress large pages while they are sent instead of holding a second full copy.
+            resp.text = resp.data = resp.media = None
+            resp.stream = compress_chunks(encoding, slice_chunks(data))
+        else:
+            resp.text = None
+            resp.data = compress(encoding, data)
+
+    async def process_response_async(self, req, resp, resource, req_succeeded):
+        encoding = self.choose_encoding(req, resp)
+        if encoding is None:
+            return
+        data = None if resp.stream is not None else await resp.render_body()
+        if not self.start(resp, encoding, data):
+            return
+        if resp.stream is not None:
+            resp.stream = compress_chunks_async(encoding, read_chunks_async(resp.stream))
+        elif len(data) >= stream_size:
+            resp.text = resp.data = resp.media = None
+            resp.stream = compress_chunks_async(encoding, iterate_async(slice_chunks(data)))
+        else:
+            resp.text = None
+            resp.data = compress(encoding, data)
+
+    def choose_encoding(self, req, resp):
+        if req.method == "HEAD" or resp.get_header("Content-Encoding") or resp.status[:3] in ("204", "304"):
+            return None
+        return choose_encoding(req)
+
+    def start(self, resp, encoding, data):
+        if resp.stream is None and (data is None or len(data) < min_size):
+            return False
+        if (resp.content_type or "").split(";")[0].strip() not in content_types:
+            return False
+        resp.set_header("Content-Encoding", encoding)
+        if "accept-encoding" not in (resp.get_header("Vary") or "").lower():
+            resp.append_header("Vary", "Accept-Encoding")
+        resp.delete_header("Content-Length")
+        etag = resp.get_header("ETag")
+        if etag and not etag.startswith("W/"):
+            # The compressed bytes differ from the identity ones, a strong validator would lie.
+            resp.set_header("ETag", "W/" + etag)
+        return True
@@ -1,9 +1,130 @@
 import os
+import threading
+import time
 
 import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_UNKNOWN
 from psycopg2.extras import NamedTupleCursor
 
+from todolists import metrics
+from todolists.instrumentation import InstrumentedConnection
 
-conn = psycopg2.connect(dbname="todolists", user="postgres", 
-                        password=os.environ["todolists_db_password"], host="localhost",
-                        cursor_factory=NamedTupleCursor)
+
+class PoolTimeoutError(Exception):
+    def __init__(self, message):
+        self.message = message
+
+
+class ConnectionPool:
+    def __init__(self, minconn, maxconn, timeout, check_after, **connect_kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_after = check_after
+        self.connect_kwargs = connect_kwargs
+        self._idle = []
+        self._size = 0
+        self._lock = threading.Condition()
+        self._local = threading.local()
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+    def _connect(self):
+        return psycopg2.connect(**self.connect_kwargs)
+
+    def _is_healthy(self, conn, idle_since):
+        if conn.closed or conn.info.transaction_status == TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if time.monotonic() - idle_since < self.check_after:
+            return True
+        try:
+            with conn.cursor() as curs:
+                curs.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        start = time.monotonic()
+        try:
+            conn = self._checkout(start + self.timeout)
+        except PoolTimeoutError:
+            metrics.db_pool_timeouts.inc()
+            raise
+        metrics.db_pool_checkout.observe(time.monotonic() - start)
+        metrics.db_pool_in_use.inc()
+        return conn
+
+    def _checkout(self, deadline):
+        with self._lock:
+            while not self._idle and self._size >= self.maxconn:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeoutError("No database connection available.")
+                self._lock.wait(remaining)
+            if self._idle:
+                conn, idle_since = self._idle.pop()
+            else:
+                conn, idle_since = None, None
+                self._size += 1
+        if conn is not None and self._is_healthy(conn, idle_since):
+            return conn
+        if conn is not None:
+            conn.close()
+        try:
+            return self._connect()
+        except:
+            with self._lock:
+                self._size -= 1
+                self._lock.notify()
+            raise
+
+    def putconn(self, conn, close=False):
+        metrics.db_pool_in_use.dec()
+        if close or conn.closed:
+            conn.close()
+            with self._lock:
+                self._size -= 1
+                self._lock.notify()
+            return
+        with self._lock:
+            self._idle.append((conn, time.monotonic()))
+            self._lock.notify()
+
+    def closeall(self):
+        with self._lock:
+            for conn, _ in self._idle:
+                conn.close()
+            self._size -= len(self._idle)
+            self._idle = []
+
+    def __enter__(self):
+        conn = self.getconn()
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        self._local.stack.append(conn)
+        return conn.__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        conn = self._local.stack.pop()
+        broken = isinstance(exc_value, (psycopg2.OperationalError, psycopg2.InterfaceError))
+        try:
+            conn.__exit__(exc_type, exc_value, traceback)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            if not broken:
+                broken = True
+                raise
+        finally:
+            self.putconn(conn, close=broken)
+
+
+# `with db.conn as conn` checks a connection out of the pool for the block.
+conn = ConnectionPool(minconn=int(os.environ.get("todolists_db_pool_min", 1)),
+                      maxconn=int(os.environ.get("todolists_db_pool_max", 10)),
+                      timeout=float(os.environ.get("todolists_db_pool_timeout", 5)),
+                      check_after=float(os.environ.get("todolists_db_pool_check_after", 30)),
+                      dbname="todolists", user="postgres",
+                      password=os.environ["todolists_db_password"], host="localhost",
+                      connection_factory=InstrumentedConnection, cursor_factory=NamedTupleCursor)
@@ -0,0 +1,169 @@
+import json
+import logging
+from os import environ, getpid
+from queue import Queue, Empty
+from smtplib import SMTPDataError, SMTPRecipientsRefused, SMTPSenderRefused
+from threading import Lock, Thread, Timer
+from time import sleep, time
+
+import redis
+
+from todolists import email_server, redis_conn
+from todolists.metrics import emails
+
+
+OUTBOX_KEY = "todolists:email-outbox"
+RETRIES_KEY = "todolists:email-retries"
+METRICS_KEY = "todolists:email-metrics"
+
+logger = logging.getLogger("todolists.emails")
+
+# "memory" keeps the outbox in the web process, mail still queued there is lost when the process exits.
+# "redis" keeps it in Redis for the scripts/email_worker.py process, and survives restarts of both.
+backend = environ.get("todolists_email_queue", "memory")
+batch_size = int(environ.get("todolists_email_batch_size", 20))
+max_attempts = int(environ.get("todolists_email_max_attempts", 5))
+backoff = float(environ.get("todolists_email_backoff", 2))
+
+outbox = Queue()
+metrics = {"enqueued": 0, "sent": 0, "retried": 0, "failed": 0}
+metrics_lock = Lock()
+worker_pid = None
+worker_lock = Lock()
+
+
+def enqueue(to_email, email_message):
+    message = {"to": to_email, "message": email_message, "attempts": 0}
+    if backend == "redis":
+        with redis_conn.conn as conn:
+            conn.lpush(OUTBOX_KEY, json.dumps(message))
+    else:
+        start_worker_thread()
+        outbox.put(message)
+    count("enqueued")
+
+def count(metric, amount=1):
+    with metrics_lock:
+        metrics[metric] += amount
+    emails.labels(metric).inc(amount)
+    if backend == "redis":
+        try:
+            with redis_conn.conn as conn:
+                conn.hincrby(METRICS_KEY, metric, amount)
+        except redis.RedisError:
+            # Losing a count is better than resending or dropping the mail it counts.
+            logger.exception("Could not count %s emails", metric)
+
+def get_metrics():
+    if backend == "redis":
+        with redis_conn.conn as conn:
+            stored = conn.hgetall(METRICS_KEY)
+            queued = conn.llen(OUTBOX_KEY) + conn.zcard(RETRIES_KEY)
+        current = {metric: int(stored.get(metric.encode(), 0)) for metric in metrics}
+    else:
+        with metrics_lock:
+            current = dict(metrics)
+        queued = outbox.qsize()
+    current["queued"] = queued
+    return current
+
+def deliver(batch):
+    failed = []
+    for position, message in enumerate(batch):
+        try:
+            email_server.send_mail(message["to"], message["message"])
+            count("sent")
+        except (SMTPRecipientsRefused, SMTPSenderRefused, SMTPDataError):
+            failed.append(message)
+        except (OSError, email_server.SendingEmailError):
+            failed.extend(batch[position:])
+            break
+        except Exception:
+            logger.exception("Sending email failed")
+            failed.extend(batch[position:])
+            break
+    return failed
+
+def retry_later(message):
+    message["attempts"] += 1
+    if message["attempts"] >= max_attempts:
+        count("failed")
+        return
+    count("retried")
+    delay = backoff * 2 ** (message["attempts"] - 1)
+    if backend == "redis":
+        with redis_conn.conn as conn:
+            conn.zadd(RETRIES_KEY, {json.dumps(message): time() + delay})
+    else:
+        retry = Timer(delay, outbox.put, [message])
+        retry.daemon = True
+        retry.start()
+
+def start_worker_thread():
+    global worker_pid
+    if worker_pid == getpid():
+        return
+    with worker_lock:
+        if worker_pid != getpid():
+            Thread(target=work_on_outbox, daemon=True).start()
+            worker_pid = getpid()
+
+def work_on_outbox():
+    global worker_pid
+    try:
+        while True:
+            batch = [outbox.get()]
+            while len(batch) < batch_size:
+                try:
+                    batch.append(outbox.get_nowait())
+                except Empty:
+                    break
+            try:
+                for message in deliver(batch):
+                    retry_later(message)
+            except Exception:
+                logger.exception("Handling a batch of %s emails failed", len(batch))
+            finally:
+                for _ in batch:
+                    outbox.task_done()
+    finally:
+        # Lets the next enqueue start a new worker, the outbox keeps the mail this one did not take.
+        worker_pid = None
+
+def requeue_due_retries():
+    with redis_conn.conn as conn:
+        due = conn.zrangebyscore(RETRIES_KEY, "-inf", time())
+        for message in due:
+            if conn.zrem(RETRIES_KEY, message):
+                conn.rpush(OUTBOX_KEY, message)
+
+def take_batch_from_redis(timeout):
+    with redis_conn.conn as conn:
+        first = conn.brpop(OUTBOX_KEY, timeout=timeout)
+        if first is None:
+            return []
+        rest = []
+        if batch_size > 1:
+            pipe = conn.pipeline()
+            pipe.lrange(OUTBOX_KEY, -(batch_size - 1), -1)
+            pipe.ltrim(OUTBOX_KEY, 0, -batch_size)
+            rest = pipe.execute()[0]
+    return [json.loads(message) for message in [first[1]] + rest[::-1]]
+
+def work_on_redis_outbox(timeout=1):
+    requeue_due_retries()
+    batch = take_batch_from_redis(timeout)
+    if batch:
+        for message in deliver(batch):
+            retry_later(message)
+    return len(batch)
+
+def run_worker():
+    while True:
+        try:
+            work_on_redis_outbox()
+        except (redis.ConnectionError, redis.TimeoutError):
+            sleep(1)
+        except Exception:
+            logger.exception("Email worker failed, retrying")
+            sleep(1)
@@ -1,23 +1,132 @@
 from os import environ
-from smtplib import SMTP
+from smtplib import SMTP, SMTPException, SMTPRecipientsRefused, SMTPResponseException, SMTPServerDisconnected
+from threading import Condition, local
+from time import monotonic
+
+
+smtp_host = environ.get("todolists_smtp_host", "smtp.gmail.com")
+smtp_port = int(environ.get("todolists_smtp_port", 587))
+smtp_starttls = environ.get("todolists_smtp_starttls", "true") == "true"
+smtp_timeout = float(environ.get("todolists_smtp_timeout", 30))
 
 
 def get_credentials():
     credentials = environ["todolists_email_and_password"].split(" ")
     return credentials
-    
+
 def connect_server():
     credentials = get_credentials()
-    server_connection = SMTP('smtp.gmail.com', 587)
-    server_connection.starttls()
+    server_connection = SMTP(smtp_host, smtp_port, timeout=smtp_timeout)
+    if smtp_starttls:
+        server_connection.starttls()
     server_connection.login(credentials[0], credentials[1])
     return server_connection
 
-def send_mail(to_email, email_message, server_connection):
-    server_connection.sendmail("TodoLists", to_email, email_message)
-    server_connection.quit()
+def send_mail(to_email, email_message):
+    try:
+        with pool as server_connection:
+            server_connection.sendmail("TodoLists", to_email, email_message)
+            server_connection.sent_messages += 1
+    except SMTPServerDisconnected:
+        with pool as server_connection:
+            server_connection.sendmail("TodoLists", to_email, email_message)
+            server_connection.sent_messages += 1
+
+def disconnect_server(server_connection):
+    try:
+        server_connection.quit()
+    except:
+        server_connection.close()
 
 
 class SendingEmailError(Exception):
     def __init__(self, message):
         self.message = message
+
+
+class SMTPPool:
+    def __init__(self, size, max_messages, check_after, timeout):
+        self.size = size
+        self.max_messages = max_messages
+        self.check_after = check_after
+        self.timeout = timeout
+        self._idle = []
+        self._open = 0
+        self._lock = Condition()
+        self._local = local()
+
+    def _connect(self):
+        server_connection = connect_server()
+        server_connection.sent_messages = 0
+        return server_connection
+
+    def _is_alive(self, server_connection):
+        if monotonic() - server_connection.idle_since < self.check_after:
+            return True
+        try:
+            return server_connection.noop()[0] == 250
+        except (SMTPException, OSError):
+            return False
+
+    def getconn(self):
+        deadline = monotonic() + self.timeout
+        with self._lock:
+            while not self._idle and self._open >= self.size:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    raise SendingEmailError("No SMTP connection available.")
+                self._lock.wait(remaining)
+            if self._idle:
+                server_connection = self._idle.pop()
+            else:
+                server_connection = None
+                self._open += 1
+        try:
+            if server_connection is not None and self._is_alive(server_connection):
+                return server_connection
+            if server_connection is not None:
+                server_connection.close()
+            return self._connect()
+        except:
+            with self._lock:
+                self._open -= 1
+                self._lock.notify()
+            raise
+
+    def putconn(self, server_connection, close=False):
+        if close or server_connection.sent_messages >= self.max_messages:
+            disconnect_server(server_connection)
+            with self._lock:
+                self._open -= 1
+                self._lock.notify()
+            return
+        server_connection.idle_since = monotonic()
+        with self._lock:
+            self._idle.append(server_connection)
+            self._lock.notify()
+
+    def closeall(self):
+        with self._lock:
+            for server_connection in self._idle:
+                disconnect_server(server_connection)
+            self._open -= len(self._idle)
+            self._idle = []
+
+    def __enter__(self):
+        server_connection = self.getconn()
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        self._local.stack.append(server_connection)
+        return server_connection
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        server_connection = self._local.stack.pop()
+        broken = (isinstance(exc_value, OSError)
+                  and not isinstance(exc_value, (SMTPRecipientsRefused, SMTPResponseException)))
+        self.putconn(server_connection, close=broken)
+
+
+pool = SMTPPool(size=int(environ.get("todolists_smtp_pool_size", 2)),
+                max_messages=int(environ.get("todolists_smtp_max_messages", 100)),
+                check_after=float(environ.get("todolists_smtp_check_after", 10)),
+                timeout=float(environ.get("todolists_smtp_pool_timeout", 60)))
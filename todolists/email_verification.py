@@ -4,10 +4,16 @@ import bcrypt
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
-from todolists import app, redis_conn, db, email_server
+from todolists import app, redis_conn, db, email_queue
+from todolists.user_authorization import set_session_token
 
 
 class EmailVerification:
+    def __init__(self):
+        self.error_wrong_email_token = app.templates["error-wrong-email-token.html"]
+        self.error = app.templates["error.html"]
+        self.successful_registration = app.templates["successful_registration.html"]
+
     def on_post(self, req, resp):
         resp.content_type = "text/html"
         try:
@@ -15,33 +21,32 @@ class EmailVerification:
             update_user_verified_in_db(email)
         except EmailVerificationError:
             resp.status = falcon.HTTP_403
-            template = app.templates_env.get_template("error-wrong-email-token.html")
-            resp.text = template.render()
+            resp.text = self.error_wrong_email_token.render()
         except:
             resp.status = falcon.HTTP_500
-            template = app.templates_env.get_template("error.html")
-            resp.text = template.render(error="Unexpected error.")
+            resp.text = self.error.render(error="Unexpected error.")
         else:
             session_token = create_session_token()
             user_id = get_user_id(email)
             set_session_token_on_redis(session_token, user_id)
             resp.set_cookie("session-token", session_token)
-            template = app.templates_env.get_template("successful_registration.html")
-            resp.text = template.render()
+            resp.text = self.successful_registration.render()
 
 
 class EmailReverification:
+    def __init__(self):
+        self.email_verification = app.templates["email_verification.html"]
+        self.error = app.templates["error.html"]
+
     def on_post(self, req, resp):
         resp.content_type = "text/html"
         try:
             email = req.get_param("email")
             send_email_with_token(email)
-            template = app.templates_env.get_template("email_verification.html")
-            resp.text = template.render()
+            resp.text = self.email_verification.render()
         except:
             resp.status = falcon.HTTP_500
-            template = app.templates_env.get_template("error.html")
-            resp.text = template.render(error="Unexpected error.")
+            resp.text = self.error.render(error="Unexpected error.")
 
 
 class EmailVerificationError(Exception):
@@ -77,15 +82,13 @@ def get_user_id(email):
             return str(curs.fetchone().user_id)
 
 def set_session_token_on_redis(session_token, user_id):
-    with redis_conn.session_conn as conn:
-        conn.set(session_token, user_id)
+    set_session_token(session_token, user_id)
 
 def send_email_with_token(email):
     token = create_token()
     save_token_to_redis(token, email)
     email_message = build_email_message_sending_token(token, email)
-    server_connection = email_server.connect_server()
-    email_server.send_mail(email, email_message, server_connection)
+    email_queue.enqueue(email, email_message)
 
 def create_token():
         token = randbelow(1000000)
@@ -93,8 +96,7 @@ def create_token():
 
 def save_token_to_redis(token, email):
     with redis_conn.conn as conn:
-        conn.set(token, email)
-        conn.expire(token, 600)
+        conn.set(token, email, ex=600)
 
 def build_email_message_sending_token(token, email):
     message = MIMEMultipart()
@@ -106,4 +108,4 @@ def build_email_message_sending_token(token, email):
     return message.as_string()
 
 def build_email_message_sending_token_html_body(token):
-    return app.templates_env.get_template("email_message_sending_code.html").render(token=token)
+    return app.templates["email_message_sending_code.html"].render(token=token)
@@ -0,0 +1,60 @@
+from time import time
+
+import falcon
+
+from todolists import redis_conn
+
+
+VERSION_KEY = "user-version:{}"
+
+
+# The queue_* functions only add commands to a pipeline, so the WSGI app and the ASGI one send the same ones.
+def queue_get_user_version(pipe, user_id):
+    key = VERSION_KEY.format(user_id)
+    # A missing counter restarts from 0, the current time keeps ETags from before a flush unique.
+    pipe.hsetnx(key, "version", 0)
+    pipe.hsetnx(key, "modified", int(time()))
+    pipe.hmget(key, "version", "modified")
+
+def read_user_version(results):
+    version, modified = results[-1]
+    return int(version), int(modified)
+
+def queue_bump_user_version(pipe, user_id):
+    key = VERSION_KEY.format(user_id)
+    pipe.hincrby(key, "version", 1)
+    pipe.hset(key, "modified", int(time()))
+
+def get_user_version(user_id):
+    with redis_conn.cache_conn as conn:
+        pipe = conn.pipeline()
+        queue_get_user_version(pipe, user_id)
+        return read_user_version(pipe.execute())
+
+def bump_user_version(user_id):
+    with redis_conn.cache_conn as conn:
+        pipe = conn.pipeline()
+        queue_bump_user_version(pipe, user_id)
+        pipe.execute()
+
+def get_etag(version, modified, *parts):
+    return "-".join(str(part) for part in (*parts, version, modified))
+
+def is_not_modified(req, resp, user_id, *parts):
+    # The version is handed back too, so a 200 renders with it instead of reading it again.
+    version, modified = get_user_version(user_id)
+    return check_conditional_request(req, resp, version, modified, *parts), (version, modified)
+
+def check_conditional_request(req, resp, version, modified, *parts):
+    etag = get_etag(version, modified, *parts)
+    # Weak on 200s and 304s alike, one validator stands for both the identity and the compressed body.
+    resp.etag = f'W/"{etag}"'
+    resp.cache_control = ["private", "no-cache"]
+    resp.vary = ["Cookie", "Accept-Encoding"]
+    # No Last-Modified, writes within the same second would make If-Modified-Since answer a stale 304.
+    not_modified = (req.if_none_match is not None
+                    and any(match == "*" or match == etag for match in req.if_none_match))
+    if not_modified:
+        resp.status = falcon.HTTP_304
+        resp.content_type = None
+    return not_modified
@@ -0,0 +1,186 @@
+import asyncio
+import json
+import logging
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from os import environ
+from time import perf_counter
+
+import jinja2
+import redis
+import redis.asyncio
+import redis.asyncio.client
+import redis.client
+from psycopg2.extensions import connection
+
+from todolists import metrics
+
+
+server_timing = environ.get("todolists_server_timing", "false") == "true"
+slow_request_ms = float(environ.get("todolists_slow_request_ms", 500))
+slow_sample_rate = float(environ.get("todolists_slow_sample_rate", 1))
+max_statements = int(environ.get("todolists_slow_max_statements", 50))
+max_statement_length = int(environ.get("todolists_slow_max_statement_length", 1000))
+
+KINDS = ("sql", "redis", "render", "bcrypt")
+UNITS = {"sql": "queries", "redis": "commands", "render": "templates", "bcrypt": "hashes"}
+
+logger = logging.getLogger("todolists.requests")
+current = ContextVar("todolists_request_timings", default=None)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.start = perf_counter()
+        self.counts = dict.fromkeys(KINDS, 0)
+        self.durations = dict.fromkeys(KINDS, 0.0)
+        self.statements = []
+
+    def add(self, kind, duration, count=1, statement=None):
+        self.counts[kind] += count
+        self.durations[kind] += duration
+        if statement is not None and len(self.statements) < max_statements:
+            # Raw query text only, the parameters are never kept.
+            self.statements.append((statement, duration))
+
+
+@contextmanager
+def timed(kind, count=1, statement=None):
+    timings = current.get()
+    start = perf_counter()
+    try:
+        yield
+    except Exception as error:
+        metrics.call_errors.labels(kind, type(error).__name__).inc()
+        raise
+    finally:
+        if timings is not None:
+            timings.add(kind, (perf_counter() - start) * 1000, count, statement)
+
+def statement_text(statement):
+    if isinstance(statement, bytes):
+        statement = statement.decode(errors="replace")
+    return " ".join(str(statement).split())[:max_statement_length]
+
+def format_server_timing(timings, total):
+    entries = [f'{kind};dur={timings.durations[kind]:.3f};desc="{timings.counts[kind]} {UNITS[kind]}"'
+               for kind in KINDS if timings.counts[kind]]
+    entries.append(f"total;dur={total:.3f}")
+    return ", ".join(entries)
+
+def build_log_record(req, resp, timings, total):
+    record = {"method": req.method, "path": req.path, "route": req.uri_template, "status": int(resp.status[:3]),
+              "total_ms": round(total, 3)}
+    for kind in KINDS:
+        record[f"{kind}_count"] = timings.counts[kind]
+        record[f"{kind}_ms"] = round(timings.durations[kind], 3)
+    return record
+
+
+cursor_classes = {}
+
+def instrumented_cursor(factory):
+    if factory not in cursor_classes:
+        def execute(curs, query, vars=None):
+            with timed("sql", statement=query):
+                return factory.execute(curs, query, vars)
+
+        def executemany(curs, query, vars_list):
+            with timed("sql", statement=query):
+                return factory.executemany(curs, query, vars_list)
+
+        cursor_classes[factory] = type("Instrumented" + factory.__name__, (factory,),
+                                       {"execute": execute, "executemany": executemany})
+    return cursor_classes[factory]
+
+
+class InstrumentedConnection(connection):
+    # Wraps whatever cursor factory a caller asks for, so NamedTupleCursor and plain cursors are both timed.
+    def cursor(self, *args, **kwargs):
+        kwargs["cursor_factory"] = instrumented_cursor(kwargs.get("cursor_factory") or self.cursor_factory)
+        return super().cursor(*args, **kwargs)
+
+
+class InstrumentedRedis(redis.Redis):
+    def execute_command(self, *args, **options):
+        with timed("redis"):
+            return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class InstrumentedPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error=True):
+        with timed("redis", len(self.command_stack)):
+            return super().execute(raise_on_error)
+
+
+class InstrumentedAsyncRedis(redis.asyncio.Redis):
+    async def execute_command(self, *args, **options):
+        with timed("redis"):
+            return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedAsyncPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class InstrumentedAsyncPipeline(redis.asyncio.client.Pipeline):
+    async def execute(self, raise_on_error=True):
+        with timed("redis", len(self.command_stack)):
+            return await super().execute(raise_on_error)
+
+
+class InstrumentedTemplate(jinja2.Template):
+    def render(self, *args, **kwargs):
+        with timed("render"):
+            return super().render(*args, **kwargs)
+
+
+def log_asyncpg_query(record):
+    if record.exception is not None:
+        metrics.call_errors.labels("sql", type(record.exception).__name__).inc()
+    timings = current.get()
+    if timings is not None:
+        timings.add("sql", record.elapsed * 1000, statement=record.query)
+
+async def instrument_asyncpg(conn):
+    conn.add_query_logger(log_asyncpg_query)
+
+
+class InstrumentationMiddleware:
+    def process_request(self, req, resp):
+        req.context.timings = RequestTimings()
+        req.context.timings_token = current.set(req.context.timings)
+
+    async def process_request_async(self, req, resp):
+        self.process_request(req, resp)
+
+    def process_response(self, req, resp, resource, req_succeeded):
+        timings = getattr(req.context, "timings", None)
+        if timings is None:
+            return
+        try:
+            self.finish(req, resp, timings)
+        finally:
+            current.reset(req.context.timings_token)
+
+    async def process_response_async(self, req, resp, resource, req_succeeded):
+        # asyncpg reports queries through call_soon, let the last ones land before reading the totals.
+        await asyncio.sleep(0)
+        self.process_response(req, resp, resource, req_succeeded)
+
+    def finish(self, req, resp, timings):
+        total = (perf_counter() - timings.start) * 1000
+        if server_timing:
+            resp.set_header("Server-Timing", format_server_timing(timings, total))
+        if total >= slow_request_ms and logger.isEnabledFor(logging.WARNING):
+            record = build_log_record(req, resp, timings, total)
+            # Only a sample of slow requests carries its SQL text.
+            if random.random() < slow_sample_rate:
+                record["statements"] = [{"sql": statement_text(statement), "ms": round(duration, 3)}
+                                        for statement, duration in timings.statements]
+            logger.warning(json.dumps(record))
+        elif logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps(build_log_record(req, resp, timings, total)))
@@ -0,0 +1,77 @@
+from os import environ
+from time import perf_counter
+
+import falcon
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+
+
+metrics_token = environ.get("todolists_metrics_token")
+
+# From cached 304s up to bcrypt logins waiting in the hashing queue.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CHECKOUT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+request_duration = Histogram("todolists_request_duration_seconds", "Request latency by route.",
+                             ["method", "route"], buckets=LATENCY_BUCKETS)
+responses = Counter("todolists_responses", "Responses by route and status code.", ["method", "route", "status"])
+db_queries = Counter("todolists_db_queries", "SQL queries run while handling requests.", ["route"])
+redis_commands = Counter("todolists_redis_commands", "Redis commands sent while handling requests.", ["route"])
+call_errors = Counter("todolists_call_errors", "SQL queries, Redis commands, renders and hashes that raised.",
+                      ["kind", "error"])
+# livesum keeps only the workers that are still running in the total.
+db_pool_in_use = Gauge("todolists_db_pool_in_use", "Database connections checked out of the pool.",
+                       multiprocess_mode="livesum")
+db_pool_checkout = Histogram("todolists_db_pool_checkout_seconds", "Time to get a database connection from the pool.",
+                             buckets=CHECKOUT_BUCKETS)
+db_pool_timeouts = Counter("todolists_db_pool_timeouts", "Requests that found no free database connection.")
+bcrypt_queue = Gauge("todolists_bcrypt_queue", "bcrypt hashes running or waiting for a worker thread.",
+                     multiprocess_mode="livesum")
+bcrypt_rejected = Counter("todolists_bcrypt_rejected", "Sign-ins turned away because the bcrypt queue was full.")
+emails = Counter("todolists_emails", "Emails by outcome: enqueued, sent, retried or failed.", ["outcome"])
+
+
+def get_registry():
+    # Under gunicorn every worker writes its own files, a scrape has to merge them all.
+    if "PROMETHEUS_MULTIPROC_DIR" not in environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+def get_route(req):
+    # Unmatched paths share one label, so scanners cannot blow up the series count.
+    return req.uri_template or "unmatched"
+
+
+class MetricsMiddleware:
+    # Goes before InstrumentationMiddleware, its responses run after and find the request's call counts complete.
+    def process_request(self, req, resp):
+        req.context.metrics_start = perf_counter()
+
+    async def process_request_async(self, req, resp):
+        self.process_request(req, resp)
+
+    def process_response(self, req, resp, resource, req_succeeded):
+        start = getattr(req.context, "metrics_start", None)
+        if start is None:
+            return
+        route = get_route(req)
+        request_duration.labels(req.method, route).observe(perf_counter() - start)
+        responses.labels(req.method, route, resp.status[:3]).inc()
+        timings = getattr(req.context, "timings", None)
+        if timings is not None:
+            db_queries.labels(route).inc(timings.counts["sql"])
+            redis_commands.labels(route).inc(timings.counts["redis"])
+
+    async def process_response_async(self, req, resp, resource, req_succeeded):
+        self.process_response(req, resp, resource, req_succeeded)
+
+
+class Metrics:
+    def on_get(self, req, resp):
+        # Hidden unless a token is configured and sent, the ASGI app routes it too.
+        if not metrics_token or req.auth != f"Bearer {metrics_token}":
+            raise falcon.HTTPNotFound()
+        resp.content_type = CONTENT_TYPE_LATEST
+        resp.data = generate_latest(get_registry())
@@ -0,0 +1,6 @@
+-- The dashboard reads a user's lists in list_id order and a list's tasks in
+-- task_id order; both indexes cover the selected columns for index-only scans.
+-- INCLUDE needs PostgreSQL 11 or newer.
+CREATE INDEX IF NOT EXISTS lists_user_id_list_id_idx ON lists (user_id, list_id) INCLUDE (title);
+
+CREATE INDEX IF NOT EXISTS tasks_list_id_task_id_idx ON tasks (list_id, task_id) INCLUDE (task, done);
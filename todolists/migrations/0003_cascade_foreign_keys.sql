@@ -0,0 +1,22 @@
+-- Databases created outside sql/ may name these foreign keys differently, so drop
+-- whichever ones link the tables instead of relying on the generated names.
+DO $$
+DECLARE
+    foreign_key record;
+BEGIN
+    FOR foreign_key IN
+        SELECT conrelid::regclass AS table_name, conname FROM pg_constraint
+        WHERE contype = 'f'
+        AND ((conrelid = 'lists'::regclass AND confrelid = 'users'::regclass)
+             OR (conrelid = 'tasks'::regclass AND confrelid = 'lists'::regclass))
+    LOOP
+        EXECUTE format('ALTER TABLE %s DROP CONSTRAINT %I', foreign_key.table_name, foreign_key.conname);
+    END LOOP;
+END
+$$;
+
+ALTER TABLE lists
+    ADD CONSTRAINT lists_user_id_fkey FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE;
+
+ALTER TABLE tasks
+    ADD CONSTRAINT tasks_list_id_fkey FOREIGN KEY (list_id) REFERENCES lists(list_id) ON DELETE CASCADE;
@@ -0,0 +1,51 @@
+from pathlib import Path
+
+from todolists import db
+
+
+migrations_dir = Path(__file__).parent
+
+
+def get_migrations():
+    migrations = []
+    for path in sorted(migrations_dir.glob("[0-9][0-9][0-9][0-9]_*.sql")):
+        migrations.append((int(path.name[:4]), path))
+    return migrations
+
+def create_migrations_table():
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version integer PRIMARY KEY,
+                    name varchar(200) NOT NULL,
+                    applied_at timestamptz NOT NULL DEFAULT now())""")
+
+def get_applied_versions():
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("SELECT version FROM schema_migrations ORDER BY version")
+            return [record.version for record in curs.fetchall()]
+
+def apply_migration(version, path):
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            # Concurrent runners wait here; whoever gets the lock second sees the version as applied.
+            curs.execute("LOCK TABLE schema_migrations IN EXCLUSIVE MODE")
+            curs.execute("SELECT 1 FROM schema_migrations WHERE version = %s", [version])
+            if curs.fetchone():
+                return False
+            curs.execute(path.read_text())
+            curs.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", [version, path.name])
+    return True
+
+def migrate(target=None):
+    create_migrations_table()
+    applied = get_applied_versions()
+    migrated = []
+    for version, path in get_migrations():
+        if target is not None and version > target:
+            break
+        if version not in applied and apply_migration(version, path):
+            migrated.append(path.name)
+    return migrated
@@ -0,0 +1,48 @@
+from concurrent.futures import ThreadPoolExecutor
+from os import environ
+from threading import BoundedSemaphore
+
+import bcrypt
+
+from todolists import metrics
+from todolists.instrumentation import timed
+
+
+rounds = int(environ.get("todolists_bcrypt_rounds", 12))
+workers = int(environ.get("todolists_bcrypt_workers", 2))
+queue_limit = int(environ.get("todolists_bcrypt_queue", 8))
+
+# bcrypt releases the GIL while hashing, so threads are enough to keep the
+# hashing off the request threads; the semaphore bounds running + queued work.
+executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+slots = BoundedSemaphore(workers + queue_limit)
+
+
+class PasswordHashingBusy(Exception):
+    def __init__(self, message):
+        self.message = message
+
+
+def run_in_executor(function, *args):
+    if not slots.acquire(blocking=False):
+        metrics.bcrypt_rejected.inc()
+        raise PasswordHashingBusy("We are receiving too many sign-ins right now. Try again in a few seconds.")
+    metrics.bcrypt_queue.inc()
+    try:
+        future = executor.submit(function, *args)
+    except:
+        release_slot()
+        raise
+    future.add_done_callback(lambda future: release_slot())
+    with timed("bcrypt"):
+        return future.result()
+
+def release_slot():
+    slots.release()
+    metrics.bcrypt_queue.dec()
+
+def hash_password(password):
+    return run_in_executor(bcrypt.hashpw, password.encode(), bcrypt.gensalt(rounds))
+
+def check_password(password, hashed):
+    return run_in_executor(bcrypt.checkpw, password.encode(), hashed.encode())
@@ -0,0 +1,109 @@
+from hashlib import sha1
+from os import environ
+
+import falcon
+import redis
+
+from todolists import app, redis_conn
+
+
+def parse_limit(limit):
+    count, period = limit.split("/")
+    return int(count), float(period)
+
+
+enabled = environ.get("todolists_rate_limiting", "true") == "true"
+# How many proxies in front of the app append to X-Forwarded-For, 0 trusts only the socket address.
+trusted_proxies = int(environ.get("todolists_trusted_proxies", 0))
+
+# Limits are "requests/seconds" token buckets, applied to POSTs only.
+limits = {
+    "/login": {"ip": parse_limit(environ.get("todolists_rate_limit_login_ip", "30/60")),
+               "email": parse_limit(environ.get("todolists_rate_limit_login_email", "10/300"))},
+    "/register": {"ip": parse_limit(environ.get("todolists_rate_limit_register_ip", "10/3600"))},
+    "/email_reverification": {"ip": parse_limit(environ.get("todolists_rate_limit_reverification_ip", "10/3600")),
+                              "email": parse_limit(environ.get("todolists_rate_limit_reverification_email", "3/3600"))}
+}
+
+KEY = "rate-limit:{}:{}:{}"
+
+# Checks every bucket of a request in one round trip and takes a token from each only if all have one.
+# Returns 0 when allowed, else the seconds until the emptiest bucket refills a token.
+TOKEN_BUCKET_SCRIPT = """
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local buckets = {}
+local retry_after = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2 - 1])
+    local period = tonumber(ARGV[i * 2])
+    local rate = capacity / period
+    local bucket = redis.call("HMGET", key, "tokens", "updated")
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+    if tokens < 1 then
+        retry_after = math.max(retry_after, math.ceil((1 - tokens) / rate))
+    end
+    buckets[i] = {tokens, period}
+end
+if retry_after > 0 then
+    return retry_after
+end
+for i, key in ipairs(KEYS) do
+    redis.call("HSET", key, "tokens", buckets[i][1] - 1, "updated", now)
+    redis.call("EXPIRE", key, math.ceil(buckets[i][2]))
+end
+return 0
+"""
+
+token_bucket = redis_conn.cache_conn.register_script(TOKEN_BUCKET_SCRIPT)
+
+
+def get_client_ip(req):
+    if trusted_proxies:
+        forwarded = [address.strip() for address in (req.get_header("X-Forwarded-For") or "").split(",")
+                     if address.strip()]
+        if len(forwarded) >= trusted_proxies:
+            return forwarded[-trusted_proxies]
+    return req.remote_addr
+
+def get_buckets(req):
+    route_limits = limits.get(req.uri_template) if enabled and req.method == "POST" else None
+    keys, args = [], []
+    for by, (count, period) in (route_limits or {}).items():
+        if by == "ip":
+            value = get_client_ip(req)
+        else:
+            email = (req.get_param("email") or "").strip().lower()
+            value = sha1(email.encode()).hexdigest() if email else None
+        if value:
+            keys.append(KEY.format(req.uri_template, by, value))
+            args.extend([count, period])
+    return keys, args
+
+def check(req):
+    keys, args = get_buckets(req)
+    if not keys:
+        return 0
+    try:
+        return int(token_bucket(keys=keys, args=args))
+    except redis.RedisError:
+        # Fail open, an unreachable Redis should not lock everybody out of signing in.
+        return 0
+
+def reject(resp, retry_after):
+    resp.status = falcon.HTTP_429
+    resp.append_header("Retry-After", str(retry_after))
+    resp.content_type = "text/html"
+    resp.text = app.templates["error.html"].render(
+        error=f"Too many attempts. Try again in {retry_after} seconds.")
+    resp.complete = True
+
+
+class RateLimitMiddleware:
+    # Runs after routing and before the responder, so rejected requests never reach bcrypt or SMTP.
+    def process_resource(self, req, resp, resource, params):
+        retry_after = check(req)
+        if retry_after:
+            reject(resp, retry_after)
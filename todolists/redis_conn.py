@@ -1,5 +1,56 @@
+from os import environ
+
 import redis
+import redis.asyncio
+
+from todolists.instrumentation import InstrumentedAsyncRedis, InstrumentedRedis
+
+
+host = environ.get("todolists_redis_host", "localhost")
+port = int(environ.get("todolists_redis_port", 6379))
+unix_socket = environ.get("todolists_redis_unix_socket")
+pool_size = int(environ.get("todolists_redis_pool_size", 50))
+pool_timeout = float(environ.get("todolists_redis_pool_timeout", 5))
+socket_timeout = float(environ.get("todolists_redis_socket_timeout", 5))
+socket_connect_timeout = float(environ.get("todolists_redis_connect_timeout", 2))
+retry_on_timeout = environ.get("todolists_redis_retry_on_timeout", "true") == "true"
+
+session_db = 0
+tokens_db = 1
+cache_db = 2
+
+
+def get_connection_kwargs(db, unix_socket_connection, **options):
+    connection_kwargs = {
+        "db": db,
+        "socket_timeout": socket_timeout,
+        "retry_on_timeout": retry_on_timeout
+    }
+    if unix_socket:
+        connection_kwargs["connection_class"] = unix_socket_connection
+        connection_kwargs["path"] = unix_socket
+    else:
+        connection_kwargs["host"] = host
+        connection_kwargs["port"] = port
+        connection_kwargs["socket_connect_timeout"] = socket_connect_timeout
+    connection_kwargs.update(options)
+    return connection_kwargs
+
+def create_client(db, **options):
+    connection_kwargs = get_connection_kwargs(db, redis.UnixDomainSocketConnection, **options)
+    # A blocking pool makes callers wait up to pool_timeout for a free connection
+    # instead of opening connections without bound under load.
+    pool = redis.BlockingConnectionPool(max_connections=pool_size, timeout=pool_timeout, **connection_kwargs)
+    return InstrumentedRedis(connection_pool=pool)
+
+def create_async_client(db, **options):
+    connection_kwargs = get_connection_kwargs(db, redis.asyncio.UnixDomainSocketConnection, **options)
+    pool = redis.asyncio.BlockingConnectionPool(max_connections=pool_size, timeout=pool_timeout,
+                                                **connection_kwargs)
+    return InstrumentedAsyncRedis(connection_pool=pool)
+
+session_conn = create_client(session_db)
 
-session_conn = redis.Redis(host='localhost', port=6379, db=0)
+conn = create_client(tokens_db)
 
-conn = redis.Redis(host='localhost', port=6379, db=1)
\ No newline at end of file
+cache_conn = create_client(cache_db)
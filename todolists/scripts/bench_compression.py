@@ -0,0 +1,47 @@
+import sys
+from time import process_time
+
+import falcon
+from falcon import testing
+
+from todolists import app, compression
+from todolists.scripts.bench_fixtures import build_user_data
+
+
+class Dashboard:
+    def __init__(self, html):
+        self.html = html
+
+    def on_get(self, req, resp):
+        resp.content_type = "text/html"
+        resp.text = self.html
+
+
+def measure(client, headers, requests):
+    start = process_time()
+    for _ in range(requests):
+        result = client.simulate_get("/dashboard", headers=headers)
+    return len(result.content), (process_time() - start) / requests * 1000
+
+def bench_compression(lists=20, tasks=1000, requests=200):
+    app.load_templates()
+    html = app.templates["dashboard.html"].render(user=build_user_data(lists, tasks))
+    plain = falcon.App()
+    compressed = falcon.App(middleware=[compression.CompressionMiddleware()])
+    for bench_app in (plain, compressed):
+        bench_app.add_route("/dashboard", Dashboard(html))
+    print(f"{lists} lists x {tasks} tasks, {requests} dashboard requests")
+    runs = [("identity", plain, {}, {})]
+    for level in (1, 6, 9):
+        runs.append((f"gzip {level}", compressed, {"Accept-Encoding": "gzip"}, {"level": level}))
+    if compression.brotli:
+        for quality in (1, 4, 11):
+            runs.append((f"br {quality}", compressed, {"Accept-Encoding": "br"}, {"brotli_quality": quality}))
+    for name, bench_app, headers, settings in runs:
+        for setting, value in settings.items():
+            setattr(compression, setting, value)
+        size, cpu = measure(testing.TestClient(bench_app), headers, requests)
+        print(f"{name:>8}: {size:>8} bytes on the wire, {cpu:.3f} ms CPU/request")
+
+
+bench_compression(*[int(arg) for arg in sys.argv[1:]])
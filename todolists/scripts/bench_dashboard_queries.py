@@ -0,0 +1,95 @@
+import sys
+from time import perf_counter
+
+import bcrypt
+from psycopg2.extensions import connection
+
+from todolists import app, db, user_dashboard
+
+
+class CountingConnection(connection):
+    queries = 0
+    cursor_classes = {}
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get("cursor_factory") or self.cursor_factory
+        if factory not in self.cursor_classes:
+            def execute(curs, query, vars=None):
+                CountingConnection.queries += 1
+                return factory.execute(curs, query, vars)
+            self.cursor_classes[factory] = type("Counting" + factory.__name__, (factory,), {"execute": execute})
+        kwargs["cursor_factory"] = self.cursor_classes[factory]
+        return super().cursor(*args, **kwargs)
+
+
+class CountingPool(db.ConnectionPool):
+    transactions = 0
+
+    def getconn(self):
+        CountingPool.transactions += 1
+        return super().getconn()
+
+
+def get_todolists_user_data_with_three_queries(user_id, selected_todolist=None):
+    author, todolists = user_dashboard.get_user_name_and_todolists(user_id)
+    todolists_user_data = user_dashboard.generate_user_data_dict(author, selected_todolist, todolists)
+    if selected_todolist==None and todolists:
+        user_dashboard.select_oldest_todolist_if_any(todolists_user_data)
+        selected_todolist = todolists_user_data["selected_todolist"]
+    if selected_todolist:
+        tasks = user_dashboard.get_tasks_of_selected_todolist(selected_todolist)
+        todolists_user_data["todolists"][selected_todolist]["tasks"] = tasks
+    return todolists_user_data
+
+def add_user_with_lists_and_tasks(lists, tasks):
+    hashed = bcrypt.hashpw("1".encode(), bcrypt.gensalt(4))
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("INSERT INTO users (name, email, password, verified) \
+               VALUES ('Bench Mark', 'bench@fake.com', %s, true) RETURNING user_id", [hashed.decode()])
+            user_id = curs.fetchone().user_id
+            for n in range(lists):
+                curs.execute("INSERT INTO lists (title, user_id) VALUES (%s, %s) RETURNING list_id",
+                             [f"list {n}", user_id])
+                list_id = curs.fetchone().list_id
+                curs.execute("INSERT INTO tasks (task, list_id) \
+                   SELECT 'task ' || n, %s FROM generate_series(1, %s) AS n", [list_id, tasks])
+    return user_id
+
+def delete_user_with_lists_and_tasks(user_id):
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("DELETE FROM tasks WHERE list_id IN (SELECT list_id FROM lists WHERE user_id = %s)",
+                         [user_id])
+            curs.execute("DELETE FROM lists WHERE user_id = %s", [user_id])
+            curs.execute("DELETE FROM users WHERE user_id = %s", [user_id])
+
+def measure(loader, user_id, requests):
+    CountingConnection.queries = 0
+    CountingPool.transactions = 0
+    start = perf_counter()
+    for _ in range(requests):
+        loader(user_id)
+    elapsed = perf_counter() - start
+    return (CountingConnection.queries / requests, CountingPool.transactions / requests,
+            elapsed / requests * 1000)
+
+def bench_dashboard_queries(lists=20, tasks=100, requests=200):
+    db.conn = CountingPool(minconn=1, maxconn=1, timeout=5, check_after=30,
+                                **dict(db.conn.connect_kwargs, connection_factory=CountingConnection))
+    user_id = add_user_with_lists_and_tasks(lists, tasks)
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("ANALYZE users, lists, tasks")
+    try:
+        print(f"{lists} lists x {tasks} tasks, {requests} dashboard loads")
+        for name, loader in (("before", get_todolists_user_data_with_three_queries),
+                             ("after", user_dashboard.get_todolists_user_data)):
+            queries, transactions, ms = measure(loader, user_id, requests)
+            print(f"{name:>6}: {queries:.1f} queries/request, {transactions:.1f} transactions/request, "
+                  f"{ms:.3f} ms/request")
+    finally:
+        delete_user_with_lists_and_tasks(user_id)
+
+
+bench_dashboard_queries(*[int(arg) for arg in sys.argv[1:]])
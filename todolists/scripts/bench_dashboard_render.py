@@ -0,0 +1,43 @@
+import sys
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+from todolists import app
+from todolists.scripts.bench_fixtures import build_user_data
+
+
+def new_templates_env(**options):
+    templates_env = Environment(loader=FileSystemLoader("todolists/templates"), autoescape=True,
+                                trim_blocks=True, lstrip_blocks=True, **options)
+    templates_env.globals.update(app.templates_env.globals)
+    return templates_env
+
+def measure_render(get_template, user_data, requests):
+    start = perf_counter()
+    for _ in range(requests):
+        get_template().render(user=user_data)
+    return (perf_counter() - start) / requests * 1000
+
+def measure_warm_up(templates_env):
+    start = perf_counter()
+    for name in templates_env.list_templates(extensions=["html"]):
+        templates_env.get_template(name)
+    return (perf_counter() - start) * 1000
+
+def bench_dashboard_render(lists=20, tasks=100, requests=2000):
+    app.load_templates()
+    user_data = build_user_data(lists, tasks)
+    reloading_env = new_templates_env(auto_reload=True)
+    print(f"{lists} lists x {tasks} tasks, {requests} dashboard.html renders")
+    for name, get_template in (("before", lambda: reloading_env.get_template("dashboard.html")),
+                               ("after", lambda: app.templates["dashboard.html"])):
+        print(f"{name:>6}: {measure_render(get_template, user_data, requests):.3f} ms/render")
+    with TemporaryDirectory() as cache_dir:
+        cold = measure_warm_up(new_templates_env(bytecode_cache=FileSystemBytecodeCache(cache_dir)))
+        cached = measure_warm_up(new_templates_env(bytecode_cache=FileSystemBytecodeCache(cache_dir)))
+    print(f"worker boot: {cold:.1f} ms compiling all templates, {cached:.1f} ms from the bytecode cache")
+
+
+bench_dashboard_render(*[int(arg) for arg in sys.argv[1:]])
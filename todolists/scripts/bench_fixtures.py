@@ -0,0 +1,6 @@
+def build_user_data(lists, tasks):
+    # The dict render_dashboard hands to dashboard.html, with every task in the first list.
+    todolists = {list_id: {"title": f"list {list_id}", "tasks": {}} for list_id in range(1, lists + 1)}
+    todolists[1]["tasks"] = {task_id: {"task": f"task {task_id}", "done": task_id % 3 == 0}
+                             for task_id in range(1, tasks + 1)}
+    return {"author": "Bench Mark", "todolists": todolists, "selected_todolist": 1}
@@ -0,0 +1,273 @@
+import argparse
+import json
+import random
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.client import HTTPConnection
+from os import environ
+from secrets import token_hex
+from threading import local
+from time import perf_counter
+from urllib.parse import urlencode, urlsplit
+
+from falcon import testing
+
+# Settings are read when todolists is imported, so they have to be in place before it.
+# The in-process pool keeps InstrumentedConnection, so Server-Timing carries the SQL timings too.
+environ.setdefault("todolists_server_timing", "true")
+# Every scenario logs in or posts as a few users, the limits would turn most requests into 429s.
+environ.setdefault("todolists_rate_limiting", "false")
+
+from todolists import app, db, metrics, password_hashing, user_authorization
+
+
+EMAIL = "bench-{}@bench.todolists"
+PASSWORD = "bench-password"
+
+
+class InProcessClient:
+    def __init__(self):
+        self.client = testing.TestClient(app.create())
+
+    def request(self, method, path, params=None, cookies=None):
+        result = self.client.simulate_request(method, path, params=params, cookies=cookies)
+        return result.status_code
+
+    def count_queries(self):
+        # MetricsMiddleware adds up the SQL statements InstrumentedConnection timed for each request.
+        return sum(sample.value for metric in metrics.db_queries.collect() for sample in metric.samples
+                   if sample.name.endswith("_total"))
+
+
+class HTTPClient:
+    # One keep-alive connection per benchmark thread.
+    def __init__(self, url):
+        self.url = urlsplit(url)
+        self.local = local()
+
+    def request(self, method, path, params=None, cookies=None):
+        if not hasattr(self.local, "conn"):
+            self.local.conn = HTTPConnection(self.url.hostname, self.url.port or 80, timeout=30)
+        headers = {}
+        body = None
+        if cookies:
+            headers["Cookie"] = "; ".join(f"{name}={value}" for name, value in cookies.items())
+        if params and method == "GET":
+            path = f"{path}?{urlencode(params, doseq=True)}"
+        elif params:
+            body = urlencode(params, doseq=True)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        self.local.conn.request(method, path, body=body, headers=headers)
+        response = self.local.conn.getresponse()
+        response.read()
+        return response.status
+
+    def count_queries(self):
+        return None
+
+
+def seed(users, lists, tasks):
+    hashed = password_hashing.hash_password(PASSWORD).decode()
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("""
+                INSERT INTO users (name, email, password, verified)
+                SELECT 'Bench Mark', replace(%s, '{}', n::text), %s, true FROM generate_series(1, %s) AS n
+                RETURNING user_id, email""", [EMAIL, hashed, users])
+            seeded = {record.user_id: {"email": record.email, "lists": {}} for record in curs.fetchall()}
+            curs.execute("""
+                INSERT INTO lists (title, user_id)
+                SELECT 'list ' || n, user_id FROM unnest(%s) AS user_id, generate_series(1, %s) AS n
+                RETURNING list_id, user_id""", [list(seeded), lists])
+            for record in curs.fetchall():
+                seeded[record.user_id]["lists"][record.list_id] = []
+            curs.execute("""
+                INSERT INTO tasks (task, list_id)
+                SELECT 'task ' || n, list_id FROM unnest(%s) AS list_id, generate_series(1, %s) AS n
+                ORDER BY list_id, n
+                RETURNING task_id, list_id""",
+                [[list_id for user in seeded.values() for list_id in user["lists"]], tasks])
+            list_users = {list_id: user_id for user_id, user in seeded.items() for list_id in user["lists"]}
+            for record in curs.fetchall():
+                seeded[list_users[record.list_id]]["lists"][record.list_id].append(record.task_id)
+            curs.execute("ANALYZE users, lists, tasks")
+    for user_id, user in seeded.items():
+        user["session_token"] = token_hex(32)
+        user_authorization.set_session_token(user["session_token"], user_id)
+    return seeded
+
+def delete_seed():
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("DELETE FROM users WHERE email LIKE %s", [EMAIL.format("%")])
+
+def get_new_lists(seeded):
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("SELECT list_id, user_id FROM lists WHERE user_id = ANY(%s) AND title LIKE 'new list %%'",
+                         [list(seeded)])
+            return curs.fetchall()
+
+def build_scenarios(seeded, rng):
+    users = list(seeded.items())
+    tasks = [(user, list_id, task_id) for _, user in users
+             for list_id, task_ids in user["lists"].items() for task_id in task_ids]
+    rng.shuffle(tasks)
+    new_lists = []
+
+    def new_list(n):
+        # Lists made by the create_todolist scenario, read once it has run.
+        if not new_lists:
+            new_lists.extend(get_new_lists(seeded))
+        return new_lists[n % len(new_lists)]
+
+    def random_list():
+        user_id, user = rng.choice(users)
+        return user, rng.choice(list(user["lists"]))
+
+    def login(n):
+        user_id, user = rng.choice(users)
+        return "POST", "/login", {"email": user["email"], "password": PASSWORD}, None
+
+    def dashboard(n):
+        user_id, user = rng.choice(users)
+        return "GET", "/dashboard", None, {"session-token": user["session_token"]}
+
+    def get_todolist(n):
+        user, list_id = random_list()
+        return "GET", "/get-todolist", {"get-todolist": list_id}, {"session-token": user["session_token"]}
+
+    def create_task(n):
+        user, list_id = random_list()
+        return ("POST", "/create-task", {"selected-todolist": list_id, "create-task": f"new task {n}"},
+                {"session-token": user["session_token"]})
+
+    def update_task(n):
+        user, list_id, task_id = tasks[n % len(tasks)]
+        return ("POST", "/update-task", {"selected-todolist": list_id, "update-task": task_id, "mark-task": "true"},
+                {"session-token": user["session_token"]})
+
+    def delete_task(n):
+        # Every request deletes a different seeded task, so this scenario is capped at the seeded task count.
+        user, list_id, task_id = tasks[-1 - n]
+        return ("POST", "/delete-task", {"selected-todolist": list_id, "delete-task": task_id},
+                {"session-token": user["session_token"]})
+
+    def create_todolist(n):
+        user_id, user = users[n % len(users)]
+        return "POST", "/create-todolist", {"create-todolist": f"new list {n}"}, {"session-token": user["session_token"]}
+
+    def update_todolist(n):
+        list_id, user_id = new_list(n)
+        return ("POST", "/update-todolist", {"update-todolist": list_id, "change-todolist-title": f"new list {n}!"},
+                {"session-token": seeded[user_id]["session_token"]})
+
+    def delete_todolist(n):
+        list_id, user_id = new_list(n)
+        return "POST", "/delete-todolist", {"delete-todolist": list_id}, {"session-token": seeded[user_id]["session_token"]}
+
+    return {"login": login, "dashboard": dashboard, "get_todolist": get_todolist, "create_task": create_task,
+            "update_task": update_task, "delete_task": delete_task, "create_todolist": create_todolist,
+            "update_todolist": update_todolist, "delete_todolist": delete_todolist}
+
+def percentile(latencies, p):
+    return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))]
+
+def run_scenario(client, scenario, requests, concurrency):
+    # Requests are built up front so building them is not timed.
+    prepared = [scenario(n) for n in range(requests)]
+    queries = client.count_queries()
+
+    def send(request):
+        start = perf_counter()
+        status = client.request(*request)
+        return perf_counter() - start, status
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, prepared))
+    elapsed = perf_counter() - start
+    latencies = sorted(latency * 1000 for latency, _ in results)
+    return {
+        "requests": requests,
+        # A server started with rate limiting on still answers 429, those are not counted as errors.
+        "errors": sum(1 for _, status in results if status >= 400 and status != 429),
+        "throttled": sum(1 for _, status in results if status == 429),
+        "rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "queries_per_request": None if queries is None else round((client.count_queries() - queries) / requests, 2)
+    }
+
+def get_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+def load_previous(output, config):
+    try:
+        with open(output) as results_file:
+            runs = [json.loads(line) for line in results_file if line.strip()]
+    except FileNotFoundError:
+        return None
+    runs = [run for run in runs if run["config"] == config]
+    return runs[-1] if runs else None
+
+def print_results(results, previous):
+    print(f"{'scenario':>16} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8} {'errors':>7} "
+          f"{'429s':>6}")
+    for name, stats in results.items():
+        queries = "-" if stats["queries_per_request"] is None else f"{stats['queries_per_request']:.2f}"
+        line = (f"{name:>16} {stats['rps']:>9.1f} {stats['p50_ms']:>9.3f} {stats['p95_ms']:>9.3f} "
+                f"{stats['p99_ms']:>9.3f} {queries:>8} {stats['errors']:>7} {stats['throttled']:>6}")
+        if previous and name in previous["results"] and previous["results"][name]["p95_ms"]:
+            change = stats["p95_ms"] / previous["results"][name]["p95_ms"] - 1
+            line += f"   p95 {change:+.0%} vs {previous['commit']}"
+        print(line)
+
+def benchmark(args):
+    config = {"users": args.users, "lists": args.lists, "tasks": args.tasks, "requests": args.requests,
+              "concurrency": args.concurrency, "target": args.url or "in-process"}
+    if args.url:
+        client = HTTPClient(args.url)
+    else:
+        db.conn = db.ConnectionPool(minconn=1, maxconn=max(args.concurrency, 1), timeout=30, check_after=30,
+                                    **db.conn.connect_kwargs)
+        client = InProcessClient()
+    delete_seed()
+    seeded = seed(args.users, args.lists, args.tasks)
+    try:
+        scenarios = build_scenarios(seeded, random.Random(args.seed))
+        results = {}
+        for name in args.scenarios or scenarios:
+            requests = args.requests
+            if name == "delete_task":
+                requests = min(requests, args.users * args.lists * args.tasks)
+            results[name] = run_scenario(client, scenarios[name], requests, args.concurrency)
+    finally:
+        if not args.keep:
+            delete_seed()
+    previous = load_previous(args.output, config)
+    print(f"{args.users} users x {args.lists} lists x {args.tasks} tasks, {args.requests} requests per scenario, "
+          f"concurrency {args.concurrency}, {config['target']}")
+    print_results(results, previous)
+    with open(args.output, "a") as results_file:
+        results_file.write(json.dumps({"commit": get_commit(), "date": datetime.now(timezone.utc).isoformat(),
+                                       "config": config, "results": results}) + "\n")
+
+
+parser = argparse.ArgumentParser(description="Load test the TodoLists request path against local Postgres and Redis.")
+parser.add_argument("--users", type=int, default=50)
+parser.add_argument("--lists", type=int, default=5)
+parser.add_argument("--tasks", type=int, default=100)
+parser.add_argument("--requests", type=int, default=500)
+parser.add_argument("--concurrency", type=int, default=4)
+parser.add_argument("--seed", type=int, default=1)
+parser.add_argument("--url", help="benchmark a running server instead of the app in process, e.g. http://localhost:8000")
+parser.add_argument("--output", default="benchmark-results.jsonl")
+parser.add_argument("--keep", action="store_true", help="keep the seeded users after the run")
+parser.add_argument("scenarios", nargs="*")
+benchmark(parser.parse_args())
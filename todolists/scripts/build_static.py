@@ -0,0 +1,20 @@
+import sys
+from pathlib import Path
+
+from todolists import static_assets
+
+
+def build_static(source=None, target=None):
+    built = static_assets.build(source, target)
+    target = Path(target or static_assets.static_dir)
+    for name, fingerprinted in built.items():
+        sizes = [f"{(target/fingerprinted).stat().st_size} B"]
+        for encoding, suffix in static_assets.ENCODINGS.items():
+            if (target/(fingerprinted + suffix)).is_file():
+                sizes.append(f"{encoding} {(target/(fingerprinted + suffix)).stat().st_size} B")
+        print(f"{name} -> {fingerprinted} ({', '.join(sizes)})")
+    if not static_assets.brotli:
+        print("brotli is not installed, only gzip variants were written")
+
+
+build_static(*sys.argv[1:])
@@ -0,0 +1,4 @@
+from todolists import app, email_queue
+
+
+email_queue.run_worker()
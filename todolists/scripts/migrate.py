@@ -0,0 +1,14 @@
+import sys
+
+from todolists import migrations
+
+
+def migrate(target=None):
+    migrated = migrations.migrate(target)
+    for name in migrated:
+        print(f"applied {name}")
+    if not migrated:
+        print("database schema is up to date")
+
+
+migrate(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,132 @@
+import gzip
+import json
+import mimetypes
+from datetime import datetime, timezone
+from hashlib import sha1
+from os import environ
+from pathlib import Path
+
+import falcon
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+public_dir = Path(environ.get("todolists_public_dir", "todolists/public"))
+static_dir = Path(environ.get("todolists_static_dir", "todolists/static"))
+max_age = int(environ.get("todolists_static_max_age", 31536000))
+
+MANIFEST_NAME = "manifest.json"
+COMPRESSIBLE_SUFFIXES = {".css", ".html", ".js", ".json", ".svg", ".txt"}
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+
+manifest = {}
+files = {}
+
+
+def fingerprint(path):
+    digest = sha1(path.read_bytes()).hexdigest()[:10]
+    return f"{path.stem}.{digest}{path.suffix}"
+
+def compress(data):
+    variants = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli:
+        variants["br"] = brotli.compress(data, quality=11)
+    return variants
+
+def build(source=None, target=None):
+    source, target = Path(source or public_dir), Path(target or static_dir)
+    target.mkdir(parents=True, exist_ok=True)
+    built = {}
+    for path in sorted(source.iterdir()):
+        if not path.is_file():
+            continue
+        name = fingerprint(path)
+        data = path.read_bytes()
+        (target/name).write_bytes(data)
+        if path.suffix in COMPRESSIBLE_SUFFIXES:
+            for encoding, compressed in compress(data).items():
+                # Keep a variant only when it saves bytes, tiny SVGs can grow.
+                if len(compressed) < len(data):
+                    (target/(name + ENCODINGS[encoding])).write_bytes(compressed)
+        built[path.name] = name
+    (target/MANIFEST_NAME).write_text(json.dumps(built, indent=2, sort_keys=True))
+    return built
+
+def load_manifest(target=None):
+    target = Path(target or static_dir)
+    manifest.clear()
+    files.clear()
+    if not (target/MANIFEST_NAME).is_file():
+        return manifest
+    manifest.update(json.loads((target/MANIFEST_NAME).read_text()))
+    # Files from older builds stay servable, pages cached before a deploy still point at them.
+    for path in target.iterdir():
+        if path.name == MANIFEST_NAME or path.suffix in ENCODINGS.values():
+            continue
+        files[path.name] = {"identity": path}
+        for encoding, suffix in ENCODINGS.items():
+            variant = target/(path.name + suffix)
+            if variant.is_file():
+                files[path.name][encoding] = variant
+    return manifest
+
+def asset_url(name):
+    if name in manifest:
+        return f"/static/{manifest[name]}"
+    return f"/public/{name}"
+
+def get_accepted_encodings(req):
+    accepted = set()
+    for part in (req.get_header("Accept-Encoding") or "").split(","):
+        encoding, _, params = part.partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q=") and params[2:].strip("0.") == "":
+            continue
+        accepted.add(encoding.strip().lower())
+    return accepted
+
+def choose_encoding(req, variants):
+    accepted = get_accepted_encodings(req)
+    for encoding in ENCODINGS:
+        if encoding in variants and (encoding in accepted or "*" in accepted):
+            return encoding
+    return "identity"
+
+
+class StaticAssets:
+    def on_get(self, req, resp, name):
+        path = self.prepare(req, resp, name)
+        if path is not None:
+            resp.stream = open(path, "rb")
+            resp.content_length = path.stat().st_size
+
+    def prepare(self, req, resp, name):
+        variants = files.get(name)
+        if variants is None:
+            raise falcon.HTTPNotFound()
+        encoding = choose_encoding(req, variants)
+        path = variants[encoding]
+        stat = path.stat()
+        etag = name if encoding == "identity" else f"{name}-{encoding}"
+        resp.content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        resp.cache_control = ["public", f"max-age={max_age}", "immutable"]
+        resp.vary = ["Accept-Encoding"]
+        resp.etag = etag
+        last_modified = datetime.fromtimestamp(int(stat.st_mtime), timezone.utc)
+        resp.last_modified = last_modified
+        if req.if_none_match is not None:
+            not_modified = any(match in ("*", etag) for match in req.if_none_match)
+        elif req.if_modified_since is not None:
+            not_modified = req.if_modified_since.replace(tzinfo=timezone.utc) >= last_modified
+        else:
+            not_modified = False
+        if not_modified:
+            resp.status = falcon.HTTP_304
+            resp.content_type = None
+            return None
+        if encoding != "identity":
+            resp.set_header("Content-Encoding", encoding)
+        return path
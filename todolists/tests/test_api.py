@@ -0,0 +1,142 @@
+from secrets import token_hex
+from unittest.mock import patch
+
+import bcrypt
+from falcon import testing, HTTP_200, HTTP_201, HTTP_401, HTTP_404, HTTP_409, HTTP_422
+
+from todolists import app, db, redis_conn, user_dashboard, user_tasks, user_todolists
+
+
+class TestJSONAPI(testing.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.user_id = add_verified_user("john12@fake.com")
+        cls.other_user_id = add_verified_user("clark6@fake.com")
+        cls.session_token = token_hex(32)
+        set_session_token_on_redis(cls.session_token, cls.user_id)
+
+    @classmethod
+    def tearDownClass(cls):
+        flushall_from_redis()
+        truncate_users()
+
+    def setUp(self):
+        super().setUp()
+        self.app = app.create()
+        self.cookies = {"session-token": self.session_token}
+        truncate_lists()
+
+    def test_api_requires_session_token(self):
+        result = self.simulate_get("/api/v1/lists")
+        self.assertEqual(result.status, HTTP_401)
+        self.assertEqual(result.json["description"], "Bad token.")
+
+    def test_api_accepts_session_token_as_bearer_token(self):
+        result = self.simulate_get("/api/v1/lists", headers={"Authorization": f"Bearer {self.session_token}"})
+        self.assertEqual(result.status, HTTP_200)
+        self.assertEqual(result.json, {"lists": []})
+
+    def test_api_creates_and_lists_todolists(self):
+        result = self.simulate_post("/api/v1/lists", cookies=self.cookies, json={"title": "Market"})
+        self.assertEqual(result.status, HTTP_201)
+        list_id = result.json["id"]
+        self.assertEqual(result.json, {"id": list_id, "title": "Market"})
+        self.assertEqual(result.headers["location"], f"/api/v1/lists/{list_id}")
+        user_todolists.create_todolist(self.other_user_id, "Gym")
+        result = self.simulate_get("/api/v1/lists", cookies=self.cookies)
+        self.assertEqual(result.json, {"lists": [{"id": list_id, "title": "Market"}]})
+
+    def test_api_rejects_duplicate_and_invalid_titles(self):
+        self.simulate_post("/api/v1/lists", cookies=self.cookies, json={"title": "Market"})
+        result = self.simulate_post("/api/v1/lists", cookies=self.cookies, json={"title": "Market"})
+        self.assertEqual(result.status, HTTP_409)
+        result = self.simulate_post("/api/v1/lists", cookies=self.cookies, json={"title": "x" * 51})
+        self.assertEqual(result.status, HTTP_422)
+
+    def test_api_renames_and_deletes_todolist(self):
+        list_id = user_todolists.create_todolist(self.user_id, "Market")
+        result = self.simulate_patch(f"/api/v1/lists/{list_id}", cookies=self.cookies, json={"title": "Groceries"})
+        self.assertEqual(result.json, {"id": list_id, "title": "Groceries"})
+        result = self.simulate_delete(f"/api/v1/lists/{list_id}", cookies=self.cookies)
+        self.assertEqual(result.json, {"id": list_id})
+        result = self.simulate_get(f"/api/v1/lists/{list_id}", cookies=self.cookies)
+        self.assertEqual(result.status, HTTP_404)
+
+    def test_api_hides_other_users_todolists(self):
+        list_id = user_todolists.create_todolist(self.other_user_id, "Gym")
+        task_id = user_tasks.create_task_in_todolist(list_id, "wrestling")
+        self.assertEqual(self.simulate_get(f"/api/v1/lists/{list_id}", cookies=self.cookies).status, HTTP_404)
+        self.assertEqual(self.simulate_get(f"/api/v1/lists/{list_id}/tasks", cookies=self.cookies).status, HTTP_404)
+        result = self.simulate_post(f"/api/v1/lists/{list_id}/tasks", cookies=self.cookies, json={"task": "run"})
+        self.assertEqual(result.status, HTTP_404)
+        result = self.simulate_patch(f"/api/v1/lists/{list_id}/tasks/{task_id}", cookies=self.cookies,
+                                     json={"done": True})
+        self.assertEqual(result.status, HTTP_404)
+        result = self.simulate_delete(f"/api/v1/lists/{list_id}", cookies=self.cookies)
+        self.assertEqual(result.status, HTTP_404)
+        self.assertEqual(user_dashboard.get_tasks_page(self.other_user_id, list_id)[0],
+                         {task_id: {"task": "wrestling", "done": False}})
+
+    def test_api_creates_task_with_one_query_and_no_rendering(self):
+        list_id = user_todolists.create_todolist(self.user_id, "Market")
+        with patch.object(db.conn, "getconn", wraps=db.conn.getconn) as getconn, \
+             patch.object(app.templates["dashboard.html"], "render") as render:
+            result = self.simulate_post(f"/api/v1/lists/{list_id}/tasks", cookies=self.cookies,
+                                        json={"task": "5 beers"})
+        self.assertEqual(result.status, HTTP_201)
+        self.assertEqual(result.json, {"id": result.json["id"], "list_id": list_id, "task": "5 beers", "done": False})
+        self.assertEqual(getconn.call_count, 1)
+        render.assert_not_called()
+
+    def test_api_updates_and_deletes_task(self):
+        list_id = user_todolists.create_todolist(self.user_id, "Market")
+        task_id = user_tasks.create_task_in_todolist(list_id, "5 beers")
+        url = f"/api/v1/lists/{list_id}/tasks/{task_id}"
+        result = self.simulate_patch(url, cookies=self.cookies, json={"done": True})
+        self.assertEqual(result.json, {"id": task_id, "list_id": list_id, "task": "5 beers", "done": True})
+        result = self.simulate_patch(url, cookies=self.cookies, json={"task": "6 beers"})
+        self.assertEqual(result.json, {"id": task_id, "list_id": list_id, "task": "6 beers", "done": True})
+        result = self.simulate_patch(url, cookies=self.cookies, json={"done": "yes"})
+        self.assertEqual(result.status, HTTP_422)
+        result = self.simulate_delete(url, cookies=self.cookies)
+        self.assertEqual(result.json, {"id": task_id, "list_id": list_id, "task": "6 beers", "done": True})
+        self.assertEqual(self.simulate_delete(url, cookies=self.cookies).status, HTTP_404)
+
+    def test_api_pages_through_tasks(self):
+        list_id = user_todolists.create_todolist(self.user_id, "Market")
+        task_ids = [user_tasks.create_task_in_todolist(list_id, f"{n} beers") for n in range(3)]
+        with patch.object(user_dashboard, "tasks_page_size", 2):
+            first = self.simulate_get(f"/api/v1/lists/{list_id}/tasks", cookies=self.cookies).json
+            second = self.simulate_get(f"/api/v1/lists/{list_id}/tasks", cookies=self.cookies,
+                                       params={"after": first["next_page"]}).json
+        self.assertEqual([task["id"] for task in first["tasks"]], task_ids[:2])
+        self.assertEqual(second, {"tasks": [{"id": task_ids[2], "list_id": list_id, "task": "2 beers", "done": False}],
+                                  "next_page": None})
+
+
+def add_verified_user(email):
+    hashed = bcrypt.hashpw("123abc-".encode(), bcrypt.gensalt(4))
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("INSERT INTO users (name, email, password, verified) \
+               VALUES ('John Smith', %s, %s, true) RETURNING user_id", [email, hashed.decode()])
+            return str(curs.fetchone().user_id)
+
+def set_session_token_on_redis(session_token, user_id):
+    with redis_conn.session_conn as conn:
+        conn.set(session_token, user_id)
+
+def truncate_users():
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("TRUNCATE users CASCADE")
+
+def truncate_lists():
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("TRUNCATE lists CASCADE")
+
+def flushall_from_redis():
+    with redis_conn.session_conn as conn:
+        conn.flushall()
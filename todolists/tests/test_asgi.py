@@ -0,0 +1,176 @@
+import asyncio
+import gzip
+from secrets import token_hex
+from tempfile import TemporaryDirectory
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+import bcrypt
+from falcon import testing, HTTP_200, HTTP_201, HTTP_304, HTTP_400, HTTP_404, HTTP_409
+
+from todolists import (app, asgi, db, metrics, redis_conn, static_assets, user_dashboard, user_profiles, user_tasks,
+                       user_todolists)
+
+
+class TestASGIApp(IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.user_id = add_verified_user("john12@fake.com")
+        cls.session_token = token_hex(32)
+        set_session_token_on_redis(cls.session_token, cls.user_id)
+
+    @classmethod
+    def tearDownClass(cls):
+        flushall_from_redis()
+        truncate_users()
+
+    async def asyncSetUp(self):
+        truncate_lists()
+        user_dashboard.dashboard_cache.clear()
+        user_profiles.invalidate_profile(self.user_id)
+        self.cookies = {"session-token": self.session_token}
+        self.conductor = testing.ASGIConductor(app.create_asgi())
+        await self.conductor.__aenter__()
+
+    async def asyncTearDown(self):
+        await self.conductor.__aexit__(None, None, None)
+
+    async def test_dashboard_matches_wsgi_render(self):
+        list_id = user_todolists.create_todolist(self.user_id, "Market")
+        user_tasks.create_task_in_todolist(list_id, "5 beers")
+        result = await self.conductor.simulate_get("/dashboard", cookies=self.cookies)
+        self.assertEqual(result.status, HTTP_200)
+        user_data = user_dashboard.get_todolists_user_data(self.user_id)
+        self.assertEqual(result.text, app.templates["dashboard.html"].render(user=user_data))
+
+    async def test_dashboard_is_not_modified_on_matching_etag(self):
+        etag = (await self.conductor.simulate_get("/dashboard", cookies=self.cookies)).headers["etag"]
+        result = await self.conductor.simulate_get("/dashboard", cookies=self.cookies,
+                                                   headers={"If-None-Match": etag})
+        self.assertEqual(result.status, HTTP_304)
+
+    async def test_form_posts_write_through_async_drivers(self):
+        result = await self.conductor.simulate_post("/create-todolist", cookies=self.cookies,
+                                                    params={"create-todolist": "Market"})
+        self.assertIn("Market's tasks", result.text)
+        list_id = user_todolists.get_todolists_of_user(self.user_id)[0].list_id
+        result = await self.conductor.simulate_post("/create-tasks", cookies=self.cookies,
+                                                    params={"selected-todolist": list_id,
+                                                            "create-tasks": "5 beers\nwine"})
+        self.assertIn("5 beers", result.text)
+        self.assertIn("wine", result.text)
+        task_ids = list(user_dashboard.get_tasks_page(self.user_id, list_id)[0])
+        await self.conductor.simulate_post("/update-tasks", cookies=self.cookies,
+                                           params={"selected-todolist": list_id, "task-ids": task_ids})
+        tasks = user_dashboard.get_tasks_page(self.user_id, list_id)[0]
+        self.assertTrue(all(task["done"] for task in tasks.values()))
+        await self.conductor.simulate_post("/delete-task", cookies=self.cookies,
+                                           params={"selected-todolist": list_id, "delete-task": task_ids[0]})
+        self.assertEqual(list(user_dashboard.get_tasks_page(self.user_id, list_id)[0]), task_ids[1:])
+        result = await self.conductor.simulate_post("/delete-todolist", cookies=self.cookies,
+                                                    params={"delete-todolist": list_id})
+        self.assertIn("You don't have any TodoLists yet!", result.text)
+
+    async def test_bulk_error_is_rendered(self):
+        list_id = user_todolists.create_todolist(self.user_id, "Market")
+        result = await self.conductor.simulate_post("/create-tasks", cookies=self.cookies,
+                                                    params={"selected-todolist": list_id, "create-tasks": "x" * 501})
+        self.assertEqual(result.status, HTTP_400)
+
+    async def test_json_api(self):
+        result = await self.conductor.simulate_post("/api/v1/lists", cookies=self.cookies, json={"title": "Market"})
+        self.assertEqual(result.status, HTTP_201)
+        list_id = result.json["id"]
+        result = await self.conductor.simulate_post("/api/v1/lists", cookies=self.cookies, json={"title": "Market"})
+        self.assertEqual(result.status, HTTP_409)
+        result = await self.conductor.simulate_post(f"/api/v1/lists/{list_id}/tasks", cookies=self.cookies,
+                                                    json={"task": "5 beers"})
+        task_id = result.json["id"]
+        result = await self.conductor.simulate_patch(f"/api/v1/lists/{list_id}/tasks/{task_id}",
+                                                     cookies=self.cookies, json={"done": True})
+        self.assertEqual(result.json, {"id": task_id, "list_id": list_id, "task": "5 beers", "done": True})
+        result = await self.conductor.simulate_get(f"/api/v1/lists/{list_id}/tasks", cookies=self.cookies)
+        self.assertEqual(result.json["tasks"], [{"id": task_id, "list_id": list_id, "task": "5 beers", "done": True}])
+
+    async def test_sync_resources_run_in_threads(self):
+        result = await self.conductor.simulate_post("/login", params={"email": "john12@fake.com",
+                                                                      "password": "123abc-"})
+        self.assertEqual(result.status, HTTP_200)
+        self.assertIn("session-token", result.cookies)
+        result = await self.conductor.simulate_get("/")
+        self.assertEqual(result.text, app.templates["index.html"].render())
+
+    async def test_concurrent_requests_share_one_event_loop(self):
+        list_id = user_todolists.create_todolist(self.user_id, "Market")
+        results = await asyncio.gather(*[
+            self.conductor.simulate_get("/get-tasks", cookies=self.cookies, params={"selected-todolist": list_id})
+            for _ in range(20)])
+        self.assertEqual({result.status for result in results}, {HTTP_200})
+        self.assertGreater(asgi.pool.get_size(), 0)
+
+    async def test_static_assets_and_compression(self):
+        with TemporaryDirectory() as static_dir:
+            manifest = static_assets.build(static_assets.public_dir, static_dir)
+            static_assets.load_manifest(static_dir)
+            try:
+                result = await self.conductor.simulate_get(f"/static/{manifest['base_style.css']}",
+                                                           headers={"Accept-Encoding": "gzip"})
+            finally:
+                static_assets.load_manifest()
+        self.assertEqual(gzip.decompress(result.content), (static_assets.public_dir/"base_style.css").read_bytes())
+        result = await self.conductor.simulate_get("/", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(gzip.decompress(result.content).decode(), app.templates["index.html"].render())
+
+    async def test_metrics_need_the_token(self):
+        with patch.object(metrics, "metrics_token", "secret-token"):
+            self.assertEqual((await self.conductor.simulate_get("/metrics")).status, HTTP_404)
+            result = await self.conductor.simulate_get("/metrics", headers={"Authorization": "Bearer secret-token"})
+        self.assertEqual(result.status, HTTP_200)
+
+    async def test_shared_queries_are_bound_by_name(self):
+        query, *args = asgi.bind(user_todolists.DELETE_TODOLIST_TASKS_QUERY,
+                                 {"user_id": 7, "list_id": 3, "batch_size": 10})
+        self.assertEqual(args, [3, 7, 10])
+        self.assertIn("list_id = $1 AND user_id = $2", query)
+        self.assertIn("LIMIT $3", query)
+
+    async def test_bulk_and_api_helpers_match_the_wsgi_ones(self):
+        user_id = int(self.user_id)
+        list_id = await asgi.create_todolist(user_id, "Market")
+        task_ids = await asgi.create_tasks_of_user(user_id, list_id, ["5 beers", "wine"])
+        self.assertEqual(await asgi.mark_tasks_of_user(user_id, list_id, task_ids, True), 2)
+        record = await asgi.update_task_of_user(user_id, list_id, task_ids[0], task="6 beers")
+        self.assertEqual((record.task, record.done), ("6 beers", True))
+        self.assertEqual(user_dashboard.get_tasks_page(self.user_id, list_id),
+                         await asgi.get_tasks_page(user_id, list_id))
+        self.assertEqual(await asgi.delete_tasks_of_user(user_id, list_id, task_ids), 2)
+        self.assertTrue(await asgi.delete_todolist(user_id, list_id))
+        self.assertEqual(user_todolists.get_todolists_of_user(self.user_id), [])
+
+
+def add_verified_user(email):
+    hashed = bcrypt.hashpw("123abc-".encode(), bcrypt.gensalt(4))
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("INSERT INTO users (name, email, password, verified) \
+               VALUES ('John Smith', %s, %s, true) RETURNING user_id", [email, hashed.decode()])
+            return str(curs.fetchone().user_id)
+
+def set_session_token_on_redis(session_token, user_id):
+    with redis_conn.session_conn as conn:
+        conn.set(session_token, user_id)
+
+def truncate_users():
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("TRUNCATE users CASCADE")
+
+def truncate_lists():
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("TRUNCATE lists CASCADE")
+
+def flushall_from_redis():
+    with redis_conn.session_conn as conn:
+        conn.flushall()
@@ -0,0 +1,90 @@
+import gzip
+import io
+from unittest.mock import patch
+
+import falcon
+from falcon import testing
+
+from todolists import app, compression
+
+
+PAGE = "<li>buy 5 beers</li>\n" * 200
+
+
+class Page:
+    def on_get(self, req, resp):
+        resp.content_type = req.get_param("type", default="text/html")
+        resp.text = PAGE[:req.get_param_as_int("size", default=len(PAGE))]
+        resp.etag = "v1"
+
+    def on_get_media(self, req, resp):
+        resp.media = {"tasks": [PAGE]}
+
+    def on_get_stream(self, req, resp):
+        resp.content_type = "text/css"
+        resp.stream = io.BytesIO(PAGE.encode())
+        resp.content_length = len(PAGE)
+
+    def on_get_encoded(self, req, resp):
+        resp.content_type = "text/css"
+        resp.set_header("Content-Encoding", "gzip")
+        resp.data = gzip.compress(PAGE.encode())
+
+
+class TestCompression(testing.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.app = falcon.App(middleware=[compression.CompressionMiddleware()])
+        page = Page()
+        self.app.add_route("/page", page)
+        self.app.add_route("/media", page, suffix="media")
+        self.app.add_route("/stream", page, suffix="stream")
+        self.app.add_route("/encoded", page, suffix="encoded")
+        self.gzip = {"Accept-Encoding": "gzip, deflate"}
+
+    def test_html_is_gzipped_when_accepted(self):
+        result = self.simulate_get("/page", headers=self.gzip)
+        self.assertEqual(result.headers["content-encoding"], "gzip")
+        self.assertEqual(result.headers["vary"], "Accept-Encoding")
+        self.assertEqual(result.headers["etag"], 'W/"v1"')
+        self.assertLess(len(result.content), len(PAGE) / 10)
+        self.assertEqual(gzip.decompress(result.content).decode(), PAGE)
+
+    def test_response_is_left_alone_when_compression_is_not_accepted(self):
+        for headers in ({}, {"Accept-Encoding": "gzip;q=0"}, {"Accept-Encoding": "identity"}):
+            result = self.simulate_get("/page", headers=headers)
+            self.assertNotIn("content-encoding", result.headers)
+            self.assertEqual(result.text, PAGE)
+
+    def test_small_bodies_and_other_content_types_are_not_compressed(self):
+        result = self.simulate_get("/page", headers=self.gzip, params={"size": compression.min_size - 1})
+        self.assertNotIn("content-encoding", result.headers)
+        result = self.simulate_get("/page", headers=self.gzip, params={"type": "image/jpeg"})
+        self.assertNotIn("content-encoding", result.headers)
+        self.assertEqual(result.text, PAGE)
+
+    def test_media_is_compressed(self):
+        result = self.simulate_get("/media", headers=self.gzip)
+        self.assertEqual(result.headers["content-encoding"], "gzip")
+        self.assertIn(b"buy 5 beers", gzip.decompress(result.content))
+
+    def test_streams_and_large_bodies_are_compressed_in_chunks(self):
+        with patch.object(compression, "chunk_size", 1024):
+            result = self.simulate_get("/stream", headers=self.gzip)
+            self.assertNotIn("content-length", result.headers)
+            self.assertEqual(gzip.decompress(result.content).decode(), PAGE)
+            with patch.object(compression, "stream_size", 2048):
+                with patch.object(compression, "compress", side_effect=AssertionError("buffered")):
+                    result = self.simulate_get("/page", headers=self.gzip)
+        self.assertEqual(gzip.decompress(result.content).decode(), PAGE)
+
+    def test_encoded_response_is_not_compressed_twice(self):
+        result = self.simulate_get("/encoded", headers=self.gzip)
+        self.assertEqual(gzip.decompress(result.content).decode(), PAGE)
+
+    def test_app_compresses_rendered_pages(self):
+        client = testing.TestClient(app.create())
+        result = client.simulate_get("/", headers=self.gzip)
+        self.assertEqual(result.headers["content-encoding"], "gzip")
+        self.assertEqual(gzip.decompress(result.content).decode(), app.templates["index.html"].render())
@@ -0,0 +1,77 @@
+from threading import Thread
+
+from falcon import testing
+
+from todolists import db
+
+
+class TestConnectionPool(testing.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.pool = db.ConnectionPool(minconn=1, maxconn=2, timeout=0.2, check_after=0,
+                                      **db.conn.connect_kwargs)
+
+    def tearDown(self):
+        self.pool.closeall()
+
+    def test_pool_opens_minconn_connections_on_creation(self):
+        self.assertEqual(len(self.pool._idle), 1)
+        self.assertEqual(self.pool._size, 1)
+
+    def test_pool_returns_connection_after_with_block(self):
+        with self.pool as conn:
+            with conn.cursor() as curs:
+                curs.execute("SELECT 1 AS one")
+                self.assertEqual(curs.fetchone().one, 1)
+            self.assertEqual(len(self.pool._idle), 0)
+        self.assertEqual(len(self.pool._idle), 1)
+
+    def test_pool_supports_nested_with_blocks_in_same_thread(self):
+        with self.pool as conn_1:
+            with self.pool as conn_2:
+                self.assertIsNot(conn_1, conn_2)
+        self.assertEqual(len(self.pool._idle), 2)
+
+    def test_pool_raises_timeout_error_when_exhausted(self):
+        conn_1 = self.pool.getconn()
+        conn_2 = self.pool.getconn()
+        with self.assertRaises(db.PoolTimeoutError) as error:
+            self.pool.getconn()
+        self.assertEqual(error.exception.message, "No database connection available.")
+        self.pool.putconn(conn_1)
+        self.pool.putconn(conn_2)
+
+    def test_pool_hands_connection_to_waiting_thread(self):
+        conn = self.pool.getconn()
+        other = self.pool.getconn()
+        checked_out = []
+        waiting = Thread(target=lambda: checked_out.append(self.pool.getconn()))
+        waiting.start()
+        self.pool.putconn(conn)
+        waiting.join()
+        self.assertIs(checked_out[0], conn)
+        self.pool.putconn(checked_out[0])
+        self.pool.putconn(other)
+
+    def test_pool_reconnects_when_idle_connection_is_broken(self):
+        conn = self.pool.getconn()
+        self.pool.putconn(conn)
+        conn.close()
+        with self.pool as new_conn:
+            with new_conn.cursor() as curs:
+                curs.execute("SELECT 1 AS one")
+                self.assertEqual(curs.fetchone().one, 1)
+        self.assertIsNot(conn, new_conn)
+        self.assertEqual(self.pool._size, 1)
+
+    def test_pool_discards_connection_broken_inside_with_block(self):
+        with self.assertRaises(db.psycopg2.OperationalError):
+            with self.pool as conn:
+                with conn.cursor() as curs:
+                    curs.execute("SELECT pg_terminate_backend(pg_backend_pid())")
+        self.assertEqual(self.pool._size, 0)
+        with self.pool as conn:
+            with conn.cursor() as curs:
+                curs.execute("SELECT 1 AS one")
+                self.assertEqual(curs.fetchone().one, 1)
@@ -0,0 +1,234 @@
+import json
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+from threading import Thread
+from time import sleep, perf_counter
+from unittest.mock import patch
+
+from falcon import testing
+
+from todolists import app, db, email_queue, email_server, redis_conn, user_registration
+
+
+class FakeSMTPHandler(StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 localhost fake SMTP")
+        while True:
+            line = self.rfile.readline().decode().strip()
+            command = line.split(" ")[0].upper()
+            if command in ("EHLO", "HELO"):
+                self.reply("250-localhost")
+                self.reply("250 AUTH PLAIN")
+            elif command == "AUTH":
+                self.reply("235 Authentication successful")
+            elif command == "MAIL" and self.server.refusals > 0:
+                self.server.refusals -= 1
+                self.reply("451 Try again later")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    data_line = self.rfile.readline()
+                    if data_line in (b".\r\n", b""):
+                        break
+                    data.append(data_line.decode())
+                self.server.messages.append("".join(data))
+                self.reply("250 OK")
+                if self.server.drop_connections:
+                    break
+            elif command == "QUIT" or not line:
+                self.reply("221 Bye")
+                break
+            else:
+                self.reply("250 OK")
+
+
+class FakeSMTPServer(ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("localhost", 0), FakeSMTPHandler)
+        self.connections = 0
+        self.refusals = 0
+        self.drop_connections = False
+        self.messages = []
+
+
+class TestEmailDelivery(testing.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.app = app.create()
+        self.smtp = FakeSMTPServer()
+        Thread(target=self.smtp.serve_forever, daemon=True).start()
+        self.patches = [patch.object(email_server, "smtp_host", "localhost"),
+                        patch.object(email_server, "smtp_port", self.smtp.server_address[1]),
+                        patch.object(email_server, "smtp_starttls", False),
+                        patch.object(email_queue, "backoff", 0.05)]
+        for started in self.patches:
+            started.start()
+
+    def tearDown(self):
+        email_queue.outbox.join()
+        email_server.pool.closeall()
+        for started in self.patches:
+            started.stop()
+        self.smtp.shutdown()
+        self.smtp.server_close()
+        with redis_conn.conn as conn:
+            conn.flushall()
+        with db.conn as conn:
+            with conn.cursor() as curs:
+                curs.execute("TRUNCATE users CASCADE;")
+
+    def test_enqueued_message_is_delivered_by_background_worker(self):
+        email_queue.enqueue("john12@fake.com", "Subject: hi\r\n\r\n111111")
+        email_queue.outbox.join()
+        self.assertEqual(len(self.smtp.messages), 1)
+        self.assertIn("111111", self.smtp.messages[0])
+
+    def test_batch_of_messages_is_sent_over_one_smtp_session(self):
+        messages = [(f"user{n}@fake.com", f"Subject: hi\r\n\r\n{n}") for n in range(3)]
+        batch = [{"to": to, "message": message, "attempts": 0} for to, message in messages]
+        self.assertEqual(email_queue.deliver(batch), [])
+        self.assertEqual(len(self.smtp.messages), 3)
+        self.assertEqual(self.smtp.connections, 1)
+
+    def test_refused_message_is_retried_with_backoff(self):
+        self.smtp.refusals = 1
+        sent = email_queue.get_metrics()["sent"]
+        retried = email_queue.get_metrics()["retried"]
+        email_queue.enqueue("john12@fake.com", "Subject: hi\r\n\r\n111111")
+        for _ in range(50):
+            if self.smtp.messages:
+                break
+            sleep(0.02)
+        email_queue.outbox.join()
+        self.assertEqual(len(self.smtp.messages), 1)
+        self.assertEqual(email_queue.get_metrics()["retried"], retried + 1)
+        self.assertEqual(email_queue.get_metrics()["sent"], sent + 1)
+
+    def test_unexpected_error_is_retried_without_killing_the_worker(self):
+        with patch.object(email_server, "get_credentials", side_effect=[KeyError("todolists_email_and_password"),
+                                                                         ["john", "secret"]]):
+            email_queue.enqueue("john12@fake.com", "Subject: hi\r\n\r\n111111")
+            for _ in range(50):
+                if self.smtp.messages:
+                    break
+                sleep(0.02)
+            email_queue.outbox.join()
+        self.assertEqual(len(self.smtp.messages), 1)
+        email_queue.enqueue("john12@fake.com", "Subject: hi\r\n\r\n222222")
+        email_queue.outbox.join()
+        self.assertEqual(len(self.smtp.messages), 2)
+
+    def test_worker_is_restarted_after_it_dies(self):
+        with patch.object(email_queue, "deliver", side_effect=SystemExit):
+            email_queue.enqueue("john12@fake.com", "Subject: hi\r\n\r\n111111")
+            email_queue.outbox.join()
+            for _ in range(50):
+                if email_queue.worker_pid is None:
+                    break
+                sleep(0.02)
+        self.assertIsNone(email_queue.worker_pid)
+        email_queue.enqueue("john12@fake.com", "Subject: hi\r\n\r\n222222")
+        email_queue.outbox.join()
+        self.assertEqual(len(self.smtp.messages), 1)
+        self.assertIn("222222", self.smtp.messages[0])
+
+    def test_message_is_dropped_after_max_attempts(self):
+        failed = email_queue.get_metrics()["failed"]
+        message = {"to": "john12@fake.com", "message": "111111", "attempts": email_queue.max_attempts - 1}
+        email_queue.retry_later(message)
+        self.assertEqual(email_queue.get_metrics()["failed"], failed + 1)
+
+    def test_registration_returns_before_email_is_sent(self):
+        user_info = {
+            "name": "John Smith",
+            "email": "john12@fake.com",
+            "password_1": "abc123-",
+            "password_2": "abc123-"
+        }
+        def slow_connect_server(connect_server=email_server.connect_server):
+            sleep(1)
+            return connect_server()
+        with patch.object(email_server, "connect_server", slow_connect_server):
+            start = perf_counter()
+            self.simulate_post("/register", params=user_info)
+            elapsed = perf_counter() - start
+            self.assertLess(elapsed, 1)
+            self.assertEqual(self.smtp.messages, [])
+            email_queue.outbox.join()
+        self.assertEqual(len(self.smtp.messages), 1)
+
+    def test_redis_backend_delivers_messages_pushed_by_web_process(self):
+        with patch.object(email_queue, "backend", "redis"):
+            email_queue.enqueue("john12@fake.com", "Subject: hi\r\n\r\n111111")
+            email_queue.enqueue("clark6@fake.com", "Subject: hi\r\n\r\n222222")
+            self.assertEqual(email_queue.get_metrics()["queued"], 2)
+            self.assertEqual(email_queue.work_on_redis_outbox(timeout=1), 2)
+            self.assertEqual(email_queue.get_metrics()["sent"], 2)
+        self.assertEqual(self.smtp.connections, 1)
+        self.assertIn("111111", self.smtp.messages[0])
+        self.assertIn("222222", self.smtp.messages[1])
+
+    def test_redis_backend_requeues_refused_message_when_due(self):
+        self.smtp.refusals = 1
+        with patch.object(email_queue, "backend", "redis"):
+            email_queue.enqueue("john12@fake.com", "Subject: hi\r\n\r\n111111")
+            email_queue.work_on_redis_outbox(timeout=1)
+            self.assertEqual(self.smtp.messages, [])
+            with redis_conn.conn as conn:
+                retry = json.loads(conn.zrange(email_queue.RETRIES_KEY, 0, -1)[0])
+            self.assertEqual(retry["attempts"], 1)
+            sleep(0.1)
+            email_queue.work_on_redis_outbox(timeout=1)
+        self.assertEqual(len(self.smtp.messages), 1)
+
+    def test_smtp_connection_is_kept_alive_between_messages(self):
+        email_server.send_mail("john12@fake.com", "Subject: hi\r\n\r\n111111")
+        email_server.send_mail("clark6@fake.com", "Subject: hi\r\n\r\n222222")
+        self.assertEqual(len(self.smtp.messages), 2)
+        self.assertEqual(self.smtp.connections, 1)
+
+    def test_smtp_connection_is_replaced_after_max_messages(self):
+        with patch.object(email_server.pool, "max_messages", 2):
+            for n in range(5):
+                email_server.send_mail("john12@fake.com", f"Subject: hi\r\n\r\n{n}")
+        self.assertEqual(len(self.smtp.messages), 5)
+        self.assertEqual(self.smtp.connections, 3)
+
+    def test_smtp_pool_gives_up_when_every_connection_is_held(self):
+        with patch.object(email_server.pool, "size", 1), patch.object(email_server.pool, "timeout", 0.1):
+            with email_server.pool:
+                start = perf_counter()
+                with self.assertRaises(email_server.SendingEmailError):
+                    email_server.pool.getconn()
+                self.assertLess(perf_counter() - start, 1)
+                batch = [{"to": "john12@fake.com", "message": "Subject: hi\r\n\r\n111111", "attempts": 0}]
+                self.assertEqual(email_queue.deliver(batch), batch)
+        self.assertEqual(email_server.pool._open, 1)
+
+    def test_idle_smtp_connection_is_checked_with_noop_and_replaced_when_dead(self):
+        self.smtp.drop_connections = True
+        email_server.send_mail("john12@fake.com", "Subject: hi\r\n\r\n111111")
+        self.smtp.drop_connections = False
+        sleep(0.1)
+        with patch.object(email_server.pool, "check_after", 0):
+            email_server.send_mail("clark6@fake.com", "Subject: hi\r\n\r\n222222")
+        self.assertEqual(len(self.smtp.messages), 2)
+        self.assertEqual(self.smtp.connections, 2)
+
+    def test_message_is_resent_on_new_connection_when_server_disconnected(self):
+        self.smtp.drop_connections = True
+        email_server.send_mail("john12@fake.com", "Subject: hi\r\n\r\n111111")
+        self.smtp.drop_connections = False
+        sleep(0.1)
+        email_server.send_mail("clark6@fake.com", "Subject: hi\r\n\r\n222222")
+        self.assertEqual(len(self.smtp.messages), 2)
+        self.assertEqual(self.smtp.connections, 2)
+        self.assertEqual(email_server.pool._open, 1)
@@ -0,0 +1,190 @@
+from secrets import token_hex
+from unittest.mock import Mock, patch
+
+import bcrypt
+from falcon import testing, HTTP_200, HTTP_304
+
+from todolists import app, db, http_caching, redis_conn, user_dashboard, user_profiles, user_tasks, user_todolists
+
+
+class TestHTTPCaching(testing.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.user_id = add_verified_user("john12@fake.com")
+        cls.session_token = token_hex(32)
+        set_session_token_on_redis(cls.session_token, cls.user_id)
+
+    @classmethod
+    def tearDownClass(cls):
+        flushall_from_redis()
+        truncate_users()
+
+    def setUp(self):
+        super().setUp()
+        self.app = app.create()
+        self.cookies = {"session-token": self.session_token}
+        truncate_lists()
+
+    def test_dashboard_carries_weak_etag_and_no_last_modified(self):
+        result = self.simulate_get("/dashboard", cookies=self.cookies)
+        version, modified = http_caching.get_user_version(self.user_id)
+        self.assertEqual(result.headers["etag"], f'W/"{app.templates_digest}-{version}-{modified}"')
+        self.assertNotIn("last-modified", result.headers)
+        self.assertEqual(result.headers["cache-control"], "private, no-cache")
+        self.assertEqual(result.headers["vary"], "Cookie, Accept-Encoding")
+
+    def test_unchanged_dashboard_is_not_modified_without_query_or_render(self):
+        etag = self.simulate_get("/dashboard", cookies=self.cookies).headers["etag"]
+        with patch.object(db.conn, "getconn") as getconn, \
+             patch.object(app.templates["dashboard.html"], "render") as render:
+            result = self.simulate_get("/dashboard", cookies=self.cookies, headers={"If-None-Match": etag})
+        self.assertEqual(result.status, HTTP_304)
+        self.assertEqual(result.text, "")
+        getconn.assert_not_called()
+        render.assert_not_called()
+
+    def test_dashboard_reads_the_user_version_once(self):
+        list_id = user_todolists.create_todolist(self.user_id, "Market")
+        get_user_version = Mock(wraps=http_caching.get_user_version)
+        with patch.object(http_caching, "get_user_version", get_user_version), \
+             patch.object(user_dashboard, "get_user_version", get_user_version):
+            result = self.simulate_get("/dashboard", cookies=self.cookies)
+            self.simulate_get("/get-todolist", cookies=self.cookies, params={"get-todolist": list_id})
+        self.assertEqual(result.status, HTTP_200)
+        self.assertEqual(get_user_version.call_count, 2)
+
+    def test_if_modified_since_alone_never_gets_a_304(self):
+        self.simulate_get("/dashboard", cookies=self.cookies)
+        user_todolists.create_todolist(self.user_id, "Market")
+        result = self.simulate_get("/dashboard", cookies=self.cookies,
+                                   headers={"If-Modified-Since": "Fri, 31 Dec 9999 23:59:59 GMT"})
+        self.assertEqual(result.status, HTTP_200)
+        self.assertIn("Market", result.text)
+
+    def test_compressed_dashboard_is_not_modified_with_weak_etag(self):
+        headers = {"Accept-Encoding": "gzip"}
+        etag = self.simulate_get("/dashboard", cookies=self.cookies, headers=headers).headers["etag"]
+        self.assertTrue(etag.startswith("W/"))
+        result = self.simulate_get("/dashboard", cookies=self.cookies, headers={**headers, "If-None-Match": etag})
+        self.assertEqual(result.status, HTTP_304)
+        self.assertNotIn("content-encoding", result.headers)
+        self.assertEqual(result.headers["etag"], etag)
+        self.assertEqual(result.headers["vary"], "Cookie, Accept-Encoding")
+
+    def test_every_write_helper_changes_the_etag(self):
+        list_id = user_todolists.create_todolist(self.user_id, "Market")
+        task_id = user_tasks.create_task_in_todolist(list_id, "5 beers")
+        writes = [lambda: user_tasks.mark_task(task_id, True),
+                  lambda: user_tasks.update_task_text(task_id, "6 beers"),
+                  lambda: user_todolists.update_todolist_title(list_id, "Groceries"),
+                  lambda: user_tasks.create_task_of_user(self.user_id, list_id, "wine"),
+                  lambda: user_tasks.mark_tasks_of_user(self.user_id, list_id, [task_id], False),
+                  lambda: user_tasks.delete_task(task_id),
+                  lambda: user_todolists.delete_todolist(self.user_id, list_id)]
+        for write in writes:
+            etag = self.simulate_get("/dashboard", cookies=self.cookies).headers["etag"]
+            write()
+            result = self.simulate_get("/dashboard", cookies=self.cookies, headers={"If-None-Match": etag})
+            self.assertEqual(result.status, HTTP_200)
+            self.assertNotEqual(result.headers["etag"], etag)
+
+    def test_failed_write_keeps_the_etag(self):
+        list_id = user_todolists.create_todolist(self.user_id, "Market")
+        etag = self.simulate_get("/dashboard", cookies=self.cookies).headers["etag"]
+        user_tasks.delete_tasks_of_user(self.user_id, list_id, [1, 2, 3])
+        result = self.simulate_get("/dashboard", cookies=self.cookies, headers={"If-None-Match": etag})
+        self.assertEqual(result.status, HTTP_304)
+
+    def test_get_todolist_is_not_modified_per_selected_todolist(self):
+        list_id_1 = user_todolists.create_todolist(self.user_id, "Market")
+        list_id_2 = user_todolists.create_todolist(self.user_id, "Gym")
+        result = self.simulate_get("/get-todolist", cookies=self.cookies, params={"get-todolist": list_id_1})
+        etag = result.headers["etag"]
+        self.assertIn("Market's tasks", result.text)
+        result = self.simulate_get("/get-todolist", cookies=self.cookies, params={"get-todolist": list_id_1},
+                                   headers={"If-None-Match": etag})
+        self.assertEqual(result.status, HTTP_304)
+        result = self.simulate_get("/get-todolist", cookies=self.cookies, params={"get-todolist": list_id_2},
+                                   headers={"If-None-Match": etag})
+        self.assertEqual(result.status, HTTP_200)
+
+
+class TestDashboardCache(testing.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.user_id = add_verified_user("clark6@fake.com")
+
+    @classmethod
+    def tearDownClass(cls):
+        flushall_from_redis()
+        truncate_users()
+
+    def setUp(self):
+        super().setUp()
+        self.app = app.create()
+        truncate_lists()
+        user_dashboard.dashboard_cache.clear()
+        user_profiles.invalidate_profile(self.user_id)
+        self.list_id = user_todolists.create_todolist(self.user_id, "Market")
+        self.task_id = user_tasks.create_task_in_todolist(self.list_id, "5 beers")
+
+    def test_repeated_render_is_served_from_memory(self):
+        html = user_dashboard.render_dashboard(self.user_id, self.list_id)
+        with patch.object(db.conn, "getconn") as getconn:
+            self.assertEqual(user_dashboard.render_dashboard(self.user_id, self.list_id), html)
+        getconn.assert_not_called()
+
+    def test_write_helpers_invalidate_rendered_dashboard(self):
+        self.assertIn("5 beers", user_dashboard.render_dashboard(self.user_id, self.list_id))
+        user_tasks.update_task_text(self.task_id, "6 beers")
+        self.assertIn("6 beers", user_dashboard.render_dashboard(self.user_id, self.list_id))
+        list_id = user_todolists.create_todolist(self.user_id, "Gym")
+        self.assertIn("Gym", user_dashboard.render_dashboard(self.user_id, self.list_id))
+        user_todolists.delete_todolist(self.user_id, list_id)
+        self.assertNotIn("Gym", user_dashboard.render_dashboard(self.user_id, self.list_id))
+
+    def test_selected_todolists_are_cached_apart(self):
+        list_id = user_todolists.create_todolist(self.user_id, "Gym")
+        user_tasks.create_task_in_todolist(list_id, "squats")
+        self.assertIn("5 beers", user_dashboard.render_dashboard(self.user_id, self.list_id))
+        self.assertIn("squats", user_dashboard.render_dashboard(self.user_id, list_id))
+        self.assertEqual(len(user_dashboard.dashboard_cache), 2)
+
+    def test_redis_backend_shares_rendered_dashboard(self):
+        with patch.object(user_dashboard, "dashboard_cache_backend", "redis"):
+            html = user_dashboard.render_dashboard(self.user_id, self.list_id)
+            with patch.object(db.conn, "getconn") as getconn:
+                self.assertEqual(user_dashboard.render_dashboard(self.user_id, self.list_id), html)
+            getconn.assert_not_called()
+            user_tasks.mark_task(self.task_id, True)
+            self.assertNotEqual(user_dashboard.render_dashboard(self.user_id, self.list_id), html)
+        self.assertEqual(len(user_dashboard.dashboard_cache), 0)
+
+
+def add_verified_user(email):
+    hashed = bcrypt.hashpw("123abc-".encode(), bcrypt.gensalt(4))
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("INSERT INTO users (name, email, password, verified) \
+               VALUES ('John Smith', %s, %s, true) RETURNING user_id", [email, hashed.decode()])
+            return str(curs.fetchone().user_id)
+
+def set_session_token_on_redis(session_token, user_id):
+    with redis_conn.session_conn as conn:
+        conn.set(session_token, user_id)
+
+def truncate_users():
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("TRUNCATE users CASCADE")
+
+def truncate_lists():
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("TRUNCATE lists CASCADE")
+
+def flushall_from_redis():
+    with redis_conn.session_conn as conn:
+        conn.flushall()
@@ -0,0 +1,170 @@
+import json
+from secrets import token_hex
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+import bcrypt
+from falcon import testing, HTTP_200
+
+from todolists import app, db, instrumentation, redis_conn, user_dashboard, user_profiles, user_tasks, user_todolists
+
+
+class TestInstrumentation(testing.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.user_id = add_verified_user("john12@fake.com")
+        cls.session_token = token_hex(32)
+        set_session_token_on_redis(cls.session_token, cls.user_id)
+
+    @classmethod
+    def tearDownClass(cls):
+        flushall_from_redis()
+        truncate_users()
+
+    def setUp(self):
+        super().setUp()
+        self.app = app.create()
+        self.cookies = {"session-token": self.session_token}
+        truncate_lists()
+        user_dashboard.dashboard_cache.clear()
+        user_profiles.invalidate_profile(self.user_id)
+        list_id = user_todolists.create_todolist(self.user_id, "Market")
+        user_tasks.create_task_in_todolist(list_id, "5 beers")
+        server_timing = patch.object(instrumentation, "server_timing", True)
+        server_timing.start()
+        self.addCleanup(server_timing.stop)
+
+    def test_server_timing_breaks_down_dashboard_request(self):
+        result = self.simulate_get("/dashboard", cookies=self.cookies)
+        self.assertEqual(result.status, HTTP_200)
+        metrics = get_server_timing(result.headers["server-timing"])
+        self.assertEqual(metrics["sql"]["desc"], '"1 queries"')
+        self.assertIn("redis", metrics)
+        self.assertEqual(metrics["render"]["desc"], '"1 templates"')
+        self.assertNotIn("bcrypt", metrics)
+        self.assertGreaterEqual(float(metrics["total"]["dur"]), float(metrics["sql"]["dur"]))
+
+    def test_pipeline_counts_each_queued_command(self):
+        timings = instrumentation.RequestTimings()
+        token = instrumentation.current.set(timings)
+        try:
+            with redis_conn.cache_conn.pipeline() as pipe:
+                pipe.set("instrumented", 1).get("instrumented").delete("instrumented").execute()
+            redis_conn.cache_conn.get("instrumented")
+        finally:
+            instrumentation.current.reset(token)
+        self.assertEqual(timings.counts["redis"], 4)
+
+    def test_nothing_is_recorded_outside_requests(self):
+        user_todolists.get_todolists_of_user(self.user_id)
+        self.assertIsNone(instrumentation.current.get())
+
+    def test_request_is_logged_as_json(self):
+        with self.assertLogs("todolists.requests", "DEBUG") as logs:
+            self.simulate_get("/dashboard", cookies=self.cookies)
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(logs.records[-1].levelname, "DEBUG")
+        self.assertEqual((record["method"], record["path"], record["route"], record["status"]),
+                         ("GET", "/dashboard", "/dashboard", 200))
+        self.assertEqual(record["sql_count"], 1)
+        self.assertEqual(record["render_count"], 1)
+        self.assertGreater(record["redis_count"], 0)
+        self.assertNotIn("statements", record)
+
+    def test_slow_request_is_sampled_with_sql_text(self):
+        with patch.object(instrumentation, "slow_request_ms", 0), \
+             self.assertLogs("todolists.requests", "INFO") as logs:
+            self.simulate_get("/dashboard", cookies=self.cookies)
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(logs.records[-1].levelname, "WARNING")
+        self.assertEqual(len(record["statements"]), 1)
+        self.assertEqual(record["statements"][0]["sql"], instrumentation.statement_text(user_dashboard.DASHBOARD_QUERY))
+
+    def test_slow_requests_outside_the_sample_are_logged_without_sql(self):
+        with patch.object(instrumentation, "slow_request_ms", 0), patch.object(instrumentation, "slow_sample_rate", 0), \
+             self.assertLogs("todolists.requests", "INFO") as logs:
+            self.simulate_get("/dashboard", cookies=self.cookies)
+        self.assertEqual(logs.records[-1].levelname, "WARNING")
+        self.assertNotIn("statements", json.loads(logs.records[-1].getMessage()))
+
+    def test_server_timing_can_be_turned_off(self):
+        with patch.object(instrumentation, "server_timing", False):
+            result = self.simulate_get("/dashboard", cookies=self.cookies)
+        self.assertNotIn("server-timing", result.headers)
+
+    def test_fast_requests_are_not_logged_at_info(self):
+        with self.assertNoLogs("todolists.requests", "INFO"):
+            self.simulate_get("/dashboard", cookies=self.cookies)
+
+
+class TestASGIInstrumentation(IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.user_id = add_verified_user("john12@fake.com")
+        cls.session_token = token_hex(32)
+        set_session_token_on_redis(cls.session_token, cls.user_id)
+
+    @classmethod
+    def tearDownClass(cls):
+        flushall_from_redis()
+        truncate_users()
+
+    async def asyncSetUp(self):
+        truncate_lists()
+        user_dashboard.dashboard_cache.clear()
+        user_profiles.invalidate_profile(self.user_id)
+        server_timing = patch.object(instrumentation, "server_timing", True)
+        server_timing.start()
+        self.addCleanup(server_timing.stop)
+        self.conductor = testing.ASGIConductor(app.create_asgi())
+        await self.conductor.__aenter__()
+
+    async def asyncTearDown(self):
+        await self.conductor.__aexit__(None, None, None)
+
+    async def test_server_timing_counts_asyncpg_queries(self):
+        result = await self.conductor.simulate_get("/dashboard", cookies={"session-token": self.session_token})
+        metrics = get_server_timing(result.headers["server-timing"])
+        self.assertIn("sql", metrics)
+        self.assertEqual(metrics["render"]["desc"], '"1 templates"')
+        self.assertIn("redis", metrics)
+
+    async def test_threaded_resources_are_instrumented(self):
+        result = await self.conductor.simulate_get("/")
+        self.assertIn("render", get_server_timing(result.headers["server-timing"]))
+
+
+def get_server_timing(header):
+    metrics = {}
+    for metric in header.split(", "):
+        name, *params = metric.split(";")
+        metrics[name] = dict(param.split("=", 1) for param in params)
+    return metrics
+
+def add_verified_user(email):
+    hashed = bcrypt.hashpw("123abc-".encode(), bcrypt.gensalt(4))
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("INSERT INTO users (name, email, password, verified) \
+               VALUES ('John Smith', %s, %s, true) RETURNING user_id", [email, hashed.decode()])
+            return str(curs.fetchone().user_id)
+
+def set_session_token_on_redis(session_token, user_id):
+    with redis_conn.session_conn as conn:
+        conn.set(session_token, user_id)
+
+def truncate_users():
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("TRUNCATE users CASCADE")
+
+def truncate_lists():
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("TRUNCATE lists CASCADE")
+
+def flushall_from_redis():
+    with redis_conn.session_conn as conn:
+        conn.flushall()
@@ -1,9 +1,11 @@
 import bcrypt
 from secrets import token_hex
+from unittest.mock import patch
 
+import falcon
 from falcon import testing
 
-from todolists import app, db, redis_conn, user_tasks
+from todolists import app, db, redis_conn, user_dashboard, user_tasks
 
 
 
@@ -251,6 +253,75 @@ class TestUserInteractionWithTasks(testing.TestCase):
                                     params={"selected-todolist": self.gym_list_id, "delete-task": task_id_gym_3})
         self.assertEqual(doc, result.text)
 
+    def test_interface_links_next_page_of_tasks_when_list_has_more_tasks(self):
+        task_id_gym_1 = user_tasks.create_task_in_todolist(self.gym_list_id, "Running")
+        task_id_gym_2 = user_tasks.create_task_in_todolist(self.gym_list_id, "Swimming")
+        with patch.object(user_dashboard, "tasks_page_size", 1):
+            result = self.simulate_get("/dashboard", cookies={"session-token": self.session_token})
+        self.assertIn("Running", result.text)
+        self.assertNotIn("Swimming", result.text)
+        self.assertIn(f'<input type="hidden" name="after" value="{task_id_gym_1}">', result.text)
+
+    def test_interface_returns_next_page_of_tasks_as_html_fragment(self):
+        task_id_gym_1 = user_tasks.create_task_in_todolist(self.gym_list_id, "Running")
+        task_id_gym_2 = user_tasks.create_task_in_todolist(self.gym_list_id, "Swimming")
+        template = app.templates_env.get_template("tasks.html")
+        doc = template.render(tasks={task_id_gym_2: {"task": "Swimming", "done": False}}, next_page=None,
+                              selected_todolist_id=self.gym_list_id)
+        result = self.simulate_get("/get-tasks", cookies={"session-token": self.session_token},
+                                   params={"selected-todolist": self.gym_list_id, "after": task_id_gym_1})
+        self.assertEqual(doc, result.text)
+        self.assertNotIn("<html", result.text)
+
+
+    def test_interface_creates_one_task_per_line_in_one_transaction(self):
+        with patch.object(db.conn, "getconn", wraps=db.conn.getconn) as getconn:
+            result = self.simulate_post("/create-tasks", cookies={"session-token": self.session_token},
+                                        params={"selected-todolist": self.gym_list_id,
+                                                "create-tasks": "Running\r\n\r\n Swimming \r\nRowing"})
+        self.assertEqual(getconn.call_count, 2)
+        tasks = user_dashboard.get_tasks_page(self.user_id, self.gym_list_id)[0]
+        self.assertEqual([task["task"] for task in tasks.values()], ["Running", "Swimming", "Rowing"])
+        user_data = user_dashboard.get_todolists_user_data(self.user_id, self.gym_list_id)
+        self.assertEqual(app.templates_env.get_template("dashboard.html").render(user=user_data), result.text)
+
+    def test_interface_wont_create_tasks_on_other_users_todolist(self):
+        user_tasks.create_tasks_of_user(int(self.user_id) + 1, self.gym_list_id, ["Running"])
+        self.assertEqual(user_dashboard.get_tasks_page(self.user_id, self.gym_list_id)[0], {})
+
+    def test_interface_rejects_too_many_tasks_at_once(self):
+        with patch.object(user_tasks, "bulk_max_tasks", 2):
+            result = self.simulate_post("/create-tasks", cookies={"session-token": self.session_token},
+                                        params={"selected-todolist": self.gym_list_id,
+                                                "create-tasks": "Running\nSwimming\nRowing"})
+        self.assertEqual(result.status, falcon.HTTP_400)
+        self.assertEqual(user_dashboard.get_tasks_page(self.user_id, self.gym_list_id)[0], {})
+
+    def test_interface_marks_selected_tasks_as_done(self):
+        task_ids = user_tasks.create_tasks_of_user(self.user_id, self.gym_list_id, ["Running", "Swimming", "Rowing"])
+        self.simulate_post("/update-tasks", cookies={"session-token": self.session_token},
+                           params={"selected-todolist": self.gym_list_id, "task-ids": task_ids[:2],
+                                   "mark-task": "true"})
+        tasks = user_dashboard.get_tasks_page(self.user_id, self.gym_list_id)[0]
+        self.assertEqual([task["done"] for task in tasks.values()], [True, True, False])
+        self.simulate_post("/update-tasks", cookies={"session-token": self.session_token},
+                           params={"selected-todolist": self.gym_list_id, "task-ids": task_ids[1:],
+                                   "mark-task": "false"})
+        tasks = user_dashboard.get_tasks_page(self.user_id, self.gym_list_id)[0]
+        self.assertEqual([task["done"] for task in tasks.values()], [True, False, False])
+
+    def test_interface_deletes_selected_tasks(self):
+        task_ids = user_tasks.create_tasks_of_user(self.user_id, self.gym_list_id, ["Running", "Swimming", "Rowing"])
+        self.simulate_post("/delete-tasks", cookies={"session-token": self.session_token},
+                           params={"selected-todolist": self.gym_list_id, "task-ids": [task_ids[0], task_ids[2]]})
+        self.assertEqual(list(user_dashboard.get_tasks_page(self.user_id, self.gym_list_id)[0]), [task_ids[1]])
+
+    def test_interface_wont_change_tasks_of_other_todolists(self):
+        task_ids = user_tasks.create_tasks_of_user(self.user_id, self.gym_list_id, ["Running"])
+        self.assertEqual(user_tasks.delete_tasks_of_user(self.user_id, self.market_list_id, task_ids), 0)
+        self.assertEqual(user_tasks.mark_tasks_of_user(int(self.user_id) + 1, self.gym_list_id, task_ids, True), 0)
+        self.assertEqual(list(user_dashboard.get_tasks_page(self.user_id, self.gym_list_id)[0]), task_ids)
+
 
 def add_verified_user():
     hashed = bcrypt.hashpw("123abc-".encode(), bcrypt.gensalt())
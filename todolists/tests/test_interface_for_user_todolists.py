@@ -1,9 +1,10 @@
 import bcrypt
 from secrets import token_hex
 
+import falcon
 from falcon import testing
 
-from todolists import app, db, redis_conn, user_dashboard, user_todolists
+from todolists import app, db, redis_conn, user_dashboard, user_profiles, user_todolists
 
 
 class TestUserInteractionWithTodolists(testing.TestCase):
@@ -24,6 +25,8 @@ class TestUserInteractionWithTodolists(testing.TestCase):
         super().setUp()
         self.app = app.create()
         truncate_lists()
+        user_dashboard.dashboard_cache.clear()
+        user_profiles.invalidate_profile(self.user_id)
 
     def test_interface_renders_no_user_todolists_page(self):
         todolists_user = {
@@ -151,6 +154,15 @@ class TestUserInteractionWithTodolists(testing.TestCase):
                                     params={"delete-todolist": list_id_2})
         self.assertEqual(doc, result.text)
 
+    def test_interface_returns_not_found_when_deleting_missing_todolist(self):
+        list_id = user_todolists.create_todolist(self.user_id, "my todolist")
+        template = app.templates_env.get_template("error.html")
+        doc = template.render(error="This TodoList does not exist.")
+        result = self.simulate_post("/delete-todolist", cookies={"session-token": self.session_token},
+                                    params={"delete-todolist": list_id + 1})
+        self.assertEqual(result.status, falcon.HTTP_404)
+        self.assertEqual(doc, result.text)
+
 
 def add_verified_user():
     hashed = bcrypt.hashpw("123abc-".encode(), bcrypt.gensalt())
@@ -0,0 +1,132 @@
+from secrets import token_hex
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+import bcrypt
+from falcon import testing, HTTP_200, HTTP_404
+from prometheus_client import REGISTRY
+
+from todolists import app, db, email_queue, metrics, password_hashing, redis_conn, user_dashboard, user_profiles
+
+
+class TestMetrics(testing.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.user_id = add_verified_user("john12@fake.com")
+        cls.session_token = token_hex(32)
+        set_session_token_on_redis(cls.session_token, cls.user_id)
+
+    @classmethod
+    def tearDownClass(cls):
+        flushall_from_redis()
+        truncate_users()
+
+    def setUp(self):
+        super().setUp()
+        self.app = app.create()
+        self.cookies = {"session-token": self.session_token}
+        user_dashboard.dashboard_cache.clear()
+        user_profiles.invalidate_profile(self.user_id)
+
+    def test_requests_are_counted_and_timed_per_route(self):
+        labels = {"method": "GET", "route": "/dashboard"}
+        responses = get_sample("todolists_responses_total", status="200", **labels)
+        observed = get_sample("todolists_request_duration_seconds_count", **labels)
+        queries = get_sample("todolists_db_queries_total", route="/dashboard")
+        commands = get_sample("todolists_redis_commands_total", route="/dashboard")
+        self.simulate_get("/dashboard", cookies=self.cookies)
+        self.assertEqual(get_sample("todolists_responses_total", status="200", **labels), responses + 1)
+        self.assertEqual(get_sample("todolists_request_duration_seconds_count", **labels), observed + 1)
+        self.assertEqual(get_sample("todolists_db_queries_total", route="/dashboard"), queries + 1)
+        self.assertGreater(get_sample("todolists_redis_commands_total", route="/dashboard"), commands)
+
+    def test_unmatched_paths_share_one_route_label(self):
+        before = get_sample("todolists_responses_total", method="GET", route="unmatched", status="404")
+        self.simulate_get(f"/{token_hex(8)}")
+        self.simulate_get(f"/{token_hex(8)}")
+        self.assertEqual(get_sample("todolists_responses_total", method="GET", route="unmatched", status="404"),
+                         before + 2)
+
+    def test_metrics_endpoint_exposes_the_registry(self):
+        self.simulate_get("/dashboard", cookies=self.cookies)
+        with patch.object(metrics, "metrics_token", "secret-token"):
+            result = self.simulate_get("/metrics", headers={"Authorization": "Bearer secret-token"})
+        self.assertEqual(result.status, HTTP_200)
+        self.assertTrue(result.headers["content-type"].startswith("text/plain"))
+        self.assertIn('todolists_responses_total{method="GET",route="/dashboard",status="200"}', result.text)
+        self.assertIn("todolists_db_pool_in_use", result.text)
+
+    def test_metrics_endpoint_is_hidden_without_the_configured_token(self):
+        with patch.object(metrics, "metrics_token", "secret-token"):
+            self.assertEqual(self.simulate_get("/metrics").status, HTTP_404)
+            result = self.simulate_get("/metrics", headers={"Authorization": "Bearer secret-token"})
+        self.assertEqual(result.status, HTTP_200)
+
+    def test_metrics_endpoint_is_hidden_when_no_token_is_configured(self):
+        with patch.object(metrics, "metrics_token", None):
+            self.assertEqual(self.simulate_get("/metrics").status, HTTP_404)
+            result = self.simulate_get("/metrics", headers={"Authorization": "Bearer None"})
+        self.assertEqual(result.status, HTTP_404)
+
+    def test_pool_checkouts_are_tracked(self):
+        in_use = get_sample("todolists_db_pool_in_use")
+        checkouts = get_sample("todolists_db_pool_checkout_seconds_count")
+        with db.conn:
+            self.assertEqual(get_sample("todolists_db_pool_in_use"), in_use + 1)
+        self.assertEqual(get_sample("todolists_db_pool_in_use"), in_use)
+        self.assertEqual(get_sample("todolists_db_pool_checkout_seconds_count"), checkouts + 1)
+
+    def test_failed_queries_are_counted_by_error(self):
+        before = get_sample("todolists_call_errors_total", kind="sql", error="UndefinedTable")
+        with self.assertRaises(db.psycopg2.errors.UndefinedTable):
+            with db.conn as conn:
+                with conn.cursor() as curs:
+                    curs.execute("SELECT * FROM missing_table")
+        self.assertEqual(get_sample("todolists_call_errors_total", kind="sql", error="UndefinedTable"), before + 1)
+
+    def test_bcrypt_queue_depth_and_rejections(self):
+        rejected = get_sample("todolists_bcrypt_rejected_total")
+        queue = get_sample("todolists_bcrypt_queue")
+        self.assertTrue(password_hashing.check_password("123abc-", bcrypt.hashpw(b"123abc-", bcrypt.gensalt(4)).decode()))
+        self.assertEqual(get_sample("todolists_bcrypt_queue"), queue)
+        with patch.object(password_hashing.slots, "acquire", return_value=False):
+            with self.assertRaises(password_hashing.PasswordHashingBusy):
+                password_hashing.hash_password("123abc-")
+        self.assertEqual(get_sample("todolists_bcrypt_rejected_total"), rejected + 1)
+
+    def test_email_outcomes_are_counted(self):
+        before = get_sample("todolists_emails_total", outcome="failed")
+        with patch.object(email_queue, "backend", "memory"):
+            email_queue.count("failed")
+        self.assertEqual(get_sample("todolists_emails_total", outcome="failed"), before + 1)
+
+    def test_multiprocess_mode_merges_worker_files(self):
+        with TemporaryDirectory() as directory, patch.dict("os.environ", {"PROMETHEUS_MULTIPROC_DIR": directory}):
+            self.assertIsNot(metrics.get_registry(), REGISTRY)
+        self.assertIs(metrics.get_registry(), REGISTRY)
+
+
+def get_sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+def add_verified_user(email):
+    hashed = bcrypt.hashpw("123abc-".encode(), bcrypt.gensalt(4))
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("INSERT INTO users (name, email, password, verified) \
+               VALUES ('John Smith', %s, %s, true) RETURNING user_id", [email, hashed.decode()])
+            return str(curs.fetchone().user_id)
+
+def set_session_token_on_redis(session_token, user_id):
+    with redis_conn.session_conn as conn:
+        conn.set(session_token, user_id)
+
+def truncate_users():
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("TRUNCATE users CASCADE")
+
+def flushall_from_redis():
+    with redis_conn.session_conn as conn:
+        conn.flushall()
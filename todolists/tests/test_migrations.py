@@ -0,0 +1,146 @@
+import json
+from pathlib import Path
+
+import bcrypt
+from falcon import testing
+
+from todolists import app, db, migrations, user_dashboard
+
+
+schema_file = Path(__file__).parents[2]/"sql"
+
+class TestMigrations(testing.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        migrations.migrate()
+        cls.user_id = add_user_with_lists_and_tasks("john12@fake.com", lists=20, tasks=50)
+        add_user_with_lists_and_tasks("clark6@fake.com", lists=20, tasks=50)
+        with db.conn as conn:
+            with conn.cursor() as curs:
+                curs.execute("ANALYZE users, lists, tasks")
+                curs.execute("SELECT min(list_id) AS list_id FROM lists WHERE user_id = %s", [cls.user_id])
+                cls.list_id = curs.fetchone().list_id
+
+    @classmethod
+    def tearDownClass(cls):
+        truncate_users()
+
+    def setUp(self):
+        super().setUp()
+        self.app = app.create()
+
+    def test_every_migration_is_recorded_and_rerunning_applies_nothing(self):
+        versions = [version for version, path in migrations.get_migrations()]
+        self.assertEqual(migrations.get_applied_versions(), versions)
+        self.assertEqual(migrations.migrate(), [])
+
+    def test_dashboard_query_uses_indexes(self):
+        plan = explain(user_dashboard.DASHBOARD_QUERY,
+                       {"user_id": self.user_id, "list_id": self.list_id, "limit": 101})
+        self.assertNotIn("Seq Scan", node_types(plan))
+        self.assertIn("lists_user_id_list_id_idx", index_names(plan))
+        self.assertIn("tasks_list_id_task_id_idx", index_names(plan))
+
+    def test_tasks_page_query_uses_covering_index(self):
+        plan = explain(user_dashboard.TASKS_PAGE_QUERY,
+                       {"list_id": self.list_id, "user_id": self.user_id, "after": 0, "limit": 101})
+        self.assertNotIn("Seq Scan", node_types(plan))
+        self.assertIn("tasks_list_id_task_id_idx", index_names(plan))
+
+    def test_deleting_user_cascades_to_lists_and_tasks(self):
+        user_id = add_user_with_lists_and_tasks("bruce7@fake.com", lists=2, tasks=3)
+        with db.conn as conn:
+            with conn.cursor() as curs:
+                curs.execute("DELETE FROM users WHERE user_id = %s", [user_id])
+                curs.execute("SELECT count(*) FROM lists WHERE user_id = %s", [user_id])
+                self.assertEqual(curs.fetchone().count, 0)
+                curs.execute("SELECT count(*) FROM tasks LEFT JOIN lists USING (list_id) WHERE lists.list_id IS NULL")
+                self.assertEqual(curs.fetchone().count, 0)
+
+
+    def test_cascade_migration_replaces_foreign_keys_whatever_their_names(self):
+        with db.conn as conn:
+            with conn.cursor() as curs:
+                curs.execute("ALTER TABLE lists RENAME CONSTRAINT lists_user_id_fkey TO lists_owner_fkey")
+                curs.execute(dict(migrations.get_migrations())[3].read_text())
+                curs.execute("""
+                    SELECT conrelid::regclass::text AS table_name, conname, confdeltype FROM pg_constraint
+                    WHERE contype = 'f' AND conrelid IN ('lists'::regclass, 'tasks'::regclass)
+                    ORDER BY conname""")
+                foreign_keys = [tuple(record) for record in curs.fetchall()]
+        self.assertEqual(foreign_keys, [("lists", "lists_user_id_fkey", "c"), ("tasks", "tasks_list_id_fkey", "c")])
+
+    def test_schema_file_matches_the_migrations(self):
+        with db.conn as conn:
+            with conn.cursor() as curs:
+                curs.execute("CREATE SCHEMA schema_file")
+                curs.execute("SET LOCAL search_path TO schema_file")
+                curs.execute(schema_file.read_text())
+                from_file = describe_schema(curs, "schema_file")
+                curs.execute("SET LOCAL search_path TO public")
+                migrated = describe_schema(curs, "public")
+                curs.execute("DROP SCHEMA schema_file CASCADE")
+        self.assertEqual(from_file, migrated)
+
+
+def describe_schema(curs, schema):
+    curs.execute("""
+        SELECT table_name, column_name, data_type, character_maximum_length, is_nullable, column_default
+        FROM information_schema.columns
+        WHERE table_schema = %s AND table_name IN ('users', 'lists', 'tasks')
+        ORDER BY table_name, ordinal_position""", [schema])
+    columns = [tuple(record) for record in curs.fetchall()]
+    curs.execute("""
+        SELECT conrelid::regclass::text AS table_name, conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE connamespace = %s::regnamespace AND conrelid IN ('users'::regclass, 'lists'::regclass, 'tasks'::regclass)
+        ORDER BY conname""", [schema])
+    constraints = [tuple(record) for record in curs.fetchall()]
+    curs.execute("""
+        SELECT tablename, indexname, replace(indexdef, %s, '') FROM pg_indexes
+        WHERE schemaname = %s AND tablename IN ('users', 'lists', 'tasks')
+        ORDER BY indexname""", [f"{schema}.", schema])
+    indexes = [tuple(record) for record in curs.fetchall()]
+    # Column defaults name the schema of their sequence.
+    columns = [column[:-1] + (column[-1] and column[-1].replace(f"{schema}.", ""),) for column in columns]
+    return columns, constraints, indexes
+
+def explain(query, params):
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            # On tables this small a sequential scan is always cheapest; forbid it to see which
+            # indexes the planner can use once the tables grow.
+            curs.execute("SET LOCAL enable_seqscan = off")
+            curs.execute("EXPLAIN (FORMAT JSON) " + query, params)
+            plan = curs.fetchone()[0]
+    return plan if isinstance(plan, list) else json.loads(plan)
+
+def walk(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from walk(child)
+
+def node_types(plan):
+    return [node["Node Type"] for node in walk(plan[0]["Plan"])]
+
+def index_names(plan):
+    return [node.get("Index Name") for node in walk(plan[0]["Plan"])]
+
+def add_user_with_lists_and_tasks(email, lists, tasks):
+    hashed = bcrypt.hashpw("123abc-".encode(), bcrypt.gensalt(4))
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("INSERT INTO users (name, email, password, verified) \
+               VALUES ('John Smith', %s, %s, true) RETURNING user_id", [email, hashed.decode()])
+            user_id = curs.fetchone().user_id
+            for n in range(lists):
+                curs.execute("INSERT INTO lists (title, user_id) VALUES (%s, %s) RETURNING list_id",
+                             [f"list {n}", user_id])
+                curs.execute("INSERT INTO tasks (task, list_id) \
+                   SELECT 'task ' || n, %s FROM generate_series(1, %s) AS n", [curs.fetchone().list_id, tasks])
+    return user_id
+
+def truncate_users():
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("TRUNCATE users CASCADE")
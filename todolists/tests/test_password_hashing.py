@@ -0,0 +1,71 @@
+from threading import BoundedSemaphore
+from unittest.mock import patch
+import bcrypt
+
+from falcon import testing, HTTP_503
+
+from todolists import app, db, password_hashing
+
+
+class TestPasswordHashing(testing.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.app = app.create()
+
+    def tearDown(self):
+        with db.conn as conn:
+            with conn.cursor() as curs:
+                curs.execute("TRUNCATE users CASCADE;")
+
+    def test_hash_password_returns_bcrypt_hash(self):
+        hashed = password_hashing.hash_password("abc123-")
+        self.assertTrue(bcrypt.checkpw("abc123-".encode(), hashed))
+
+    def test_hash_password_uses_configured_cost_factor(self):
+        with patch.object(password_hashing, "rounds", 4):
+            hashed = password_hashing.hash_password("abc123-")
+        self.assertTrue(hashed.startswith(b"$2b$04$"))
+
+    def test_check_password_against_hash(self):
+        hashed = bcrypt.hashpw("abc123-".encode(), bcrypt.gensalt(4)).decode()
+        self.assertTrue(password_hashing.check_password("abc123-", hashed))
+        self.assertFalse(password_hashing.check_password("-321cba", hashed))
+
+    def test_slot_is_released_after_hashing(self):
+        slots = BoundedSemaphore(1)
+        with patch.object(password_hashing, "slots", slots):
+            password_hashing.hash_password("abc123-")
+            password_hashing.hash_password("abc123-")
+
+    def test_raise_busy_error_when_executor_is_saturated(self):
+        with patch.object(password_hashing, "slots", BoundedSemaphore(1)) as slots:
+            slots.acquire()
+            with self.assertRaises(password_hashing.PasswordHashingBusy) as error:
+                password_hashing.hash_password("abc123-")
+        self.assertEqual(error.exception.message,
+                         "We are receiving too many sign-ins right now. Try again in a few seconds.")
+
+    def test_login_returns_503_when_executor_is_saturated(self):
+        hashed = bcrypt.hashpw("123abc-".encode(), bcrypt.gensalt(4))
+        with db.conn as conn:
+            with conn.cursor() as curs:
+                curs.execute("INSERT INTO users (name, email, password, verified) \
+                   VALUES ('John Smith', 'john12@fake.com', %s, true)", [hashed.decode()])
+        with patch.object(password_hashing, "slots", BoundedSemaphore(1)) as slots:
+            slots.acquire()
+            result = self.simulate_post("/login", params={"email": "john12@fake.com", "password": "123abc-"})
+        self.assertEqual(result.status, HTTP_503)
+        self.assertEqual(result.headers["Retry-After"], "5")
+
+    def test_registration_returns_503_when_executor_is_saturated(self):
+        user_info = {
+            "name": "John Smith",
+            "email": "john12@fake.com",
+            "password_1": "abc123-",
+            "password_2": "abc123-"
+        }
+        with patch.object(password_hashing, "slots", BoundedSemaphore(1)) as slots:
+            slots.acquire()
+            result = self.simulate_post("/register", params=user_info)
+        self.assertEqual(result.status, HTTP_503)
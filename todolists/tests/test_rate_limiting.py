@@ -0,0 +1,139 @@
+from time import sleep
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+import bcrypt
+import redis
+from falcon import testing, HTTP_200, HTTP_429
+
+from todolists import (app, db, email_verification, rate_limiting, redis_conn, user_authentication,
+                       user_registration)
+
+
+class TestRateLimiting(testing.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        add_verified_user("john12@fake.com")
+
+    @classmethod
+    def tearDownClass(cls):
+        flushall_from_redis()
+        truncate_users()
+
+    def setUp(self):
+        super().setUp()
+        self.app = app.create()
+        flushall_from_redis()
+
+    def login(self, email="john12@fake.com", remote_addr="127.0.0.1", **kwargs):
+        return self.simulate_post("/login", params={"email": email, "password": "wrong-password"},
+                                  remote_addr=remote_addr, **kwargs)
+
+    def test_login_is_limited_per_email_before_bcrypt(self):
+        with patch.dict(rate_limiting.limits, {"/login": {"email": (2, 60)}}), \
+             patch.object(user_authentication, "check_password", return_value=False) as check_password:
+            self.assertNotEqual(self.login(remote_addr="10.0.0.1").status, HTTP_429)
+            self.assertNotEqual(self.login(remote_addr="10.0.0.2").status, HTTP_429)
+            result = self.login(remote_addr="10.0.0.3")
+        self.assertEqual(result.status, HTTP_429)
+        self.assertGreater(int(result.headers["retry-after"]), 0)
+        self.assertIn("Too many attempts", result.text)
+        self.assertEqual(check_password.call_count, 2)
+
+    def test_emails_are_limited_independently_and_case_insensitively(self):
+        with patch.dict(rate_limiting.limits, {"/login": {"email": (1, 60)}}), \
+             patch.object(user_authentication, "check_password", return_value=False):
+            self.assertNotEqual(self.login("john12@fake.com").status, HTTP_429)
+            self.assertEqual(self.login("JOHN12@fake.com ").status, HTTP_429)
+            self.assertNotEqual(self.login("mary34@fake.com").status, HTTP_429)
+
+    def test_register_is_limited_per_ip_before_hashing(self):
+        params = {"name": "John Smith", "email": "new@fake.com", "password_1": "123abc-", "password_2": "123abc-"}
+        with patch.dict(rate_limiting.limits, {"/register": {"ip": (1, 3600)}}), \
+             patch.object(user_registration, "encrypt_password", return_value=b"hashed") as encrypt_password, \
+             patch.object(user_registration, "send_email_with_token"):
+            self.simulate_post("/register", params=params, remote_addr="10.0.0.1")
+            result = self.simulate_post("/register", params=dict(params, email="other@fake.com"), remote_addr="10.0.0.1")
+            self.assertEqual(result.status, HTTP_429)
+            self.simulate_post("/register", params=dict(params, email="third@fake.com"), remote_addr="10.0.0.2")
+        self.assertEqual(encrypt_password.call_count, 2)
+
+    def test_reverification_is_limited_before_sending(self):
+        with patch.dict(rate_limiting.limits, {"/email_reverification": {"email": (1, 3600)}}), \
+             patch.object(email_verification, "send_email_with_token") as send_email_with_token:
+            self.assertEqual(self.simulate_post("/email_reverification", params={"email": "a@fake.com"}).status,
+                             HTTP_200)
+            self.assertEqual(self.simulate_post("/email_reverification", params={"email": "a@fake.com"}).status,
+                             HTTP_429)
+        send_email_with_token.assert_called_once_with("a@fake.com")
+
+    def test_bucket_refills_over_time(self):
+        with patch.dict(rate_limiting.limits, {"/login": {"ip": (1, 0.2)}}), \
+             patch.object(user_authentication, "check_password", return_value=False):
+            self.assertNotEqual(self.login().status, HTTP_429)
+            self.assertEqual(self.login().status, HTTP_429)
+            sleep(0.25)
+            self.assertNotEqual(self.login().status, HTTP_429)
+
+    def test_only_posts_are_limited(self):
+        with patch.dict(rate_limiting.limits, {"/login": {"ip": (1, 60)}}):
+            for _ in range(3):
+                self.assertNotEqual(self.simulate_get("/login").status, HTTP_429)
+
+    def test_forwarded_for_is_used_only_behind_trusted_proxies(self):
+        headers = {"X-Forwarded-For": "1.2.3.4, 10.0.0.9"}
+        with patch.dict(rate_limiting.limits, {"/login": {"ip": (1, 60)}}), \
+             patch.object(user_authentication, "check_password", return_value=False):
+            self.login(headers=headers)
+            self.assertEqual(self.login(headers={"X-Forwarded-For": "5.6.7.8"}).status, HTTP_429)
+            flushall_from_redis()
+            with patch.object(rate_limiting, "trusted_proxies", 1):
+                self.assertNotEqual(self.login(headers=headers).status, HTTP_429)
+                self.assertNotEqual(self.login(headers={"X-Forwarded-For": "1.2.3.4, 10.0.0.8"}).status, HTTP_429)
+                self.assertEqual(self.login(headers={"X-Forwarded-For": "6.6.6.6, 10.0.0.9"}).status, HTTP_429)
+
+    def test_requests_are_let_through_when_redis_fails(self):
+        with patch.dict(rate_limiting.limits, {"/login": {"ip": (1, 60)}}), \
+             patch.object(rate_limiting, "token_bucket", side_effect=redis.ConnectionError), \
+             patch.object(user_authentication, "check_password", return_value=False):
+            self.assertNotEqual(self.login().status, HTTP_429)
+            self.assertNotEqual(self.login().status, HTTP_429)
+
+
+class TestASGIRateLimiting(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        flushall_from_redis()
+        self.conductor = testing.ASGIConductor(app.create_asgi())
+        await self.conductor.__aenter__()
+
+    async def asyncTearDown(self):
+        await self.conductor.__aexit__(None, None, None)
+        flushall_from_redis()
+
+    async def test_reverification_is_limited_before_sending(self):
+        with patch.dict(rate_limiting.limits, {"/email_reverification": {"ip": (1, 3600)}}), \
+             patch.object(email_verification, "send_email_with_token") as send_email_with_token:
+            first = await self.conductor.simulate_post("/email_reverification", params={"email": "a@fake.com"})
+            second = await self.conductor.simulate_post("/email_reverification", params={"email": "b@fake.com"})
+        self.assertEqual((first.status, second.status), (HTTP_200, HTTP_429))
+        send_email_with_token.assert_called_once_with("a@fake.com")
+
+
+def add_verified_user(email):
+    hashed = bcrypt.hashpw("123abc-".encode(), bcrypt.gensalt(4))
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("INSERT INTO users (name, email, password, verified) \
+               VALUES ('John Smith', %s, %s, true) RETURNING user_id", [email, hashed.decode()])
+            return str(curs.fetchone().user_id)
+
+def truncate_users():
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("TRUNCATE users CASCADE")
+
+def flushall_from_redis():
+    with redis_conn.session_conn as conn:
+        conn.flushall()
@@ -0,0 +1,55 @@
+from unittest.mock import patch
+
+import redis
+from falcon import testing
+
+from todolists import app, email_verification, redis_conn, user_registration
+
+
+class TestRedisConn(testing.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.app = app.create()
+
+    def tearDown(self):
+        with redis_conn.conn as conn:
+            conn.flushall()
+
+    def test_clients_share_a_bounded_blocking_pool(self):
+        with patch.object(redis_conn, "pool_size", 3), patch.object(redis_conn, "pool_timeout", 0.1):
+            client = redis_conn.create_client(redis_conn.tokens_db)
+        pool = client.connection_pool
+        self.assertIsInstance(pool, redis.BlockingConnectionPool)
+        self.assertEqual(pool.max_connections, 3)
+        connections = [pool.get_connection("PING") for _ in range(3)]
+        with self.assertRaises(redis.ConnectionError):
+            pool.get_connection("PING")
+        for connection in connections:
+            pool.release(connection)
+        pool.disconnect()
+
+    def test_client_uses_configured_timeouts(self):
+        with patch.object(redis_conn, "socket_timeout", 0.5), patch.object(redis_conn, "retry_on_timeout", False):
+            client = redis_conn.create_client(redis_conn.session_db)
+        kwargs = client.connection_pool.connection_kwargs
+        self.assertEqual(kwargs["socket_timeout"], 0.5)
+        self.assertFalse(kwargs["retry_on_timeout"])
+        self.assertEqual(kwargs["db"], redis_conn.session_db)
+
+    def test_client_connects_over_unix_socket_when_configured(self):
+        with patch.object(redis_conn, "unix_socket", "/run/redis/redis.sock"):
+            client = redis_conn.create_client(redis_conn.tokens_db)
+        pool = client.connection_pool
+        self.assertIs(pool.connection_class, redis.UnixDomainSocketConnection)
+        self.assertEqual(pool.connection_kwargs["path"], "/run/redis/redis.sock")
+        self.assertNotIn("host", pool.connection_kwargs)
+
+    def test_verification_token_is_saved_with_expiry_in_one_command(self):
+        for module in (user_registration, email_verification):
+            with patch.object(redis_conn.conn, "execute_command", wraps=redis_conn.conn.execute_command) as command:
+                module.save_token_to_redis("111111", "john12@fake.com")
+            self.assertEqual(command.call_count, 1)
+            with redis_conn.conn as conn:
+                self.assertEqual(conn.get("111111"), b"john12@fake.com")
+                self.assertTrue(0 < conn.ttl("111111") <= 600)
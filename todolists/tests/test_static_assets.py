@@ -0,0 +1,67 @@
+import gzip
+import json
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from falcon import testing, HTTP_200, HTTP_304, HTTP_404
+
+from todolists import app, static_assets
+
+
+class TestStaticAssets(testing.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.app = app.create()
+        self.static_dir = TemporaryDirectory()
+        self.manifest = static_assets.build(static_assets.public_dir, self.static_dir.name)
+        static_assets.load_manifest(self.static_dir.name)
+        self.css = self.manifest["base_style.css"]
+
+    def tearDown(self):
+        self.static_dir.cleanup()
+        static_assets.load_manifest()
+
+    def test_build_writes_fingerprinted_files_and_compressed_variants(self):
+        target = Path(self.static_dir.name)
+        self.assertEqual(json.loads((target/"manifest.json").read_text()), self.manifest)
+        self.assertRegex(self.css, r"^base_style\.[0-9a-f]{10}\.css$")
+        self.assertEqual(gzip.decompress((target/(self.css + ".gz")).read_bytes()),
+                         (static_assets.public_dir/"base_style.css").read_bytes())
+        jpg = self.manifest["marek-piwnicki-a6SRY6PB_wA-unsplash.jpg"]
+        self.assertTrue((target/jpg).is_file())
+        self.assertFalse((target/(jpg + ".gz")).exists())
+
+    def test_templates_reference_fingerprinted_urls(self):
+        self.assertEqual(static_assets.asset_url("base_style.css"), f"/static/{self.css}")
+        self.assertIn(f'href="/static/{self.css}"', self.simulate_get("/").text)
+        static_assets.load_manifest(Path(self.static_dir.name)/"missing")
+        self.assertEqual(static_assets.asset_url("base_style.css"), "/public/base_style.css")
+
+    def test_gzip_variant_is_sent_when_accepted(self):
+        result = self.simulate_get(f"/static/{self.css}", headers={"Accept-Encoding": "gzip, deflate"})
+        self.assertEqual(result.status, HTTP_200)
+        self.assertEqual(result.headers["content-encoding"], "gzip")
+        self.assertEqual(result.headers["content-type"], "text/css")
+        self.assertEqual(result.headers["vary"], "Accept-Encoding")
+        self.assertEqual(result.headers["cache-control"], f"public, max-age={static_assets.max_age}, immutable")
+        self.assertEqual(gzip.decompress(result.content), (static_assets.public_dir/"base_style.css").read_bytes())
+
+    def test_identity_is_sent_when_compression_is_not_accepted(self):
+        for accept_encoding in ("", "gzip;q=0", "identity"):
+            result = self.simulate_get(f"/static/{self.css}", headers={"Accept-Encoding": accept_encoding})
+            self.assertNotIn("content-encoding", result.headers)
+            self.assertEqual(result.content, (static_assets.public_dir/"base_style.css").read_bytes())
+
+    def test_conditional_get_is_not_modified(self):
+        headers = {"Accept-Encoding": "gzip"}
+        etag = self.simulate_get(f"/static/{self.css}", headers=headers).headers["etag"]
+        result = self.simulate_get(f"/static/{self.css}", headers={**headers, "If-None-Match": etag})
+        self.assertEqual(result.status, HTTP_304)
+        self.assertEqual(result.content, b"")
+        result = self.simulate_get(f"/static/{self.css}", headers={"If-None-Match": etag})
+        self.assertEqual(result.status, HTTP_200)
+
+    def test_unknown_asset_is_not_found(self):
+        for name in ("missing.css", "manifest.json", self.css + ".gz", ".."):
+            self.assertEqual(self.simulate_get(f"/static/{name}").status, HTTP_404)
@@ -0,0 +1,38 @@
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from falcon import testing
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+from todolists import app
+
+
+class TestTemplates(testing.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.app = app.create()
+
+    def test_create_precompiles_every_template(self):
+        self.assertEqual(sorted(app.templates), sorted(app.templates_env.list_templates(extensions=["html"])))
+        self.assertFalse(app.templates_env.auto_reload)
+
+    def test_pages_render_without_touching_template_files(self):
+        with patch.object(FileSystemLoader, "get_source", side_effect=AssertionError("template loaded")), \
+             patch("jinja2.loaders.os.path.getmtime", side_effect=AssertionError("template stat()ed")):
+            result = self.simulate_get("/")
+            app.templates_env.get_template("dashboard.html")
+        self.assertEqual(result.text, app.templates["index.html"].render())
+
+    def test_bytecode_cache_skips_compiling_templates(self):
+        with TemporaryDirectory() as cache_dir:
+            def new_env():
+                env = Environment(loader=FileSystemLoader("todolists/templates"), autoescape=True,
+                                  bytecode_cache=FileSystemBytecodeCache(cache_dir))
+                env.globals.update(app.templates_env.globals)
+                return env
+            user = {"author": "John Smith", "todolists": {}, "selected_todolist": None}
+            new_env().get_template("dashboard.html").render(user=user)
+            with patch.object(Environment, "compile", side_effect=AssertionError("template compiled")):
+                page = new_env().get_template("dashboard.html").render(user=user)
+        self.assertIn("You don't have any TodoLists yet!", page)
@@ -1,7 +1,7 @@
 from unittest.mock import patch
 import bcrypt
 
-from todolists import app, db, redis_conn, user_authentication
+from todolists import app, db, instrumentation, redis_conn, user_authentication
 from todolists.user_dashboard import get_todolists_user_data
 from todolists.user_authorization import AuthorizationError
 
@@ -132,6 +132,25 @@ class TestUserAuthenticationWithoutPreviousSessionTokenSet(testing.TestCase):
         result = self.simulate_post("/login", params=user_auth)
         self.assertEqual(doc.render(), result.text)
 
+    def test_login_costs_one_query_and_one_hash_check(self):
+        add_verified_user()
+        add_unverified_user()
+        logins = [("john12@fake.com", "123abc-"), ("john12@fake.com", "-321cba"), ("clark6@fake.com", "-321cba")]
+        for email, password in logins:
+            with patch.object(instrumentation, "server_timing", True):
+                result = self.simulate_post("/login", params={"email": email, "password": password})
+            server_timing = result.headers["server-timing"]
+            self.assertIn('desc="1 queries"', server_timing)
+            self.assertIn('desc="1 hashes"', server_timing)
+
+    def test_user_authentication_renders_not_verified_page_only_with_right_password(self):
+        add_unverified_user()
+        doc = app.templates_env.get_template("error-email-not-verified.html")
+        result = self.simulate_post("/login", params={"email": "clark6@fake.com", "password": "123abc-"})
+        self.assertEqual(doc.render(email="clark6@fake.com"), result.text)
+        result = self.simulate_post("/login", params={"email": "clark6@fake.com", "password": "-321cba"})
+        self.assertEqual(result.status, HTTP_401)
+
     def test_user_authentication_renders_error_page_when_unregistered_email_submitted_on_login_form(self):
         user_auth = {
             "email": "chico15@fake.com",
@@ -237,6 +256,21 @@ class TestUserAuthenticationWithPreviousSessionTokenSet(testing.TestCase):
         result = self.simulate_post("/logout", cookies={"session-token": session_token})
         self.assertEqual(doc.render(), result.text)
 
+    def test_user_logout_everywhere_deletes_every_session_token_of_user(self):
+        add_verified_user()
+        user_auth = {
+            "email": "john12@fake.com",
+            "password": "123abc-"
+        }
+        session_tokens = [self.simulate_post("/login", params=user_auth).cookies["session-token"].value
+                          for _ in range(2)]
+        result = self.simulate_post("/logout-everywhere", cookies={"session-token": session_tokens[0]})
+        self.assertEqual(app.templates_env.get_template("logout.html").render(), result.text)
+        for session_token in session_tokens:
+            with self.assertRaises(AuthorizationError) as error:
+                user_authentication.check_session_token(session_token)
+            self.assertEqual(error.exception.message, "Wrong/expired token.")
+
     def test_user_logout_renders_login_page_if_invalid_session_token_set(self):
         doc = app.templates_env.get_template("login.html")
         random_session_token = user_authentication.create_session_token()
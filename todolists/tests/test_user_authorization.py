@@ -1,9 +1,11 @@
 from secrets import token_hex
-from time import sleep
+from time import sleep, time
+from unittest.mock import patch
 
+import redis
 from falcon import testing
 
-from todolists import redis_conn, user_authorization
+from todolists import caching, redis_conn, user_authorization
 
 
 class TestUserAuthorization(testing.TestCase):
@@ -39,6 +41,153 @@ class TestUserAuthorization(testing.TestCase):
             user_authorization.check_session_token(session_token)
         self.assertEqual(error.exception.message, "Bad token.")
 
+    def test_user_authorization_serves_repeated_checks_from_session_cache(self):
+        session_token = token_hex(32)
+        set_session_token_on_redis(session_token, "1234")
+        user_authorization.check_session_token(session_token)
+        with patch.object(redis_conn.session_conn, "get") as get:
+            result = user_authorization.check_session_token(session_token)
+        get.assert_not_called()
+        self.assertEqual(result, "1234")
+
+    def test_user_authorization_raises_error_after_session_token_is_forgotten(self):
+        session_token = token_hex(32)
+        set_session_token_on_redis(session_token, "1234")
+        user_authorization.check_session_token(session_token)
+        user_authorization.forget_session_token(session_token)
+        flushall_from_redis()
+        with self.assertRaises(user_authorization.AuthorizationError) as error:
+            user_authorization.check_session_token(session_token)
+        self.assertEqual(error.exception.message, "Wrong/expired token.")
+
+    def test_user_authorization_drops_cached_session_when_logout_is_published(self):
+        session_token = token_hex(32)
+        set_session_token_on_redis(session_token, "1234")
+        with patch.object(user_authorization, "use_logout_pubsub", True):
+            user_authorization.check_session_token(session_token)
+            sleep(0.2)
+            with redis_conn.session_conn as conn:
+                conn.publish(user_authorization.LOGOUT_CHANNEL, session_token)
+            sleep(0.2)
+        self.assertIsNone(user_authorization.session_cache.get(session_token))
+
+    def test_logout_listener_gives_its_connection_back_on_each_reconnect(self):
+        pubsubs = []
+        def listen(pubsub):
+            pubsubs.append(pubsub)
+            raise redis.ConnectionError
+        with patch.object(redis.client.PubSub, "listen", autospec=True, side_effect=listen), \
+             patch.object(user_authorization, "sleep", side_effect=[None, None, StopIteration]):
+            with self.assertRaises(StopIteration):
+                user_authorization.listen_for_logouts()
+        self.assertEqual(len(pubsubs), 3)
+        pool = pubsubs[0].connection_pool
+        self.assertEqual(pool.pool.qsize(), pool.max_connections)
+
+
+class TestSessionExpiration(testing.TestCase):
+
+    def setUp(self):
+        flushall_from_redis()
+        user_authorization.session_cache.clear()
+        self.patches = [patch.object(user_authorization, "session_absolute_ttl", 1000),
+                        patch.object(user_authorization, "session_idle_ttl", 100),
+                        patch.object(user_authorization, "session_refresh_below", 50)]
+        for started in self.patches:
+            started.start()
+
+    def tearDown(self):
+        for started in self.patches:
+            started.stop()
+
+    def test_set_session_token_expires_after_idle_ttl_and_is_indexed_by_user(self):
+        session_token = token_hex(32)
+        user_authorization.set_session_token(session_token, "1234")
+        with redis_conn.session_conn as conn:
+            self.assertTrue(95 < conn.ttl(session_token) <= 100)
+            expires_at = conn.zscore("user-sessions:1234", session_token)
+        self.assertAlmostEqual(expires_at, time() + 1000, delta=5)
+
+    def test_check_session_token_does_not_write_while_ttl_is_above_threshold(self):
+        session_token = token_hex(32)
+        user_authorization.set_session_token(session_token, "1234")
+        with patch.object(user_authorization, "refresh_session_token") as refresh:
+            self.assertEqual(user_authorization.check_session_token(session_token), "1234")
+        refresh.assert_not_called()
+
+    def test_check_session_token_slides_idle_ttl_below_threshold(self):
+        session_token = token_hex(32)
+        user_authorization.set_session_token(session_token, "1234")
+        with redis_conn.session_conn as conn:
+            conn.expire(session_token, 10)
+        self.assertEqual(user_authorization.check_session_token(session_token), "1234")
+        with redis_conn.session_conn as conn:
+            self.assertTrue(95 < conn.ttl(session_token) <= 100)
+
+    def test_sliding_refresh_never_goes_past_absolute_ttl(self):
+        session_token = token_hex(32)
+        user_authorization.set_session_token(session_token, "1234")
+        with redis_conn.session_conn as conn:
+            conn.zadd("user-sessions:1234", {session_token: time() + 30})
+            conn.expire(session_token, 10)
+        user_authorization.check_session_token(session_token)
+        with redis_conn.session_conn as conn:
+            self.assertTrue(25 < conn.ttl(session_token) <= 30)
+
+    def test_check_session_token_rejects_session_past_absolute_ttl(self):
+        session_token = token_hex(32)
+        user_authorization.set_session_token(session_token, "1234")
+        with redis_conn.session_conn as conn:
+            conn.zadd("user-sessions:1234", {session_token: time() - 1})
+            conn.expire(session_token, 10)
+        with self.assertRaises(user_authorization.AuthorizationError) as error:
+            user_authorization.check_session_token(session_token)
+        self.assertEqual(error.exception.message, "Wrong/expired token.")
+        with redis_conn.session_conn as conn:
+            self.assertIsNone(conn.get(session_token))
+            self.assertEqual(conn.zcard("user-sessions:1234"), 0)
+
+    def test_unset_session_token_removes_it_from_user_index(self):
+        session_token = token_hex(32)
+        user_authorization.set_session_token(session_token, "1234")
+        self.assertEqual(user_authorization.unset_session_token(session_token), 1)
+        with redis_conn.session_conn as conn:
+            self.assertIsNone(conn.get(session_token))
+            self.assertEqual(conn.zcard("user-sessions:1234"), 0)
+
+    def test_unset_all_session_tokens_logs_user_out_everywhere(self):
+        session_tokens = [token_hex(32) for _ in range(3)]
+        for session_token in session_tokens:
+            user_authorization.set_session_token(session_token, "1234")
+        other_session_token = token_hex(32)
+        user_authorization.set_session_token(other_session_token, "5678")
+        user_authorization.check_session_token(session_tokens[0])
+        self.assertEqual(user_authorization.unset_all_session_tokens("1234"), 3)
+        for session_token in session_tokens:
+            with self.assertRaises(user_authorization.AuthorizationError):
+                user_authorization.check_session_token(session_token)
+        self.assertEqual(user_authorization.check_session_token(other_session_token), "5678")
+
+
+class TestLRUCache(testing.TestCase):
+
+    def test_cache_evicts_least_recently_used_entry(self):
+        cache = caching.LRUCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_cache_expires_entries_after_ttl(self):
+        cache = caching.LRUCache(maxsize=2, ttl=0.1)
+        cache.set("a", 1)
+        sleep(0.2)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
 
 def set_session_token_on_redis(session_token, user_id):
     with redis_conn.session_conn as conn:
@@ -1,10 +1,11 @@
 import bcrypt
 from secrets import token_hex
+from unittest.mock import patch
 
 from falcon import testing
 from psycopg2.errors import UniqueViolation, ProgrammingError
 
-from todolists import app, db, redis_conn, user_dashboard, user_todolists, user_tasks
+from todolists import app, db, migrations, redis_conn, user_dashboard, user_todolists, user_tasks
 
 
 class TestUserDashboardCRUDFunctions(testing.TestCase):
@@ -43,7 +44,7 @@ class TestUserDashboardCRUDFunctions(testing.TestCase):
 
     def test_function_delete_todolist_from_db_by_list_id(self):
         list_id = user_todolists.create_todolist(self.user_id, "my todolist")
-        user_todolists.delete_todolist(list_id)
+        user_todolists.delete_todolist(self.user_id, list_id)
         with db.conn as conn:
             with conn.cursor() as curs:
                 curs.execute("SELECT title FROM lists WHERE list_id = %s", [list_id])
@@ -51,6 +52,58 @@ class TestUserDashboardCRUDFunctions(testing.TestCase):
                     curs.fetchone().list_id
         self.assertEqual(str(error.exception), "'NoneType' object has no attribute 'list_id'")
 
+    def test_function_delete_todolist_deletes_its_tasks(self):
+        list_id = user_todolists.create_todolist(self.user_id, "Market")
+        other_list_id = user_todolists.create_todolist(self.user_id, "Gym")
+        user_tasks.create_task_in_todolist(list_id, "5 beers")
+        other_task_id = user_tasks.create_task_in_todolist(other_list_id, "wrestling")
+        self.assertTrue(user_todolists.delete_todolist(self.user_id, list_id))
+        with db.conn as conn:
+            with conn.cursor() as curs:
+                curs.execute("SELECT task_id FROM tasks")
+                self.assertEqual([record.task_id for record in curs.fetchall()], [other_task_id])
+
+    def test_function_delete_todolist_deletes_big_lists_in_batches(self):
+        list_id = user_todolists.create_todolist(self.user_id, "Market")
+        for n in range(7):
+            user_tasks.create_task_in_todolist(list_id, f"{n} beers")
+        with patch.object(user_todolists, "delete_batch_size", 3), \
+             patch.object(db.conn, "getconn", wraps=db.conn.getconn) as getconn:
+            self.assertTrue(user_todolists.delete_todolist(self.user_id, list_id))
+        self.assertEqual(getconn.call_count, 3)
+        with db.conn as conn:
+            with conn.cursor() as curs:
+                curs.execute("SELECT count(*) FROM tasks")
+                self.assertEqual(curs.fetchone().count, 0)
+                curs.execute("SELECT count(*) FROM lists")
+                self.assertEqual(curs.fetchone().count, 0)
+
+    def test_function_delete_todolist_works_without_the_cascade_migration(self):
+        list_id = user_todolists.create_todolist(self.user_id, "Market")
+        for n in range(4):
+            user_tasks.create_task_in_todolist(list_id, f"{n} beers")
+        set_foreign_keys_of_initial_schema()
+        try:
+            with patch.object(user_todolists, "delete_batch_size", 3):
+                self.assertTrue(user_todolists.delete_todolist(self.user_id, list_id))
+        finally:
+            with db.conn as conn:
+                with conn.cursor() as curs:
+                    curs.execute(dict(migrations.get_migrations())[3].read_text())
+        with db.conn as conn:
+            with conn.cursor() as curs:
+                curs.execute("SELECT count(*) FROM lists")
+                self.assertEqual(curs.fetchone().count, 0)
+
+    def test_function_delete_todolist_wont_delete_other_users_todolist(self):
+        list_id = user_todolists.create_todolist(self.user_id, "Market")
+        user_tasks.create_task_in_todolist(list_id, "5 beers")
+        self.assertFalse(user_todolists.delete_todolist(int(self.user_id) + 1, list_id))
+        with db.conn as conn:
+            with conn.cursor() as curs:
+                curs.execute("SELECT count(*) FROM tasks WHERE list_id = %s", [list_id])
+                self.assertEqual(curs.fetchone().count, 1)
+
     def test_function_update_todolist_title_in_db(self):
         list_id = user_todolists.create_todolist(self.user_id, "my todolist")
         user_todolists.update_todolist_title(list_id, "my groceries")
@@ -215,6 +268,64 @@ class TestUserDashboardCRUDFunctions(testing.TestCase):
         result = user_dashboard.get_todolists_user_data(self.user_id)
         self.assertEqual(doc, result)
 
+    def test_function_get_todolists_user_data_runs_a_single_query(self):
+        list_id_1 = user_todolists.create_todolist(self.user_id, "Market")
+        list_id_2 = user_todolists.create_todolist(self.user_id, "Gym")
+        user_tasks.create_task_in_todolist(list_id_1, "5 beers")
+        user_tasks.create_task_in_todolist(list_id_2, "wrestling")
+        with patch.object(db.conn, "getconn", wraps=db.conn.getconn) as getconn:
+            user_dashboard.get_todolists_user_data(self.user_id)
+            user_dashboard.get_todolists_user_data(self.user_id, list_id_2)
+        self.assertEqual(getconn.call_count, 2)
+
+    def test_function_get_dashboard_records_are_ordered_user_lists_then_tasks(self):
+        list_id_1 = user_todolists.create_todolist(self.user_id, "Market")
+        list_id_2 = user_todolists.create_todolist(self.user_id, "Gym")
+        task_ids = [user_tasks.create_task_in_todolist(list_id_1, f"{n} beers") for n in range(3)]
+        records = user_dashboard.get_dashboard_records(self.user_id)
+        self.assertEqual([(kind, id) for kind, id, *rest in records],
+                         [("user", int(self.user_id)), ("list", list_id_1), ("list", list_id_2)] +
+                         [("task", task_id) for task_id in task_ids])
+
+    def test_function_get_todolists_user_data_ignores_tasks_of_other_users_todolists(self):
+        list_id = user_todolists.create_todolist(self.user_id, "Market")
+        user_tasks.create_task_in_todolist(list_id, "5 beers")
+        result = user_dashboard.get_todolists_user_data(self.user_id, list_id + 1)
+        self.assertEqual(result["todolists"], {list_id: {"title": "Market", "tasks": {}}})
+
+    def test_function_get_todolists_user_data_loads_only_first_page_of_tasks(self):
+        list_id = user_todolists.create_todolist(self.user_id, "Market")
+        task_ids = [user_tasks.create_task_in_todolist(list_id, f"{n} beers") for n in range(5)]
+        with patch.object(user_dashboard, "tasks_page_size", 2):
+            result = user_dashboard.get_todolists_user_data(self.user_id, list_id)
+        self.assertEqual(list(result["todolists"][list_id]["tasks"]), task_ids[:2])
+        self.assertEqual(result["todolists"][list_id]["next_page"], task_ids[1])
+
+    def test_function_get_todolists_user_data_has_no_next_page_when_all_tasks_fit(self):
+        list_id = user_todolists.create_todolist(self.user_id, "Market")
+        task_ids = [user_tasks.create_task_in_todolist(list_id, f"{n} beers") for n in range(2)]
+        with patch.object(user_dashboard, "tasks_page_size", 2):
+            result = user_dashboard.get_todolists_user_data(self.user_id, list_id)
+        self.assertEqual(list(result["todolists"][list_id]["tasks"]), task_ids)
+        self.assertNotIn("next_page", result["todolists"][list_id])
+
+    def test_function_get_tasks_page_walks_tasks_by_task_id(self):
+        list_id = user_todolists.create_todolist(self.user_id, "Market")
+        task_ids = [user_tasks.create_task_in_todolist(list_id, f"{n} beers") for n in range(5)]
+        with patch.object(user_dashboard, "tasks_page_size", 2):
+            tasks, next_page = user_dashboard.get_tasks_page(self.user_id, list_id, task_ids[1])
+            self.assertEqual(tasks, {task_ids[2]: {"task": "2 beers", "done": False},
+                                     task_ids[3]: {"task": "3 beers", "done": False}})
+            self.assertEqual(next_page, task_ids[3])
+            tasks, next_page = user_dashboard.get_tasks_page(self.user_id, list_id, next_page)
+        self.assertEqual(list(tasks), task_ids[4:])
+        self.assertIsNone(next_page)
+
+    def test_function_get_tasks_page_ignores_other_users_todolists(self):
+        list_id = user_todolists.create_todolist(self.user_id, "Market")
+        user_tasks.create_task_in_todolist(list_id, "5 beers")
+        self.assertEqual(user_dashboard.get_tasks_page(int(self.user_id) + 1, list_id), ({}, None))
+
 
 def add_verified_user():
     hashed = bcrypt.hashpw("123abc-".encode(), bcrypt.gensalt())
@@ -255,3 +366,9 @@ def truncate_tasks():
 def flushall_from_redis():
     with redis_conn.session_conn as conn:
         conn.flushall()
+
+def set_foreign_keys_of_initial_schema():
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("ALTER TABLE tasks DROP CONSTRAINT tasks_list_id_fkey")
+            curs.execute("ALTER TABLE tasks ADD CONSTRAINT tasks_list_id_fkey FOREIGN KEY (list_id) REFERENCES lists(list_id)")
@@ -0,0 +1,145 @@
+from secrets import token_hex
+from unittest import IsolatedAsyncioTestCase
+
+import bcrypt
+from falcon import testing
+
+from todolists import (app, db, http_caching, instrumentation, redis_conn, user_dashboard, user_profiles,
+                       user_tasks, user_todolists)
+
+
+class TestUserProfiles(testing.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.user_id = add_verified_user("john12@fake.com")
+        cls.session_token = token_hex(32)
+        set_session_token_on_redis(cls.session_token, cls.user_id)
+
+    @classmethod
+    def tearDownClass(cls):
+        flushall_from_redis()
+        truncate_users()
+
+    def setUp(self):
+        super().setUp()
+        self.app = app.create()
+        self.cookies = {"session-token": self.session_token}
+        truncate_lists()
+        user_dashboard.dashboard_cache.clear()
+        user_profiles.invalidate_profile(self.user_id)
+        self.list_id = user_todolists.create_todolist(self.user_id, "Market")
+        user_tasks.create_task_in_todolist(self.list_id, "5 beers")
+
+    def render_counting_statements(self):
+        timings = instrumentation.RequestTimings()
+        token = instrumentation.current.set(timings)
+        try:
+            user_dashboard.dashboard_cache.clear()
+            html = user_dashboard.render_dashboard(self.user_id)
+        finally:
+            instrumentation.current.reset(token)
+        return html, [statement for statement, duration in timings.statements]
+
+    def test_warm_profile_renders_with_only_the_tasks_query(self):
+        cold_html, cold_statements = self.render_counting_statements()
+        warm_html, warm_statements = self.render_counting_statements()
+        self.assertEqual(cold_statements, [user_dashboard.DASHBOARD_QUERY])
+        self.assertEqual(warm_statements, [user_dashboard.TASKS_PAGE_QUERY])
+        self.assertEqual(warm_html, cold_html)
+        self.assertIn("John Smith", warm_html)
+        self.assertIn("5 beers", warm_html)
+
+    def test_profile_is_shared_between_workers_through_redis(self):
+        self.render_counting_statements()
+        user_profiles.profile_cache.clear()
+        html, statements = self.render_counting_statements()
+        self.assertEqual(statements, [user_dashboard.TASKS_PAGE_QUERY])
+        self.assertIn("Market", html)
+
+    def test_list_changes_show_up_immediately(self):
+        self.render_counting_statements()
+        list_id = user_todolists.create_todolist(self.user_id, "Gym")
+        self.assertIn("Gym", self.render_counting_statements()[0])
+        user_todolists.update_todolist_title_of_user(self.user_id, list_id, "Pool")
+        self.assertIn("Pool", self.render_counting_statements()[0])
+        user_todolists.update_todolist_title(list_id, "Park")
+        self.assertIn("Park", self.render_counting_statements()[0])
+        user_todolists.delete_todolist(self.user_id, list_id)
+        self.assertNotIn("Park", self.render_counting_statements()[0])
+
+    def test_stale_profile_is_not_stored_after_an_invalidation(self):
+        version = http_caching.get_user_version(self.user_id)[0]
+        profile, generation = user_profiles.get_cached_profile(self.user_id, version)
+        self.assertIsNone(profile)
+        user_profiles.invalidate_profile(self.user_id)
+        user_profiles.set_cached_profile(self.user_id, version, generation, {"name": "Stale", "lists": []})
+        user_profiles.profile_cache.clear()
+        self.assertEqual(user_profiles.get_cached_profile(self.user_id, version)[0], None)
+
+    def test_local_profile_is_dropped_when_the_user_version_changes(self):
+        user_profiles.set_local_profile(self.user_id, 1, {"name": "John Smith", "lists": []})
+        self.assertIsNotNone(user_profiles.get_local_profile(self.user_id, 1))
+        self.assertIsNone(user_profiles.get_local_profile(self.user_id, 2))
+
+
+class TestASGIUserProfiles(IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.user_id = add_verified_user("john12@fake.com")
+        cls.session_token = token_hex(32)
+        set_session_token_on_redis(cls.session_token, cls.user_id)
+
+    @classmethod
+    def tearDownClass(cls):
+        flushall_from_redis()
+        truncate_users()
+
+    async def asyncSetUp(self):
+        truncate_lists()
+        user_dashboard.dashboard_cache.clear()
+        user_profiles.invalidate_profile(self.user_id)
+        self.cookies = {"session-token": self.session_token}
+        self.conductor = testing.ASGIConductor(app.create_asgi())
+        await self.conductor.__aenter__()
+
+    async def asyncTearDown(self):
+        await self.conductor.__aexit__(None, None, None)
+
+    async def test_profile_is_invalidated_by_list_changes(self):
+        await self.conductor.simulate_post("/create-todolist", params={"create-todolist": "Market"},
+                                           cookies=self.cookies)
+        version = http_caching.get_user_version(self.user_id)[0]
+        self.assertEqual(user_profiles.get_cached_profile(self.user_id, version)[0]["lists"][0][1], "Market")
+        result = await self.conductor.simulate_post("/create-todolist", params={"create-todolist": "Gym"},
+                                                    cookies=self.cookies)
+        self.assertIn("Market", result.text)
+        self.assertIn("Gym", result.text)
+
+
+def add_verified_user(email):
+    hashed = bcrypt.hashpw("123abc-".encode(), bcrypt.gensalt(4))
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("INSERT INTO users (name, email, password, verified) \
+               VALUES ('John Smith', %s, %s, true) RETURNING user_id", [email, hashed.decode()])
+            return str(curs.fetchone().user_id)
+
+def set_session_token_on_redis(session_token, user_id):
+    with redis_conn.session_conn as conn:
+        conn.set(session_token, user_id)
+
+def truncate_users():
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("TRUNCATE users CASCADE")
+
+def truncate_lists():
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("TRUNCATE lists CASCADE")
+
+def flushall_from_redis():
+    with redis_conn.session_conn as conn:
+        conn.flushall()
@@ -4,7 +4,7 @@ import bcrypt
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
-from todolists import app, user_registration, email_server, db, redis_conn
+from todolists import app, user_registration, email_queue, email_server, db, redis_conn
 
 
 class TestUserRegistration(testing.TestCase):
@@ -18,6 +18,7 @@ class TestUserRegistration(testing.TestCase):
         self.verify_user_in_db = verify_user_in_db
 
     def tearDown(self):
+        email_server.pool.closeall()
         with db.conn as conn:
             with conn.cursor() as curs:
                 curs.execute("TRUNCATE users CASCADE;")
@@ -49,6 +50,7 @@ class TestUserRegistration(testing.TestCase):
         }
         self.simulate_post("/register", params=user_info)
         result = self.simulate_post("/register", params=user_info)
+        email_queue.outbox.join()
         self.assertEqual(result.status, HTTP_409)
 
     def test_get_user_form(self):
@@ -66,6 +68,7 @@ class TestUserRegistration(testing.TestCase):
             "password_2": "abc123-"
         }
         result = self.simulate_post("/register", params=user_info)
+        email_queue.outbox.join()
         with db.conn as conn:
             with conn.cursor() as curs:
                 curs.execute("SELECT name FROM users WHERE email = 'john12@fake.com';")
@@ -228,6 +231,7 @@ class TestUserRegistration(testing.TestCase):
             "password_2": "abc123-"
         }
         result = self.simulate_post("/register", params=user_info)
+        email_queue.outbox.join()
         template = app.templates_env.get_template("email_verification.html")
         self.assertEqual(result.text, template.render())
 
@@ -240,10 +244,12 @@ class TestUserRegistration(testing.TestCase):
     @patch("todolists.email_server.connect_server")
     def test_email_server_is_called_with_user_email(self, connect_server):
         user_registration.send_email_with_token("john12@fake.com")
+        email_queue.outbox.join()
         connect_server.assert_called_once()
 
     @patch("todolists.email_server.connect_server")
     @patch("todolists.email_server.send_mail")
     def test_email_server_sends_message_token(self, send_mail, connect_server):
         user_registration.send_email_with_token("john12@fake.com")
+        email_queue.outbox.join()
         email_server.send_mail.assert_called_once()
@@ -1,63 +1,69 @@
-import bcrypt
 from secrets import token_hex
 
 from todolists import app, db, redis_conn
-from todolists.user_authorization import check_session_token, AuthorizationError
+from todolists.password_hashing import check_password, PasswordHashingBusy
+from todolists.user_authorization import (check_session_token, set_session_token, unset_session_token,
+                                          unset_all_session_tokens, AuthorizationError)
 
 import falcon
 
 
 class UserAuthentication:
+    def __init__(self):
+        self.successful_login = app.templates["successful_login.html"]
+        self.login = app.templates["login.html"]
+        self.error_email_not_verified = app.templates["error-email-not-verified.html"]
+        self.error = app.templates["error.html"]
+
     def on_get(self, req, resp):
         resp.content_type = "text/html"
         try:
             user_id = check_session_token(req.cookies["session-token"])
-            template = app.templates_env.get_template("successful_login.html")
-            resp.text = template.render()
+            resp.text = self.successful_login.render()
         except:
             resp.status = falcon.HTTP_401
-            template = app.templates_env.get_template("login.html")
-            resp.text = template.render()
+            resp.text = self.login.render()
 
     def on_post(self, req, resp):
         resp.content_type = "text/html"
         try:
             session_token = authenticate_user(req.get_param("email"), req.get_param("password"))
         except NotVerifiedEmail as error:
-            try:
-                stored_password = get_stored_password_by_email(req.get_param("email"))
-                validate_password_against_db(req.get_param("password"), stored_password)
-                template = app.templates_env.get_template("error-email-not-verified.html")
-                resp.text = template.render(email=req.get_param("email"))
-            except AuthenticationError as error:
-                resp.status = falcon.HTTP_401
-                template = app.templates_env.get_template("error.html")
-                resp.text = template.render(error=error)
+            resp.text = self.error_email_not_verified.render(email=req.get_param("email"))
+        except AuthenticationError as error:
+            resp.status = falcon.HTTP_401
+            resp.text = self.error.render(error=error)
+        except PasswordHashingBusy as error:
+            self.render_busy(resp, error)
         except:
             resp.status = falcon.HTTP_500
-            template = app.templates_env.get_template("error.html")
-            resp.text = template.render(error="Unknown error.")
+            resp.text = self.error.render(error="Unknown error.")
         else:
             resp.set_cookie("session-token", session_token)
-            user_id = get_user_id(req.get_param("email"))
-            template = app.templates_env.get_template("successful_login.html")
-            resp.text = template.render()
+            resp.text = self.successful_login.render()
+
+    def render_busy(self, resp, error):
+        resp.status = falcon.HTTP_503
+        resp.append_header("Retry-After", "5")
+        resp.text = self.error.render(error=error.message)
 
 
 class UserLogout:
+    def __init__(self):
+        self.logout = app.templates["logout.html"]
+        self.index = app.templates["index.html"]
+
     def on_get(self, req, resp):
         resp.content_type = "text/html"
         try:
             check_session_token(req.cookies["session-token"])
             unset_session_token_on_redis(req.cookies["session-token"])
             resp.unset_cookie("session-token")
-            template = app.templates_env.get_template("logout.html")
-            resp.text = template.render()
+            resp.text = self.logout.render()
         except AuthorizationError:
             resp.status = falcon.HTTP_401
             resp.unset_cookie("session-token")
-            template = app.templates_env.get_template("index.html")
-            resp.text = template.render()
+            resp.text = self.index.render()
 
     def on_post(self, req, resp):
         resp.content_type = "text/html"
@@ -65,13 +71,29 @@ class UserLogout:
             check_session_token(req.cookies["session-token"])
             unset_session_token_on_redis(req.cookies["session-token"])
             resp.unset_cookie("session-token")
-            template = app.templates_env.get_template("logout.html")
-            resp.text = template.render()
+            resp.text = self.logout.render()
+        except AuthorizationError:
+            resp.status = falcon.HTTP_401
+            resp.unset_cookie("session-token")
+            resp.text = self.index.render()
+
+
+class UserLogoutEverywhere:
+    def __init__(self):
+        self.logout = app.templates["logout.html"]
+        self.index = app.templates["index.html"]
+
+    def on_post(self, req, resp):
+        resp.content_type = "text/html"
+        try:
+            user_id = check_session_token(req.cookies["session-token"])
+            unset_all_session_tokens(user_id)
+            resp.unset_cookie("session-token")
+            resp.text = self.logout.render()
         except AuthorizationError:
             resp.status = falcon.HTTP_401
             resp.unset_cookie("session-token")
-            template = app.templates_env.get_template("index.html")
-            resp.text = template.render()
+            resp.text = self.index.render()
 
 
 class AuthenticationError(Exception):
@@ -85,23 +107,22 @@ class NotVerifiedEmail(Exception):
 
 
 def authenticate_user(email, password):
-    with db.conn as conn:
-        with conn.cursor() as curs:
-            try:
-                curs.execute("SELECT verified, password FROM users WHERE email = %s", [email])
-                user = curs.fetchone()
-                email_verification = user.verified
-                stored_password = user.password
-            except:
-                email_verification = None
-                stored_password = None
-    validate_email_verification(email_verification)
-    validate_password_against_db(password, stored_password)
-    user_id = get_user_id(email)
+    user = get_user_credentials(email)
+    if user is None:
+        raise AuthenticationError("The email entered is not registered.")
+    # The password is checked first, so only its owner learns that the email is not verified yet.
+    validate_password_against_db(password, user.password)
+    validate_email_verification(user.verified)
     session_token = create_session_token()
-    set_session_token_on_redis(session_token, user_id)
+    set_session_token_on_redis(session_token, str(user.user_id))
     return session_token
 
+def get_user_credentials(email):
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute("SELECT user_id, verified, password FROM users WHERE email = %s", [email])
+            return curs.fetchone()
+
 def validate_email_verification(email_verification):
     if email_verification == None:
         raise AuthenticationError("The email entered is not registered.")
@@ -110,7 +131,7 @@ def validate_email_verification(email_verification):
 
 def validate_password_against_db(password, stored_password):
     hashed = stored_password
-    if not bcrypt.checkpw(password.encode(), hashed.encode()):
+    if not check_password(password, hashed):
         raise AuthenticationError("The password entered is wrong!")
 
 def get_user_id(email):
@@ -119,19 +140,11 @@ def get_user_id(email):
             curs.execute("SELECT user_id FROM users WHERE email = %s", [email])
             return str(curs.fetchone().user_id)
 
-def get_stored_password_by_email(email):
-    with db.conn as conn:
-        with conn.cursor() as curs:
-            curs.execute("SELECT password FROM users WHERE email = %s", [email])
-            return str(curs.fetchone().password)
-
 def create_session_token():
     return token_hex(32)
 
 def set_session_token_on_redis(session_token, user_id):
-    with redis_conn.session_conn as conn:
-        conn.set(session_token, user_id)
+    set_session_token(session_token, user_id)
 
 def unset_session_token_on_redis(session_token):
-    with redis_conn.session_conn as conn:
-        return conn.delete(session_token)
+    return unset_session_token(session_token)
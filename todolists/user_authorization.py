@@ -1,7 +1,26 @@
+from os import environ, getpid
 from string import hexdigits
 from binascii import unhexlify
+from threading import Lock, Thread
+from time import sleep, time
 
-from todolists import redis_conn
+import redis
+
+from todolists import caching, redis_conn
+
+
+LOGOUT_CHANNEL = "todolists:session-logout"
+SESSION_INDEX_KEY = "user-sessions:{}"
+
+session_absolute_ttl = int(environ.get("todolists_session_absolute_ttl", 30 * 24 * 3600))
+session_idle_ttl = int(environ.get("todolists_session_idle_ttl", 7 * 24 * 3600))
+session_refresh_below = int(environ.get("todolists_session_refresh_below", session_idle_ttl // 2))
+
+session_cache = caching.LRUCache(maxsize=int(environ.get("todolists_session_cache_size", 10000)),
+                                 ttl=float(environ.get("todolists_session_cache_ttl", 5)))
+use_logout_pubsub = environ.get("todolists_session_cache_pubsub", "false") == "true"
+logout_listener_pid = None
+logout_listener_lock = Lock()
 
 
 class AuthorizationError(Exception):
@@ -18,9 +37,108 @@ def is_64_chars_hex(session_token):
 
 def check_session_token(session_token):
     is_64_chars_hex(session_token)
+    if use_logout_pubsub:
+        start_logout_listener()
+    user_id = session_cache.get(session_token)
+    if user_id:
+        return user_id
+    with redis_conn.session_conn as conn:
+        pipe = conn.pipeline(transaction=False)
+        pipe.get(session_token)
+        pipe.ttl(session_token)
+        user_id, ttl = pipe.execute()
+    if not user_id:
+        raise AuthorizationError("Wrong/expired token.")
+    user_id = user_id.decode()
+    # Most checks only read; the idle TTL is pushed back once it runs below the threshold.
+    if ttl < session_refresh_below and not refresh_session_token(session_token, user_id):
+        raise AuthorizationError("Wrong/expired token.")
+    session_cache.set(session_token, user_id)
+    return user_id
+
+def set_session_token(session_token, user_id):
+    now = time()
+    index_key = SESSION_INDEX_KEY.format(user_id)
+    with redis_conn.session_conn as conn:
+        pipe = conn.pipeline()
+        pipe.set(session_token, user_id, ex=min(session_idle_ttl, session_absolute_ttl))
+        pipe.zadd(index_key, {session_token: now + session_absolute_ttl})
+        pipe.zremrangebyscore(index_key, "-inf", now)
+        pipe.expire(index_key, session_absolute_ttl)
+        pipe.execute()
+
+def refresh_session_token(session_token, user_id):
+    now = time()
+    index_key = SESSION_INDEX_KEY.format(user_id)
+    with redis_conn.session_conn as conn:
+        expires_at = conn.zscore(index_key, session_token)
+        if expires_at is None:
+            # Sessions stored before TTLs existed start their absolute lifetime now.
+            expires_at = now + session_absolute_ttl
+            pipe = conn.pipeline()
+            pipe.zadd(index_key, {session_token: expires_at})
+            pipe.expire(index_key, session_absolute_ttl)
+            pipe.execute()
+        ttl = int(min(session_idle_ttl, expires_at - now))
+        if ttl > 0:
+            return conn.expire(session_token, ttl)
+        pipe = conn.pipeline()
+        pipe.delete(session_token)
+        pipe.zrem(index_key, session_token)
+        pipe.execute()
+        return False
+
+def unset_session_token(session_token):
+    forget_session_token(session_token)
     with redis_conn.session_conn as conn:
         user_id = conn.get(session_token)
+        pipe = conn.pipeline()
+        pipe.delete(session_token)
         if user_id:
-            return user_id.decode()
-        else:
-            raise AuthorizationError("Wrong/expired token.")
+            pipe.zrem(SESSION_INDEX_KEY.format(user_id.decode()), session_token)
+        return pipe.execute()[0]
+
+def unset_all_session_tokens(user_id):
+    index_key = SESSION_INDEX_KEY.format(user_id)
+    with redis_conn.session_conn as conn:
+        session_tokens = [session_token.decode() for session_token in conn.zrange(index_key, 0, -1)]
+        pipe = conn.pipeline()
+        if session_tokens:
+            pipe.delete(*session_tokens)
+        pipe.delete(index_key)
+        pipe.execute()
+    for session_token in session_tokens:
+        forget_session_token(session_token)
+    return len(session_tokens)
+
+def forget_session_token(session_token):
+    session_cache.delete(session_token)
+    if use_logout_pubsub:
+        with redis_conn.session_conn as conn:
+            conn.publish(LOGOUT_CHANNEL, session_token)
+
+def start_logout_listener():
+    global logout_listener_pid
+    if logout_listener_pid == getpid():
+        return
+    with logout_listener_lock:
+        if logout_listener_pid != getpid():
+            Thread(target=listen_for_logouts, daemon=True).start()
+            logout_listener_pid = getpid()
+
+def listen_for_logouts():
+    # The subscription idles for as long as nobody logs out, so it gets a client without a read timeout.
+    listener_conn = redis_conn.create_client(redis_conn.session_db, socket_timeout=None)
+    while True:
+        pubsub = listener_conn.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(LOGOUT_CHANNEL)
+            # Logouts published while we were not subscribed are lost.
+            session_cache.clear()
+            for message in pubsub.listen():
+                session_cache.delete(message["data"].decode())
+        except redis.ConnectionError:
+            sleep(1)
+        finally:
+            # Each retry subscribes on a new connection, give this one back to the pool.
+            pubsub.close()
@@ -1,33 +1,182 @@
+from os import environ
+
 import falcon
 
-from todolists import app, db, redis_conn
+from todolists import app, caching, db, redis_conn, user_profiles
+from todolists.http_caching import get_etag, get_user_version, is_not_modified
 from todolists.user_authorization import check_session_token, AuthorizationError
 
 
+tasks_page_size = int(environ.get("todolists_tasks_page_size", 100))
+
+DASHBOARD_CACHE_KEY = "dashboard:{}:{}"
+
+dashboard_cache_backend = environ.get("todolists_dashboard_cache", "memory")
+dashboard_cache_ttl = int(environ.get("todolists_dashboard_cache_ttl", 3600))
+dashboard_cache = caching.LRUCache(maxsize=int(environ.get("todolists_dashboard_cache_size", 1000)),
+                                   ttl=dashboard_cache_ttl)
+
+# UNION ALL keeps no order of its own, part puts the user row first, then lists and tasks by id.
+DASHBOARD_QUERY = """
+    (SELECT 'user' AS kind, user_id AS id, name AS text, NULL::bool AS done, NULL::integer AS list_id, 0 AS part
+     FROM users WHERE user_id = %(user_id)s)
+    UNION ALL
+    (SELECT 'list', list_id, title, NULL, NULL, 1 FROM lists WHERE user_id = %(user_id)s)
+    UNION ALL
+    (SELECT 'task', task_id, task, done, list_id, 2 FROM tasks
+     WHERE list_id = (SELECT min(list_id) FROM lists
+                      WHERE user_id = %(user_id)s
+                      AND (%(list_id)s::integer IS NULL OR list_id = %(list_id)s))
+     ORDER BY task_id LIMIT %(limit)s)
+    ORDER BY part, id"""
+
+TASKS_PAGE_QUERY = """
+    SELECT task_id, task, done FROM tasks
+    WHERE list_id = (SELECT list_id FROM lists WHERE list_id = %(list_id)s AND user_id = %(user_id)s)
+    AND task_id > %(after)s
+    ORDER BY task_id LIMIT %(limit)s"""
+
+
 class UserDashboard:
+    def __init__(self):
+        self.login = app.templates["login.html"]
+
     def on_get(self, req, resp):
         resp.content_type = "text/html"
         try:
             user_id = check_session_token(req.cookies["session-token"])
-            template = app.templates_env.get_template("dashboard.html")
-            user_data = get_todolists_user_data(user_id)
-            resp.text = template.render(user=user_data)
+            not_modified, user_version = is_not_modified(req, resp, user_id, app.templates_digest)
+            if not_modified:
+                return
+            resp.text = render_dashboard(user_id, user_version=user_version)
         except AuthorizationError:
             resp.status = falcon.HTTP_401
-            template = app.templates_env.get_template("login.html")
+            resp.text = self.login.render()
+
+
+def render_dashboard(user_id, selected_todolist=None, user_version=None):
+    # Versions are bumped after commit, so a render stored under a version never
+    # misses a write counted by it; any later write changes the tag.
+    version, modified = user_version or get_user_version(user_id)
+    tag = get_etag(version, modified, app.templates_digest)
+    key = DASHBOARD_CACHE_KEY.format(user_id, selected_todolist)
+    html = get_cached_dashboard(key, tag)
+    if html is None:
+        user_data = get_cached_todolists_user_data(user_id, version, selected_todolist)
+        html = app.templates["dashboard.html"].render(user=user_data)
+        set_cached_dashboard(key, tag, html)
+    return html
+
+def get_cached_dashboard(key, tag):
+    if dashboard_cache_backend == "redis":
+        with redis_conn.cache_conn as conn:
+            return read_cached_dashboard(tag, *conn.hmget(key, "tag", "html"))
+    cached = dashboard_cache.get(key)
+    if cached is None or cached[0] != tag:
+        return None
+    return cached[1]
 
+def set_cached_dashboard(key, tag, html):
+    if dashboard_cache_backend == "redis":
+        with redis_conn.cache_conn as conn:
+            pipe = conn.pipeline()
+            queue_set_cached_dashboard(pipe, key, tag, html)
+            pipe.execute()
+    else:
+        dashboard_cache.set(key, (tag, html))
+
+def read_cached_dashboard(tag, cached_tag, html):
+    if cached_tag is None or cached_tag.decode() != tag:
+        return None
+    return html.decode()
+
+def queue_set_cached_dashboard(pipe, key, tag, html):
+    pipe.hset(key, mapping={"tag": tag, "html": html})
+    pipe.expire(key, dashboard_cache_ttl)
 
 def get_todolists_user_data(user_id, selected_todolist=None):
-    author, todolists = get_user_name_and_todolists(user_id)
-    todolists_user_data = generate_user_data_dict(author, selected_todolist, todolists)
+    return build_todolists_user_data(get_dashboard_records(user_id, selected_todolist), selected_todolist)
+
+def get_cached_todolists_user_data(user_id, version, selected_todolist=None):
+    profile, generation = user_profiles.get_cached_profile(user_id, version)
+    if profile is None:
+        # One query still loads everything on a miss, the profile is kept from its rows.
+        records = get_dashboard_records(user_id, selected_todolist)
+        user_profiles.set_cached_profile(user_id, version, generation, build_profile(records))
+        return build_todolists_user_data(records, selected_todolist)
+    todolists_user_data = build_profile_user_data(profile, selected_todolist)
+    selected_todolist = todolists_user_data["selected_todolist"]
+    if selected_todolist in todolists_user_data["todolists"]:
+        add_tasks_page(todolists_user_data, *get_tasks_page(user_id, selected_todolist))
+    return todolists_user_data
+
+def build_todolists_user_data(records, selected_todolist=None):
+    todolists_user_data = generate_user_data_dict(None, selected_todolist)
+    todolists = todolists_user_data["todolists"]
+    tasks, tasks_list_id = {}, None
+    for kind, id, text, done, list_id, part in records:
+        if kind == "user":
+            todolists_user_data["author"] = text
+        elif kind == "list":
+            todolists[id] = {"title": text, "tasks": {}}
+        else:
+            tasks[id] = {"task": text, "done": done}
+            tasks_list_id = list_id
+    if tasks:
+        todolists[tasks_list_id]["tasks"] = tasks
+        if len(tasks) > tasks_page_size:
+            tasks.popitem()
+            todolists[tasks_list_id]["next_page"] = next(reversed(tasks))
     if selected_todolist==None and todolists:
         select_oldest_todolist_if_any(todolists_user_data)
-        selected_todolist = todolists_user_data["selected_todolist"]
-    if selected_todolist:
-        tasks = get_tasks_of_selected_todolist(selected_todolist)
-        todolists_user_data["todolists"][selected_todolist]["tasks"] = tasks
     return todolists_user_data
 
+def build_profile(records):
+    profile = {"name": None, "lists": []}
+    for kind, id, text, done, list_id, part in records:
+        if kind == "user":
+            profile["name"] = text
+        elif kind == "list":
+            profile["lists"].append([id, text])
+    return profile
+
+def build_profile_user_data(profile, selected_todolist=None):
+    todolists_user_data = generate_user_data_dict(profile["name"], selected_todolist)
+    for list_id, title in profile["lists"]:
+        todolists_user_data["todolists"][list_id] = {"title": title, "tasks": {}}
+    if selected_todolist==None and todolists_user_data["todolists"]:
+        select_oldest_todolist_if_any(todolists_user_data)
+    return todolists_user_data
+
+def add_tasks_page(todolists_user_data, tasks, next_page):
+    todolist = todolists_user_data["todolists"][todolists_user_data["selected_todolist"]]
+    todolist["tasks"] = tasks
+    if next_page is not None:
+        todolist["next_page"] = next_page
+
+def get_dashboard_params(user_id, selected_todolist):
+    return {"user_id": user_id, "list_id": selected_todolist, "limit": tasks_page_size + 1}
+
+def get_tasks_page_params(user_id, list_id, after):
+    return {"list_id": list_id, "user_id": user_id, "after": after, "limit": tasks_page_size + 1}
+
+def get_dashboard_records(user_id, selected_todolist=None):
+    with db.conn as conn:
+        with conn.cursor(cursor_factory=db.psycopg2.extensions.cursor) as curs:
+            curs.execute(DASHBOARD_QUERY, get_dashboard_params(user_id, selected_todolist))
+            return curs.fetchall()
+
+def get_tasks_page(user_id, list_id, after=0):
+    with db.conn as conn:
+        with conn.cursor(cursor_factory=db.psycopg2.extensions.cursor) as curs:
+            curs.execute(TASKS_PAGE_QUERY, get_tasks_page_params(user_id, list_id, after))
+            return build_tasks_page(curs.fetchall())
+
+def build_tasks_page(records):
+    tasks = {task_id: {"task": task, "done": done} for task_id, task, done in records[:tasks_page_size]}
+    next_page = records[tasks_page_size - 1][0] if len(records) > tasks_page_size else None
+    return tasks, next_page
+
 def get_user_name_and_todolists(user_id):
     with db.conn as conn:
         with conn.cursor() as curs:
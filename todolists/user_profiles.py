@@ -0,0 +1,73 @@
+import json
+from os import environ
+
+from todolists import caching, redis_conn
+
+
+# A user's name and list titles, {"name": ..., "lists": [[list_id, title], ...]}, change far less often
+# than tasks, so dashboard renders read them from here and only query Postgres for tasks.
+PROFILE_KEY = "user-profile:{}"
+
+profile_cache_ttl = int(environ.get("todolists_profile_cache_ttl", 3600))
+profile_cache = caching.LRUCache(maxsize=int(environ.get("todolists_profile_cache_size", 10000)),
+                                 ttl=profile_cache_ttl)
+
+# Stores a profile read from Postgres only if no write bumped the generation since it was read,
+# so a slow reader cannot put back a profile that a concurrent write has just invalidated.
+SET_IF_GENERATION_SCRIPT = """
+if redis.call("HGET", KEYS[1], "generation") == (ARGV[1] ~= "" and ARGV[1] or false) then
+    redis.call("HSET", KEYS[1], "profile", ARGV[2])
+    redis.call("EXPIRE", KEYS[1], ARGV[3])
+end
+"""
+
+set_if_generation = redis_conn.cache_conn.register_script(SET_IF_GENERATION_SCRIPT)
+
+
+def get_local_profile(user_id, version):
+    # In-process entries are tagged with the user version, which every write from any worker bumps.
+    cached = profile_cache.get(PROFILE_KEY.format(user_id))
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+def set_local_profile(user_id, version, profile):
+    profile_cache.set(PROFILE_KEY.format(user_id), (version, profile))
+
+def forget_local_profile(user_id):
+    profile_cache.delete(PROFILE_KEY.format(user_id))
+
+def read_profile(user_id, version, generation, profile):
+    if profile is None:
+        return None, generation
+    profile = json.loads(profile)
+    set_local_profile(user_id, version, profile)
+    return profile, generation
+
+def get_set_profile_args(generation, profile):
+    return [generation or "", json.dumps(profile), profile_cache_ttl]
+
+def queue_invalidate_profile(pipe, user_id):
+    key = PROFILE_KEY.format(user_id)
+    pipe.hincrby(key, "generation", 1)
+    pipe.hdel(key, "profile")
+    pipe.expire(key, profile_cache_ttl)
+
+def get_cached_profile(user_id, version):
+    profile = get_local_profile(user_id, version)
+    if profile is not None:
+        return profile, None
+    with redis_conn.cache_conn as conn:
+        generation, profile = conn.hmget(PROFILE_KEY.format(user_id), "generation", "profile")
+    return read_profile(user_id, version, generation, profile)
+
+def set_cached_profile(user_id, version, generation, profile):
+    set_if_generation(keys=[PROFILE_KEY.format(user_id)], args=get_set_profile_args(generation, profile))
+    set_local_profile(user_id, version, profile)
+
+def invalidate_profile(user_id):
+    # Call after committing any change to the user's name or lists, before bumping the user version.
+    with redis_conn.cache_conn as conn:
+        pipe = conn.pipeline()
+        queue_invalidate_profile(pipe, user_id)
+        pipe.execute()
+    forget_local_profile(user_id)
@@ -1,16 +1,20 @@
-import bcrypt
 from secrets import randbelow
-from falcon import HTTP_403, HTTP_409
+from falcon import HTTP_403, HTTP_409, HTTP_503
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
-from todolists import app, db, email_server, redis_conn
+from todolists import app, db, email_queue, redis_conn
+from todolists.password_hashing import hash_password, PasswordHashingBusy
 
 class UserRegistration:
+    def __init__(self):
+        self.index = app.templates["index.html"]
+        self.error = app.templates["error.html"]
+        self.email_verification = app.templates["email_verification.html"]
+
     def on_get(self, req, resp):
         resp.content_type = "text/html"
-        page = app.templates_env.get_template("index.html")
-        resp.text = page.render()
+        resp.text = self.index.render()
 
     def on_post(self, req, resp):
         resp.content_type = "text/html"
@@ -21,20 +25,21 @@ class UserRegistration:
             send_email_with_token(req.get_param("email"))   
         except ValidationError as error:
             resp.status = HTTP_403
-            template = app.templates_env.get_template("error.html")
-            resp.text = template.render(error=error.message)
+            resp.text = self.error.render(error=error.message)
         except db.psycopg2.errors.UniqueViolation as error:
             resp.status = HTTP_409
-            template = app.templates_env.get_template("error.html")
-            resp.text = template.render(error="This email is already in use!\n\
+            resp.text = self.error.render(error="This email is already in use!\n\
                                                You must sign in with your password to use TodoLists.\
                                                Or you can go back, choose another email and try to sign up again.\
                                                If you are not aware of this registration AND you are sure the email is\
                                                yours, contact us.")
+        except PasswordHashingBusy as error:
+            resp.status = HTTP_503
+            resp.append_header("Retry-After", "5")
+            resp.text = self.error.render(error=error.message)
         else:
             resp.unset_cookie("session-token")
-            template = app.templates_env.get_template("email_verification.html")
-            resp.text = template.render()
+            resp.text = self.email_verification.render()
 
 
 class ValidationError(Exception):
@@ -64,9 +69,7 @@ def validate_password(password_1, password_2):
         raise ValidationError("Password must be 6-30 characters long.")
 
 def encrypt_password(password):
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password.encode(), salt)
-    return hashed
+    return hash_password(password)
 
 def save_user_info_to_db(name, email, password):
     with db.conn as conn:
@@ -78,8 +81,7 @@ def send_email_with_token(email):
     token = create_token()
     save_token_to_redis(token, email)
     email_message = build_email_message_sending_token(token, email)
-    server_connection = email_server.connect_server()
-    email_server.send_mail(email, email_message, server_connection)
+    email_queue.enqueue(email, email_message)
 
 def create_token():
         token = randbelow(1000000)
@@ -87,8 +89,7 @@ def create_token():
 
 def save_token_to_redis(token, email):
     with redis_conn.conn as conn:
-        conn.set(token, email)
-        conn.expire(token, 600)
+        conn.set(token, email, ex=600)
 
 def build_email_message_sending_token(token, email):
     message = MIMEMultipart()
@@ -100,4 +101,4 @@ def build_email_message_sending_token(token, email):
     return message.as_string()
 
 def build_email_message_sending_token_html_body(token):
-    return app.templates_env.get_template("email_message_sending_code.html").render(token=token)
+    return app.templates["email_message_sending_code.html"].render(token=token)
@@ -1,29 +1,146 @@
+from os import environ
+
 import falcon
 
 from todolists import app, db, redis_conn
-from todolists.user_dashboard import get_todolists_user_data
+from todolists.http_caching import bump_user_version
+from todolists.user_dashboard import get_tasks_page, render_dashboard
 from todolists.user_authorization import check_session_token, AuthorizationError
 
 
+bulk_max_tasks = int(environ.get("todolists_bulk_max_tasks", 1000))
+
+# Shared with the ASGI app, which only runs them through asyncpg instead of psycopg2.
+CREATE_TASK_IN_TODOLIST_QUERY = """
+    INSERT INTO tasks (list_id, task) VALUES (%(list_id)s, %(task)s)
+    RETURNING task_id, (SELECT user_id FROM lists WHERE lists.list_id = tasks.list_id)"""
+
+CREATE_TASK_OF_USER_QUERY = """
+    INSERT INTO tasks (list_id, task)
+    SELECT list_id, %(task)s FROM lists WHERE list_id = %(list_id)s AND user_id = %(user_id)s
+    RETURNING task_id, task, done, list_id"""
+
+UPDATE_TASK_OF_USER_QUERY = """
+    UPDATE tasks SET task = coalesce(%(task)s, task), done = coalesce(%(done)s, done)
+    WHERE task_id = %(task_id)s
+    AND list_id = (SELECT list_id FROM lists WHERE list_id = %(list_id)s AND user_id = %(user_id)s)
+    RETURNING task_id, task, done, list_id"""
+
+DELETE_TASK_OF_USER_QUERY = """
+    DELETE FROM tasks WHERE task_id = %(task_id)s
+    AND list_id = (SELECT list_id FROM lists WHERE list_id = %(list_id)s AND user_id = %(user_id)s)
+    RETURNING task_id, task, done, list_id"""
+
+# One statement for the whole batch, the tasks keep the order they were typed in.
+CREATE_TASKS_OF_USER_QUERY = """
+    INSERT INTO tasks (list_id, task)
+    SELECT lists.list_id, new_tasks.task FROM unnest(%(tasks)s::text[]) WITH ORDINALITY AS new_tasks (task, position)
+    JOIN lists ON lists.list_id = %(list_id)s AND lists.user_id = %(user_id)s
+    ORDER BY new_tasks.position
+    RETURNING task_id"""
+
+MARK_TASKS_OF_USER_QUERY = """
+    UPDATE tasks SET done = %(done)s WHERE task_id = ANY(%(task_ids)s::integer[])
+    AND list_id = (SELECT list_id FROM lists WHERE list_id = %(list_id)s AND user_id = %(user_id)s)"""
+
+DELETE_TASKS_OF_USER_QUERY = """
+    DELETE FROM tasks WHERE task_id = ANY(%(task_ids)s::integer[])
+    AND list_id = (SELECT list_id FROM lists WHERE list_id = %(list_id)s AND user_id = %(user_id)s)"""
+
+DELETE_TASK_QUERY = """
+    DELETE FROM tasks WHERE task_id = %(task_id)s
+    RETURNING (SELECT user_id FROM lists WHERE lists.list_id = tasks.list_id)"""
+
+MARK_TASK_QUERY = """
+    UPDATE tasks SET done = %(done)s WHERE task_id = %(task_id)s
+    RETURNING (SELECT user_id FROM lists WHERE lists.list_id = tasks.list_id)"""
+
+
 class CreateTask:
+    def __init__(self):
+        self.error = app.templates["error.html"]
+
     def on_post(self, req, resp):
         resp.content_type="text/html"
         try:
             user_id = check_session_token(req.cookies["session-token"])
         except AuthorizationError as error:
             resp.status = falcon.HTTP_401
-            template = app.templates_env.get_template("error.html")
-            resp.text = template.render(error=error)
+            resp.text = self.error.render(error=error)
         except:
             resp.status = falcon.HTTP_500
-            resp.text = template.render(error="Contact the website owner.")
+            resp.text = self.error.render(error="Contact the website owner.")
         else:
             selected_todolist = int(req.get_param("selected-todolist"))
             new_task = req.get_param("create-task")
             create_task_in_todolist(selected_todolist, new_task)
-            template = app.templates_env.get_template("dashboard.html")
-            user_data = get_todolists_user_data(user_id, selected_todolist)
-            resp.text = template.render(user=user_data)
+            resp.text = render_dashboard(user_id, selected_todolist)
+
+
+class ReadTasks:
+    def __init__(self):
+        self.error = app.templates["error.html"]
+        self.tasks = app.templates["tasks.html"]
+
+    def on_get(self, req, resp):
+        resp.content_type = "text/html"
+        try:
+            user_id = check_session_token(req.cookies["session-token"])
+        except AuthorizationError as error:
+            resp.status = falcon.HTTP_401
+            resp.text = self.error.render(error=error)
+        except:
+            resp.status = falcon.HTTP_500
+            resp.text = self.error.render(error="Contact the website owner.")
+        else:
+            selected_todolist = req.get_param_as_int("selected-todolist", required=True)
+            tasks, next_page = get_tasks_page(user_id, selected_todolist, req.get_param_as_int("after", default=0))
+            resp.text = self.tasks.render(tasks=tasks, next_page=next_page, selected_todolist_id=selected_todolist)
+
+
+class BulkTasks:
+    def __init__(self):
+        self.error = app.templates["error.html"]
+
+    def on_post(self, req, resp):
+        resp.content_type = "text/html"
+        try:
+            user_id = check_session_token(req.cookies["session-token"])
+        except AuthorizationError as error:
+            resp.status = falcon.HTTP_401
+            resp.text = self.error.render(error=error)
+        except:
+            resp.status = falcon.HTTP_500
+            resp.text = self.error.render(error="Contact the website owner.")
+        else:
+            selected_todolist = int(req.get_param("selected-todolist"))
+            try:
+                self.apply(req, user_id, selected_todolist)
+            except BulkTasksError as error:
+                resp.status = falcon.HTTP_400
+                resp.text = self.error.render(error=error.message)
+            else:
+                resp.text = render_dashboard(user_id, selected_todolist)
+
+
+class CreateTasks(BulkTasks):
+    def apply(self, req, user_id, selected_todolist):
+        create_tasks_of_user(user_id, selected_todolist, get_new_tasks(req))
+
+
+class UpdateTasks(BulkTasks):
+    def apply(self, req, user_id, selected_todolist):
+        mark_tasks_of_user(user_id, selected_todolist, get_task_ids(req), req.get_param("mark-task") != "false")
+
+
+class DeleteTasks(BulkTasks):
+    def apply(self, req, user_id, selected_todolist):
+        delete_tasks_of_user(user_id, selected_todolist, get_task_ids(req))
+
+
+class BulkTasksError(Exception):
+    def __init__(self, message):
+        self.message = message
 
 
 class UpdateTask:
@@ -38,9 +155,7 @@ class UpdateTask:
         else:
             done = True
         mark_task(int(task_id), done)
-        template = app.templates_env.get_template("dashboard.html")
-        user_data = get_todolists_user_data(user_id, int(selected_todolist))
-        resp.text = template.render(user=user_data)
+        resp.text = render_dashboard(user_id, int(selected_todolist))
 
 
 class DeleteTask:
@@ -49,31 +164,113 @@ class DeleteTask:
         user_id = check_session_token(req.cookies["session-token"])
         selected_todolist, task_id = req.get_param("selected-todolist"), req.get_param("delete-task")
         delete_task(int(task_id))
-        template = app.templates_env.get_template("dashboard.html")
-        user_data = get_todolists_user_data(user_id, int(selected_todolist))
-        resp.text = template.render(user=user_data)
+        resp.text = render_dashboard(user_id, int(selected_todolist))
 
 
 def create_task_in_todolist(list_id, task):
     with db.conn as conn:
         with conn.cursor() as curs:
-            curs.execute("INSERT INTO tasks (list_id, task) VALUES (%s, %s) RETURNING task_id", [list_id, task])
-            return curs.fetchone().task_id
+            curs.execute(CREATE_TASK_IN_TODOLIST_QUERY, {"list_id": list_id, "task": task})
+            record = curs.fetchone()
+    bump_user_version(record.user_id)
+    return record.task_id
+
+def create_task_of_user(user_id, list_id, task):
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute(CREATE_TASK_OF_USER_QUERY, {"task": task, "list_id": list_id, "user_id": user_id})
+            record = curs.fetchone()
+    if record:
+        bump_user_version(user_id)
+    return record
+
+def update_task_of_user(user_id, list_id, task_id, task=None, done=None):
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute(UPDATE_TASK_OF_USER_QUERY,
+                         {"task": task, "done": done, "task_id": task_id, "list_id": list_id, "user_id": user_id})
+            record = curs.fetchone()
+    if record:
+        bump_user_version(user_id)
+    return record
+
+def delete_task_of_user(user_id, list_id, task_id):
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute(DELETE_TASK_OF_USER_QUERY, {"task_id": task_id, "list_id": list_id, "user_id": user_id})
+            record = curs.fetchone()
+    if record:
+        bump_user_version(user_id)
+    return record
+
+def get_task_ids(req):
+    task_ids = req.get_param_as_list("task-ids", transform=int, default=[])
+    if len(task_ids) > bulk_max_tasks:
+        raise BulkTasksError(f"You can change up to {bulk_max_tasks} tasks at once.")
+    return task_ids
+
+def get_new_tasks(req):
+    tasks = [task.strip() for task in (req.get_param("create-tasks") or "").splitlines() if task.strip()]
+    validate_bulk_tasks(tasks)
+    return tasks
+
+def validate_bulk_tasks(tasks):
+    if len(tasks) > bulk_max_tasks:
+        raise BulkTasksError(f"You can add up to {bulk_max_tasks} tasks at once.")
+    for task in tasks:
+        if len(task) > 500:
+            raise BulkTasksError("Tasks must have up to 500 characters.")
+
+def create_tasks_of_user(user_id, list_id, tasks):
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute(CREATE_TASKS_OF_USER_QUERY, {"tasks": tasks, "list_id": list_id, "user_id": user_id})
+            records = curs.fetchall()
+    if records:
+        bump_user_version(user_id)
+    return [record.task_id for record in records]
+
+def mark_tasks_of_user(user_id, list_id, task_ids, done):
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute(MARK_TASKS_OF_USER_QUERY,
+                         {"done": done, "task_ids": task_ids, "list_id": list_id, "user_id": user_id})
+            updated = curs.rowcount
+    if updated:
+        bump_user_version(user_id)
+    return updated
+
+def delete_tasks_of_user(user_id, list_id, task_ids):
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute(DELETE_TASKS_OF_USER_QUERY, {"task_ids": task_ids, "list_id": list_id, "user_id": user_id})
+            deleted = curs.rowcount
+    if deleted:
+        bump_user_version(user_id)
+    return deleted
 
 def delete_task(task_id):
     with db.conn as conn:
         with conn.cursor() as curs:
-            curs.execute("DELETE FROM tasks WHERE task_id = %s", [task_id])
+            curs.execute(DELETE_TASK_QUERY, {"task_id": task_id})
+            record = curs.fetchone()
+    if record:
+        bump_user_version(record.user_id)
 
 def update_task_text(task_id, new_text):
     with db.conn as conn:
         with conn.cursor() as curs:
-            curs.execute("UPDATE tasks SET task = %s WHERE task_id = %s", [new_text, task_id])
+            curs.execute("""
+                UPDATE tasks SET task = %s WHERE task_id = %s
+                RETURNING (SELECT user_id FROM lists WHERE lists.list_id = tasks.list_id)""", [new_text, task_id])
+            record = curs.fetchone()
+    if record:
+        bump_user_version(record.user_id)
 
 def mark_task(task_id, done):
     with db.conn as conn:
         with conn.cursor() as curs:
-            if done:
-                curs.execute("UPDATE tasks SET done = true WHERE task_id = %s", [task_id])
-            else:
-                curs.execute("UPDATE tasks SET done = false WHERE task_id = %s", [task_id])
+            curs.execute(MARK_TASK_QUERY, {"done": bool(done), "task_id": task_id})
+            record = curs.fetchone()
+    if record:
+        bump_user_version(record.user_id)
@@ -1,104 +1,211 @@
+from os import environ
+
 import falcon
 
 from todolists import app, db, redis_conn
-from todolists.user_dashboard import get_todolists_user_data
+from todolists.user_profiles import forget_local_profile, queue_invalidate_profile
+from todolists.http_caching import bump_user_version, is_not_modified, queue_bump_user_version
+from todolists.user_dashboard import render_dashboard
 from todolists.user_authorization import check_session_token, AuthorizationError
 
 
+delete_batch_size = int(environ.get("todolists_delete_batch_size", 5000))
+
+# Shared with the ASGI app, which only runs them through asyncpg instead of psycopg2.
+CREATE_TODOLIST_QUERY = "INSERT INTO lists (title, user_id) VALUES (%(title)s, %(user_id)s) RETURNING list_id"
+
+TODOLISTS_OF_USER_QUERY = "SELECT list_id, title FROM lists WHERE user_id = %(user_id)s ORDER BY list_id"
+
+TODOLIST_OF_USER_QUERY = "SELECT list_id, title FROM lists WHERE list_id = %(list_id)s AND user_id = %(user_id)s"
+
+UPDATE_TODOLIST_TITLE_OF_USER_QUERY = """
+    UPDATE lists SET title = %(title)s WHERE list_id = %(list_id)s AND user_id = %(user_id)s
+    RETURNING list_id, title"""
+
+UPDATE_TODOLIST_TITLE_QUERY = "UPDATE lists SET title = %(title)s WHERE list_id = %(list_id)s RETURNING user_id"
+
+# Tasks go batch_size per transaction, so no single one holds long locks on a big list.
+DELETE_TODOLIST_TASKS_QUERY = """
+    DELETE FROM tasks WHERE task_id IN (
+        SELECT task_id FROM tasks
+        WHERE list_id = (SELECT list_id FROM lists WHERE list_id = %(list_id)s AND user_id = %(user_id)s)
+        ORDER BY task_id LIMIT %(batch_size)s)"""
+
+# Runs in the transaction that deleted the last tasks, so it does not need the ON DELETE CASCADE of migration 0003.
+DELETE_TODOLIST_QUERY = """
+    DELETE FROM lists WHERE list_id = %(list_id)s AND user_id = %(user_id)s
+    AND NOT EXISTS (SELECT 1 FROM tasks WHERE list_id = %(list_id)s)"""
+
+
 class CreateTodolist:
+    def __init__(self):
+        self.error = app.templates["error.html"]
+
     def on_post(self, req, resp):
         resp.content_type = "text/html"
         try:
             user_id = check_session_token(req.cookies["session-token"])
         except AuthorizationError as error:
             resp.status = falcon.HTTP_401
-            template = app.templates_env.get_template("error.html")
-            resp.text = template.render(error=error)
+            resp.text = self.error.render(error=error)
         except:
             resp.status = falcon.HTTP_500
-            resp.text = template.render(error="Contact the website owner.")
+            resp.text = self.error.render(error="Contact the website owner.")
         else:
             list_id = create_todolist(user_id, req.get_param("create-todolist"))
-            template = app.templates_env.get_template("dashboard.html")
-            user_data = get_todolists_user_data(user_id, selected_todolist=list_id)
-            resp.text = template.render(user=user_data)
+            resp.text = render_dashboard(user_id, selected_todolist=list_id)
 
 
 class ReadTodoList:
+    def __init__(self):
+        self.error = app.templates["error.html"]
+
+    def on_get(self, req, resp):
+        resp.content_type = "text/html"
+        try:
+            user_id = check_session_token(req.cookies["session-token"])
+        except AuthorizationError as error:
+            resp.status = falcon.HTTP_401
+            resp.text = self.error.render(error=error)
+        except:
+            resp.status = falcon.HTTP_500
+            resp.text = self.error.render(error="Contact the website owner.")
+        else:
+            selected_todolist = req.get_param_as_int("get-todolist", required=True)
+            not_modified, user_version = is_not_modified(req, resp, user_id, app.templates_digest, selected_todolist)
+            if not_modified:
+                return
+            resp.text = render_dashboard(user_id, selected_todolist, user_version)
+
     def on_post(self, req, resp):
         resp.content_type = "text/html"
         try:
             user_id = check_session_token(req.cookies["session-token"])
         except AuthorizationError as error:
             resp.status = falcon.HTTP_401
-            template = app.templates_env.get_template("error.html")
-            resp.text = template.render(error=error)
+            resp.text = self.error.render(error=error)
         except:
             resp.status = falcon.HTTP_500
-            resp.text = template.render(error="Contact the website owner.")
+            resp.text = self.error.render(error="Contact the website owner.")
         else:
             selected_todolist = int(req.get_param("get-todolist"))
-            template = app.templates_env.get_template("dashboard.html")
-            user_data = get_todolists_user_data(user_id, selected_todolist)
-            resp.text = template.render(user=user_data)
+            resp.text = render_dashboard(user_id, selected_todolist)
 
 
 class UpdateTodoList:
+    def __init__(self):
+        self.error = app.templates["error.html"]
+
     def on_post(self, req, resp):
         resp.content_type = "text/html"
         try:
             user_id = check_session_token(req.cookies["session-token"])
         except AuthorizationError as error:
             resp.status = falcon.HTTP_401
-            template = app.templates_env.get_template("error.html")
-            resp.text = template.render(error=error)
+            resp.text = self.error.render(error=error)
         except:
             resp.status = falcon.HTTP_500
-            resp.text = template.render(error="Contact the website owner.")
+            resp.text = self.error.render(error="Contact the website owner.")
         else:
             selected_todolist = int(req.get_param("update-todolist"))
             new_title = req.get_param("change-todolist-title")
             update_todolist_title(selected_todolist, new_title)
-            template = app.templates_env.get_template("dashboard.html")
-            user_data = get_todolists_user_data(user_id, selected_todolist)
-            resp.text = template.render(user=user_data)
+            resp.text = render_dashboard(user_id, selected_todolist)
 
 
 class DeleteTodoList:
+    def __init__(self):
+        self.error = app.templates["error.html"]
+
     def on_post(self, req, resp):
         resp.content_type = "text/html"
         try:            
             user_id = check_session_token(req.cookies["session-token"])
         except AuthorizationError as error:
             resp.status = falcon.HTTP_401
-            template = app.templates_env.get_template("error.html")
-            resp.text = template.render(error=error)
+            resp.text = self.error.render(error=error)
         except:
             resp.status = falcon.HTTP_500
-            resp.text = template.render(error="Contact the website owner.")
+            resp.text = self.error.render(error="Contact the website owner.")
         else:
             selected_todolist = int(req.get_param("delete-todolist"))
-            delete_todolist(selected_todolist)
-            template = app.templates_env.get_template("dashboard.html")
-            user_data = get_todolists_user_data(user_id)
-            resp.text = template.render(user=user_data)
+            if delete_todolist(user_id, selected_todolist):
+                resp.text = render_dashboard(user_id)
+            else:
+                resp.status = falcon.HTTP_404
+                resp.text = self.error.render(error="This TodoList does not exist.")
 
 
+def get_delete_todolist_params(user_id, list_id):
+    return {"user_id": user_id, "list_id": list_id, "batch_size": delete_batch_size}
+
+def queue_todolists_changed(pipe, user_id):
+    # The profile goes first, a render that sees the new version cannot find the old lists.
+    queue_invalidate_profile(pipe, user_id)
+    queue_bump_user_version(pipe, user_id)
+
+def todolists_changed(user_id):
+    with redis_conn.cache_conn as conn:
+        pipe = conn.pipeline()
+        queue_todolists_changed(pipe, user_id)
+        pipe.execute()
+    forget_local_profile(user_id)
+
 def create_todolist(user_id, title):
     with db.conn as conn:
         with conn.cursor() as curs:
-            curs.execute("INSERT INTO lists (title, user_id) VALUES (%s, %s) RETURNING list_id", [title, user_id])
+            curs.execute(CREATE_TODOLIST_QUERY, {"title": title, "user_id": user_id})
             try:
-                return curs.fetchone().list_id
+                list_id = curs.fetchone().list_id
             except:
                 raise ValueError("You cannot create another TodoList with this title.")
+    todolists_changed(user_id)
+    return list_id
 
-def update_todolist_title(list_id, new_title):
+def get_todolists_of_user(user_id):
     with db.conn as conn:
         with conn.cursor() as curs:
-            curs.execute("UPDATE lists SET title = %s WHERE list_id = %s", [new_title, list_id])
+            curs.execute(TODOLISTS_OF_USER_QUERY, {"user_id": user_id})
+            return curs.fetchall()
 
-def delete_todolist(list_id):
+def get_todolist_of_user(user_id, list_id):
     with db.conn as conn:
         with conn.cursor() as curs:
-            curs.execute("DELETE FROM tasks WHERE list_id IN (SELECT %s FROM tasks); DELETE FROM lists WHERE list_id = %s;", [list_id, list_id])
\ No newline at end of file
+            curs.execute(TODOLIST_OF_USER_QUERY, {"list_id": list_id, "user_id": user_id})
+            return curs.fetchone()
+
+def update_todolist_title_of_user(user_id, list_id, new_title):
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute(UPDATE_TODOLIST_TITLE_OF_USER_QUERY,
+                         {"title": new_title, "list_id": list_id, "user_id": user_id})
+            record = curs.fetchone()
+    if record:
+        todolists_changed(user_id)
+    return record
+
+def update_todolist_title(list_id, new_title):
+    with db.conn as conn:
+        with conn.cursor() as curs:
+            curs.execute(UPDATE_TODOLIST_TITLE_QUERY, {"title": new_title, "list_id": list_id})
+            record = curs.fetchone()
+    if record:
+        todolists_changed(record.user_id)
+
+def delete_todolist(user_id, list_id):
+    params = get_delete_todolist_params(user_id, list_id)
+    while True:
+        deleted_list = 0
+        with db.conn as conn:
+            with conn.cursor() as curs:
+                curs.execute(DELETE_TODOLIST_TASKS_QUERY, params)
+                deleted_tasks = curs.rowcount
+                if deleted_tasks < params["batch_size"]:
+                    curs.execute(DELETE_TODOLIST_QUERY, params)
+                    deleted_list = curs.rowcount
+        if deleted_list:
+            todolists_changed(user_id)
+            return True
+        if not deleted_tasks:
+            return False
+        bump_user_version(user_id)